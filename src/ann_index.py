@@ -0,0 +1,201 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+
+def _sq_distances(a, b, b_sq_norms=None):
+    """Squared L2 distances between the rows of a and b."""
+    if b_sq_norms is None:
+        b_sq_norms = np.einsum("ij,ij->i", b, b)
+    a_sq_norms = np.einsum("ij,ij->i", a, a)
+    sq_dist = a_sq_norms[:, None] - 2.0 * (a @ b.T) + b_sq_norms[None, :]
+    np.maximum(sq_dist, 0.0, out=sq_dist)
+    return sq_dist
+
+
+def _assign(data, centroids, chunk_size=4096):
+    """Index of the closest centroid for every row of data, computed in chunks."""
+    centroid_sq_norms = np.einsum("ij,ij->i", centroids, centroids)
+    labels = np.empty(len(data), dtype=np.int64)
+    for start in range(0, len(data), chunk_size):
+        chunk = data[start:start + chunk_size]
+        labels[start:start + chunk_size] = np.argmin(_sq_distances(chunk, centroids, centroid_sq_norms), axis=1)
+    return labels
+
+
+def kmeans(data, k, n_iter=20, seed=0):
+    """Plain Lloyd's k-means. Returns (centroids, labels)."""
+    data = np.asarray(data, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    k = max(1, min(k, len(data)))
+    centroids = data[rng.choice(len(data), size=k, replace=False)].copy()
+    labels = np.zeros(len(data), dtype=np.int64)
+    for _ in range(n_iter):
+        labels = _assign(data, centroids)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, data)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        # Re-seed empty clusters from random points so every list stays usable
+        if empty.any():
+            centroids[empty] = data[rng.choice(len(data), size=int(empty.sum()), replace=False)]
+    return centroids, labels
+
+
+def index_path_for(gallery_path):
+    """Where the ANN index for a given gallery file is stored."""
+    return os.path.splitext(gallery_path)[0] + ".ivf.npz"
+
+
+class IVFIndex:
+    """Inverted-file (IVF) index over gallery embeddings, L2 metric.
+
+    Gallery vectors are clustered with k-means into n_lists coarse cells.
+    A query only scans the n_probe cells whose centroids are closest to it,
+    so the cost grows with the cell size rather than the full gallery.
+
+    The index only stores the gallery row numbers of each cell; candidate
+    rows are gathered from the gallery matrix itself (memory-mapped by the
+    matcher), so the embeddings are never held twice.
+    """
+
+    metric = "euclidean"
+
+    def __init__(self, names, embeddings, centroids, list_offsets, rows, n_probe=8, sq_norms=None):
+        # rows holds gallery row numbers sorted by cell; rows[list_offsets[i]:list_offsets[i+1]] is cell i
+        self.names = np.asarray(names, dtype=object)
+        self.embeddings = np.asarray(embeddings, dtype=np.float32)
+        self.sq_norms = np.einsum("ij,ij->i", self.embeddings, self.embeddings) if sq_norms is None else sq_norms
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.list_offsets = np.asarray(list_offsets, dtype=np.int64)
+        self.rows = np.asarray(rows, dtype=np.int64)
+        self.n_probe = n_probe
+
+    @classmethod
+    def build(cls, names, embeddings, n_lists=None, n_probe=8, seed=0):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if n_lists is None:
+            n_lists = int(round(4 * np.sqrt(len(embeddings))))
+        centroids, labels = kmeans(embeddings, n_lists, seed=seed)
+        rows = np.argsort(labels, kind="stable")
+        counts = np.bincount(labels, minlength=len(centroids))
+        list_offsets = np.concatenate([[0], np.cumsum(counts)])
+        return cls(names, embeddings, centroids, list_offsets, rows, n_probe)
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    def __len__(self):
+        return len(self.names)
+
+    def save(self, path):
+        np.savez(path, names=self.names.astype(str), rows=self.rows, centroids=self.centroids,
+                 list_offsets=self.list_offsets, n_probe=np.int64(self.n_probe))
+
+    @classmethod
+    def load(cls, path, embeddings, sq_norms=None):
+        """Load the index at path over embeddings, the gallery matrix it was built from."""
+        data = np.load(path, allow_pickle=False)
+        if "rows" not in data.files:
+            raise ValueError(f"{path} uses an old format that copies the gallery (run build_database.py)")
+        return cls(data["names"].astype(object), embeddings, data["centroids"], data["list_offsets"],
+                   data["rows"], int(data["n_probe"]), sq_norms)
+
+    def search(self, probes, k=1, n_probe=None):
+        """Return (names, distances) of the approximate k nearest entries per probe.
+
+        Same shapes as GalleryMatcher.search; rows are padded with "Unknown"/inf
+        if the probed cells hold fewer than k entries.
+        """
+        probes = np.atleast_2d(np.asarray(probes, dtype=np.float32))
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        k = min(k, len(self))
+        out_names = np.full((len(probes), k), "Unknown", dtype=object)
+        out_dist = np.full((len(probes), k), np.inf, dtype=np.float32)
+        if k == 0:
+            return out_names, out_dist
+
+        cell_dist = _sq_distances(probes, self.centroids)
+        if n_probe < self.n_lists:
+            cells = np.argpartition(cell_dist, n_probe - 1, axis=1)[:, :n_probe]
+        else:
+            cells = np.broadcast_to(np.arange(self.n_lists), cell_dist.shape)
+
+        starts, ends = self.list_offsets[:-1], self.list_offsets[1:]
+        for i, probe in enumerate(probes):
+            candidates = np.concatenate([self.rows[starts[c]:ends[c]] for c in cells[i]])
+            if len(candidates) == 0:
+                continue
+            sq_dist = _sq_distances(probe[None, :], self.embeddings[candidates], self.sq_norms[candidates])[0]
+            top_k = min(k, len(candidates))
+            top = np.argpartition(sq_dist, top_k - 1)[:top_k] if top_k < len(candidates) else np.arange(len(candidates))
+            top = top[np.argsort(sq_dist[top])]
+            out_names[i, :top_k] = self.names[candidates[top]]
+            out_dist[i, :top_k] = np.sqrt(sq_dist[top])
+        return out_names, out_dist
+
+
+def evaluate(index, matcher, probes, k=1, n_probe=None):
+    """Compare the ANN index with exact search on the same probes.
+
+    Both searches return identities, the way recognition uses them (the
+    index through matcher._index_search). Returns a dict with recall@k
+    (fraction of exact top-k identities found by the index) and mean
+    per-query latency of both searches in milliseconds.
+    """
+    probes = np.atleast_2d(np.asarray(probes, dtype=np.float32))
+    if n_probe:
+        index.n_probe = n_probe
+    matcher.index = index
+
+    start = time.perf_counter()
+    exact_names, _ = matcher.search(probes, k=k, exact=True)
+    exact_ms = (time.perf_counter() - start) * 1000 / len(probes)
+
+    start = time.perf_counter()
+    ann_names, _ = matcher._index_search(probes, k)
+    ann_ms = (time.perf_counter() - start) * 1000 / len(probes)
+
+    hits = sum(len(set(e) & set(a)) for e, a in zip(exact_names, ann_names))
+    return {
+        "recall": hits / exact_names.size if exact_names.size else 1.0,
+        "exact_ms_per_query": exact_ms,
+        "ann_ms_per_query": ann_ms,
+        "n_lists": index.n_lists,
+        "n_probe": min(index.n_probe, index.n_lists),
+    }
+
+
+def main():
+    from matcher import GalleryMatcher
+
+    parser = argparse.ArgumentParser(description="Report ANN index recall and latency against exact search.")
+    parser.add_argument("--gallery", default="../known_faces.npy")
+    parser.add_argument("--k", type=int, default=1)
+    parser.add_argument("--n-probe", type=int, default=None)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--noise", type=float, default=0.3, help="Std of noise added to gallery vectors to make queries")
+    args = parser.parse_args()
+
+    matcher = GalleryMatcher.load(args.gallery, use_ann=True)
+    index = matcher.index
+    if index is None:
+        print("⚠️ Building an index in memory")
+        index = IVFIndex.build(matcher.names, matcher.embeddings)
+
+    rng = np.random.default_rng(0)
+    picks = rng.integers(0, len(matcher), size=args.queries)
+    probes = matcher.embeddings[picks] + rng.normal(0, args.noise, size=(args.queries, matcher.embeddings.shape[1]))
+
+    report = evaluate(index, matcher, probes, k=args.k, n_probe=args.n_probe)
+    print(f"Gallery size: {len(matcher)}, lists: {report['n_lists']}, probed: {report['n_probe']}")
+    print(f"Recall@{args.k}: {report['recall']:.4f}")
+    print(f"Exact: {report['exact_ms_per_query']:.3f} ms/query, ANN: {report['ann_ms_per_query']:.3f} ms/query")
+
+
+if __name__ == "__main__":
+    main()
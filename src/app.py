@@ -1,112 +1,175 @@
-from flask import Flask, Response, render_template_string, send_file, request
+from flask import Flask, Response, render_template_string, request
 import cv2
-import numpy as np
-import pandas as pd
-from deepface import DeepFace
-import csv
-from datetime import datetime, time
+from datetime import datetime
+import itertools
 import os
-from collections import defaultdict
-import io
+from matcher import GalleryMatcher
+from pipeline import RecognitionServer
+from recognition import FrameRecognizer, embed_faces
+from tracker import FaceTracker
+from cascade import DetectorCascade
+from quality import QualityGate
+from embedding_cache import EmbeddingCache
+from models import ModelManager, timed
+from attendance_store import open_store
+from events import EventBus
+from reports import csv_chunks, parquet_chunks
+from metrics import MetricsRegistry
+from slots import SLOT_1, LATE_SOUND_CUTOFF, get_lecture_slot, is_late_alert, is_on_time
 
 app = Flask(__name__)
 
 # Paths
-known_faces_path = "../known_faces.pkl"
-attendance_file = "../attendance.csv"
+known_faces_path = "../known_faces.npy"
+attendance_db = "../attendance.db"
+attendance_file = "../attendance.csv"  # Legacy log, imported into the store once
+
+# Use the approximate index built by build_database.py (False = exact matching)
+USE_ANN = False
+
+# Match on "sq8" or "pq" gallery codes written by quantize.py --save, re-ranked in full precision (None = float)
+QUANTIZED_GALLERY = None
+
+# Follow faces between detections instead of re-embedding every frame
+USE_TRACKING = True
+
+# Gate MTCNN behind motion detection and a Haar cascade on a downscaled frame
+USE_CASCADE = True
+
+# Skip embedding blurry, tiny, badly lit or side-on faces (tracks keep their best crop)
+USE_QUALITY_GATE = True
+
+# Reuse the embedding of a near-identical crop instead of running Facenet again
+USE_EMBEDDING_CACHE = True
+
+# Match threshold used until the gallery is calibrated (python calibrate.py)
+DEFAULT_MATCH_THRESHOLD = 2.5
+
+# Cameras served by this process: device indexes, video files or stream URLs
+CAMERA_SOURCES = os.environ.get("CAMERA_SOURCES", "0").split(",")
+
+# Inference threads shared by all cameras; each batches faces from several cameras
+INFERENCE_WORKERS = 2
+
+# Print a one-line per-stage timing summary every N seconds (0 = off; /metrics is always on)
+METRICS_LOG_INTERVAL = 0
+
+# Load Facenet and MTCNN in the background so the dashboard is up immediately
+startup_phases = {}
+models = ModelManager().start()
 
 # Load the known faces database
-df = pd.read_pickle(known_faces_path)
-known_embeddings = df["Embedding"].tolist()
-known_names = df["Name"].tolist()
-
-# Lecture slots
-SLOT_1_START = time(8, 0)
-SLOT_1_END = time(11, 0)
-SLOT_1_LATE = time(8, 5)
-SLOT_2_START = time(11, 30)
-SLOT_2_END = time(14, 30)
-SLOT_2_LATE = time(11, 35)
-LATE_SOUND_CUTOFF = time(9, 30)
-
-# Track logs per slot per student
-logged_today = defaultdict(lambda: defaultdict(set))
-
-# Store the latest detected name for marking
-latest_name = "Unknown"
-
-# Initialize webcam
-cap = cv2.VideoCapture(0)
-if not cap.isOpened():
-    print("Error: Could not open webcam.")
-    exit()
-
-def get_lecture_slot(current_time):
-    current_t = current_time.time()
-    if SLOT_1_START <= current_t <= SLOT_1_END:
-        return "Slot 1 (8:00-11:00)"
-    elif SLOT_2_START <= current_t <= SLOT_2_END:
-        return "Slot 2 (11:30-14:30)"
-    return None
-
-def is_on_time(current_time, slot):
-    current_t = current_time.time()
-    if slot == "Slot 1 (8:00-11:00)":
-        return current_t <= SLOT_1_LATE
-    elif slot == "Slot 2 (11:30-14:30)":
-        return current_t <= SLOT_2_LATE
-    return False
-
-def gen_frames():
-    global latest_name
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            print("Error: Could not read frame.")
-            frame = np.zeros((480, 640, 3), dtype=np.uint8)
-            cv2.putText(frame, "Webcam Error", (200, 240), 
-                        cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+with timed(startup_phases, "gallery"):
+    matcher = GalleryMatcher.load(known_faces_path, use_ann=USE_ANN, quantized=QUANTIZED_GALLERY)
+MATCH_THRESHOLD = matcher.threshold(DEFAULT_MATCH_THRESHOLD)
+print(f"Match threshold: {MATCH_THRESHOLD:.4f}")
 
-        try:
-            frame = cv2.resize(frame, (640, 480))
-            result = DeepFace.represent(frame, model_name="Facenet", enforce_detection=True, detector_backend="mtcnn")
-            embedding = result[0]["embedding"]
-            face_coords = result[0]["facial_area"]
-
-            distances = [np.linalg.norm(embedding - known_emb) for known_emb in known_embeddings]
-            min_distance_idx = np.argmin(distances)
-            min_distance = distances[min_distance_idx]
-            threshold = 2.5
-            name = known_names[min_distance_idx] if min_distance < threshold else "Unknown"
-            latest_name = name  # Update the latest detected name
-
-            x, y, w, h = face_coords["x"], face_coords["y"], face_coords["w"], face_coords["h"]
-            color = (0, 255, 0) if name != "Unknown" else (0, 0, 255)
-            cv2.rectangle(frame, (x, y), (x + w, y + h), color, 2)
-            cv2.putText(frame, f"{name} ({min_distance:.2f})", (x, y - 10), 
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
-
-            slot = get_lecture_slot(datetime.now())
-            slot_display = slot if slot else "Outside lecture hours"
-            cv2.putText(frame, f"Slot: {slot_display}", (10, 30), 
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
-
-        except Exception as e:
-            print(f"Detection failed: {str(e)}")
-            cv2.putText(frame, "No face detected", (200, 240), 
+# Detector cascades and trackers hold per-stream state, so each camera gets its own
+cascades = {}
+quality_gates = {}
+
+def make_recognizer(camera_id):
+    cascade = DetectorCascade() if USE_CASCADE else None
+    if cascade is not None:
+        cascades[camera_id] = cascade
+    detector = cascade.detect if cascade else None
+    gate = QualityGate() if USE_QUALITY_GATE else None
+    if gate is not None:
+        quality_gates[camera_id] = gate
+    if USE_TRACKING:
+        return FaceTracker(matcher, MATCH_THRESHOLD, detector=detector, quality=gate)
+    return FrameRecognizer(matcher, MATCH_THRESHOLD, detector=detector, quality=gate)
+
+# Attendance log with today's rows and the last event cached in memory
+store = open_store(attendance_db, attendance_file)
+last_late_alert_id = None
+
+# Store the latest detected name of each camera for marking
+latest_names = {camera_id: "Unknown" for camera_id in range(len(CAMERA_SOURCES))}
+
+# Pushes name changes, attendance marks and late alerts to open dashboards
+events = EventBus()
+for camera_id, name in latest_names.items():
+    events.publish("name", {"camera": camera_id, "name": name}, initial=True, key=f"name{camera_id}")
+
+def on_result(camera, faces):
+    """Track each camera's closest recognized face; runs on an inference worker."""
+    # The closest recognized face is the one "Mark Attendance" will record
+    known = [face for face in faces if face["name"] != "Unknown"]
+    name = min(known, key=lambda face: face["distance"])["name"] if known else "Unknown"
+    if name != latest_names[camera.id]:
+        latest_names[camera.id] = name
+        events.publish("name", {"camera": camera.id, "name": name}, initial=True, key=f"name{camera.id}")
+
+def draw_annotations(frame, faces):
+    """Overlay the latest recognition results on a streamed frame."""
+    if faces is None:
+        if models.error:
+            # Loading never finishes after a failure, so say why instead of "Loading models..."
+            cv2.putText(frame, "Model loading failed:", (10, 240), 
                         cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-            latest_name = "Unknown"
+            cv2.putText(frame, models.error[:70], (10, 275), 
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
+        elif not models.ready:
+            cv2.putText(frame, "Loading models...", (200, 240), 
+                        cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+        return
+    if not faces:
+        cv2.putText(frame, "No face detected", (200, 240), 
+                    cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+        return
+
+    for face in faces:
+        x, y, w, h = face["box"]
+        name = face["name"]
+        color = (0, 255, 0) if name != "Unknown" else (0, 0, 255)
+        cv2.rectangle(frame, (x, y), (x + w, y + h), color, 2)
+        cv2.putText(frame, f"{name} ({face['distance']:.2f})", (x, y - 10), 
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
+
+    slot = get_lecture_slot(datetime.now())
+    slot_display = slot if slot else "Outside lecture hours"
+    cv2.putText(frame, f"Slot: {slot_display}", (10, 30), 
+                cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
 
-        ret, buffer = cv2.imencode(".jpg", frame)
-        if ret:
-            frame = buffer.tobytes()
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+# Every camera has its own capture and encoding threads; a shared pool of
+# inference workers batches faces across cameras. Viewers of a camera get the
+# same already-encoded frames, and slow viewers drop frames
+# One cache for all cameras and inference workers
+embed = EmbeddingCache() if USE_EMBEDDING_CACHE else embed_faces
+with timed(startup_phases, "cameras"):
+    server = RecognitionServer(CAMERA_SOURCES, make_recognizer, draw_annotations, embed,
+                               workers=INFERENCE_WORKERS, ready=lambda: models.ready, on_result=on_result)
+for camera in server.cameras:
+    if not camera.opened:
+        print(f"Error: Could not open camera {camera.source}.")
+        exit()
+with timed(startup_phases, "pipeline"):
+    server.start()
+metrics = MetricsRegistry()
+server.register(metrics)
+if USE_EMBEDDING_CACHE:
+    metrics.add_values(embed.metrics)
+if METRICS_LOG_INTERVAL:
+    metrics.start_logging(METRICS_LOG_INTERVAL)
+print(f"Startup: {startup_phases} (models loading in background)")
+
+def gen_frames(camera_id=0):
+    yield from server.camera(camera_id).mjpeg_stream()
+
+def camera_param():
+    """The camera a request refers to (?camera=N, default 0), or None if unknown."""
+    camera_id = request.args.get("camera", 0, type=int)
+    return camera_id if camera_id in latest_names else None
 
 @app.route('/')
 def index():
-    log = open(attendance_file, "r").read() if os.path.exists(attendance_file) else "No logs yet."
-    late_count = sum(1 for line in log.splitlines() if "Late" in line and "Slot 1" in line and "9:30" <= line.split(",")[1].split()[1][:5] <= "11:00")
+    camera_id = camera_param() or 0
+    page = request.args.get("page", 1, type=int)
+    per_page = 50
+    rows = store.page(page, per_page)
+    has_older = page * per_page < store.count()
+    late_count = store.alert_count()
 
     return render_template_string("""
     <!DOCTYPE html>
@@ -208,6 +271,10 @@ def index():
                 background: #7f8c8d;
                 cursor: not-allowed;
             }
+            .pager a {
+                color: #1abc9c;
+                margin-right: 20px;
+            }
             .summary {
                 font-size: 17px;
                 margin-top: 20px;
@@ -241,7 +308,12 @@ def index():
         <div class="container">
             <div class="video-container">
             
-                <img src="{{ url_for('video_feed') }}" class="video-feed" alt="Live Video Feed">
+                <img src="{{ url_for('video_feed', camera_id=camera_id) }}" class="video-feed" alt="Live Video Feed">
+                {% if camera_count > 1 %}
+                    <p class="pager">
+                        {% for i in range(camera_count) %}<a href="?camera={{ i }}">Camera {{ i }}</a>{% endfor %}
+                    </p>
+                {% endif %}
                 <button id="mark-attendance" onclick="markAttendance()"> Mark Attendance</button>
             </div>
             <div class="dashboard">
@@ -255,21 +327,24 @@ def index():
                             <th>Slot</th>
                         </tr>
                     </thead>
-                    <tbody>
-                        {% for line in log.splitlines()[1:] %}
-                            {% set parts = line.split(',') %}
-                            {% if parts|length >= 4 %}
+                    <tbody id="log-body">
+                        {% for row in rows %}
+                            {% if row.status and row.slot %}
                                 <tr>
-                                    <td>{{ parts[0] }}</td>
-                                    <td>{{ parts[1] }}</td>
-                                    <td class="{{ 'on-time' if parts[2] == 'On Time' else 'late' }}">{{ parts[2] }}</td>
-                                    <td>{{ parts[3] }}</td>
+                                    <td>{{ row.name }}</td>
+                                    <td>{{ row.timestamp }}</td>
+                                    <td class="{{ 'on-time' if row.status == 'On Time' else 'late' }}">{{ row.status }}</td>
+                                    <td>{{ row.slot }}</td>
                                 </tr>
                             {% endif %}
                         {% endfor %}
                     </tbody>
                 </table>
-                <p class="summary">👥 Total Latecomers after 9:30 AM: <strong>{{ late_count }}</strong></p>
+                <p class="pager">
+                    {% if page > 1 %}<a href="?camera={{ camera_id }}&page={{ page - 1 }}">← Newer</a>{% endif %}
+                    {% if has_older %}<a href="?camera={{ camera_id }}&page={{ page + 1 }}">Older →</a>{% endif %}
+                </p>
+                <p class="summary">👥 Total Latecomers after 9:30 AM: <strong id="late-count">{{ late_count }}</strong></p>
                 <button onclick="window.location.href='/download'">⬇ Download attendance</button>
             </div>
         </div>
@@ -285,86 +360,154 @@ def index():
                 setTimeout(() => { alert.style.display = 'none'; }, 3000);
             }
 
+            function addLogRow(row) {
+                const tr = document.createElement('tr');
+                [row.name, row.timestamp, row.status, row.slot].forEach((value, i) => {
+                    const td = document.createElement('td');
+                    td.textContent = value;
+                    if (i === 2) td.className = value === 'On Time' ? 'on-time' : 'late';
+                    tr.appendChild(td);
+                });
+                const body = document.getElementById('log-body');
+                body.insertBefore(tr, body.firstChild);
+            }
+
             function markAttendance() {
-                fetch('/mark_attendance', { method: 'POST' })
+                fetch('/mark_attendance?camera=' + cameraId, { method: 'POST' })
                     .then(response => response.json())
                     .then(data => {
-                        if (data.success) {
-                            location.reload();  // Refresh to update log
-                        } else {
+                        if (!data.success) {
                             alert(data.message);
                         }
                     });
             }
 
-            setInterval(() => {
-                fetch('/check_late')
-                    .then(response => response.json())
-                    .then(data => { if (data.late) playLateSound(); });
-            }, 1000);
-
-            setInterval(() => {
-                fetch('/get_latest_name')
-                    .then(response => response.json())
-                    .then(data => {
-                        const button = document.getElementById('mark-attendance');
-                        button.disabled = (data.name === 'Unknown');
-                    });
-            }, 500);
+            // Server push instead of polling: rows are added as they are marked
+            const onFirstPage = {{ 'true' if page == 1 else 'false' }};
+            const cameraId = {{ camera_id }};
+            const events = new EventSource('/events');
+            events.addEventListener('name', (e) => {
+                const data = JSON.parse(e.data);
+                if (data.camera !== cameraId) return;
+                const button = document.getElementById('mark-attendance');
+                button.disabled = (data.name === 'Unknown');
+            });
+            events.addEventListener('attendance', (e) => {
+                if (onFirstPage) addLogRow(JSON.parse(e.data));
+            });
+            events.addEventListener('late', () => {
+                const count = document.getElementById('late-count');
+                count.textContent = parseInt(count.textContent) + 1;
+                playLateSound();
+            });
         </script>
     </body>
     </html>
-    """, log=log, late_count=late_count)
+    """, rows=rows, page=page, has_older=has_older, late_count=late_count,
+       camera_id=camera_id, camera_count=len(CAMERA_SOURCES))
 
 @app.route('/video_feed')
-def video_feed():
-    return Response(gen_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+@app.route('/video_feed/<int:camera_id>')
+def video_feed(camera_id=0):
+    if camera_id not in latest_names:
+        return "Unknown camera", 404
+    return Response(gen_frames(camera_id), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+@app.route('/events')
+def event_stream():
+    return Response(events.stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route('/ready')
+def ready():
+    status = models.status()
+    status["startup"] = startup_phases
+    return status, 200 if status["ready"] else 503
+
+@app.route('/pipeline_stats')
+def pipeline_stats():
+    stats = server.stats()
+    for camera_id, cascade in cascades.items():
+        stats["cameras"][camera_id]["cascade"] = cascade.stats
+    for camera_id, gate in quality_gates.items():
+        stats["cameras"][camera_id]["quality"] = gate.snapshot()
+    if USE_EMBEDDING_CACHE:
+        stats["embedding_cache"] = embed.snapshot()
+    return stats
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 @app.route('/check_late')
 def check_late():
+    global last_late_alert_id
     current_time = datetime.now()
     slot = get_lecture_slot(current_time)
-    if slot == "Slot 1 (8:00-11:00)" and current_time.time() >= LATE_SOUND_CUTOFF:
-        with open(attendance_file, "r") as f:
-            last_line = f.readlines()[-1].strip()
-            if "Late" in last_line and last_line not in logged_today[current_time.strftime("%Y-%m-%d")].get("last_check", ""):
-                logged_today[current_time.strftime("%Y-%m-%d")]["last_check"] = last_line
-                return {"late": True}
+    if slot == SLOT_1 and current_time.time() >= LATE_SOUND_CUTOFF:
+        last = store.last_event()
+        if last and last["status"] == "Late" and last["id"] != last_late_alert_id:
+            last_late_alert_id = last["id"]
+            return {"late": True}
     return {"late": False}
 
 @app.route('/mark_attendance', methods=['POST'])
 def mark_attendance():
-    global latest_name
+    return mark(camera_param())
+
+def mark(camera_id):
+    """Mark the latest recognized student of a camera. Shared with the async server (asgi.py)."""
+    if camera_id is None:
+        return {"success": False, "message": "Unknown camera."}
+    latest_name = latest_names[camera_id]
     if latest_name == "Unknown":
         return {"success": False, "message": "No student identified. Please ensure your face is recognized."}
     
     current_time = datetime.now()
-    current_date = current_time.strftime("%Y-%m-%d")
     slot = get_lecture_slot(current_time)
     
     if not slot:
         return {"success": False, "message": "Outside lecture hours. Attendance cannot be marked."}
     
-    if slot in logged_today[current_date][latest_name]:
-        return {"success": False, "message": f"Attendance already marked for {latest_name} in {slot}."}
-    
     status = "On Time" if is_on_time(current_time, slot) else "Late"
-    with open(attendance_file, "a", newline="") as f:
-        writer = csv.writer(f)
-        if os.path.getsize(attendance_file) == 0:
-            writer.writerow(["Name", "Timestamp", "Status", "Lecture Slot"])
-        writer.writerow([latest_name, current_time.strftime("%Y-%m-%d %H:%M:%S"), status, slot])
-    logged_today[current_date][latest_name].add(slot)
+    row = store.mark_once(latest_name, current_time, status, slot)
+    if row is None:
+        return {"success": False, "message": f"Attendance already marked for {latest_name} in {slot}."}
+    events.publish("attendance", row)
+    if is_late_alert(current_time, slot, status):
+        events.publish("late", row)
     return {"success": True, "message": "Attendance marked successfully!"}
 
 @app.route('/get_latest_name')
 def get_latest_name():
-    return {"name": latest_name}
+    camera_id = camera_param()
+    if camera_id is None:
+        return {"name": "Unknown"}
+    return {"name": latest_names[camera_id]}
 
 @app.route('/download')
 def download_csv():
-    with open(attendance_file, "rb") as f:
-        return send_file(io.BytesIO(f.read()), mimetype="text/csv", as_attachment=True, download_name="attendance.csv")
+    """Stream the log as CSV or Parquet (?format=), optionally filtered by ?start=, ?end= and ?name=."""
+    filters = {"start": request.args.get("start"), "end": request.args.get("end"),
+               "names": request.args.getlist("name") or None}
+    if request.args.get("format") == "parquet":
+        try:
+            chunks = parquet_chunks(store, **filters)
+            first = next(chunks)
+        except ImportError:
+            return {"success": False, "message": "Parquet export needs pyarrow (pip install pyarrow)."}, 501
+        return Response(itertools.chain([first], chunks), mimetype="application/vnd.apache.parquet",
+                        headers={"Content-Disposition": "attachment; filename=attendance.parquet"})
+    return Response(csv_chunks(store, **filters), mimetype="text/csv",
+                    headers={"Content-Disposition": "attachment; filename=attendance.csv"})
+
+@app.route('/reports/students')
+def student_report():
+    return {"students": store.student_stats(request.args.get("slot"), request.args.get("name"))}
+
+@app.route('/reports/days')
+def day_report():
+    return {"days": store.day_stats(request.args.get("start"), request.args.get("end"), request.args.get("slot"))}
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,201 @@
+import argparse
+import asyncio
+import io
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+import app as dashboard
+
+# Threads for the Flask routes (page, exports, reports, stats) served through _wsgi
+BLOCKING_WORKERS = 16
+
+_blocking = ThreadPoolExecutor(BLOCKING_WORKERS, thread_name_prefix="asgi-blocking")
+# Attendance writes go through one thread, so they queue up instead of piling onto SQLite
+_writes = ThreadPoolExecutor(1, thread_name_prefix="asgi-writes")
+
+
+def _query(scope):
+    return {k: v[0] for k, v in parse_qs(scope["query_string"].decode("latin-1")).items()}
+
+
+def _camera_id(value):
+    """The camera id in value, or None if it is not a known camera."""
+    try:
+        camera_id = int(value)
+    except (TypeError, ValueError):
+        return None
+    return camera_id if camera_id in dashboard.latest_names else None
+
+
+async def _read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    return body
+
+
+async def _respond(send, body, status=200, content_type="application/json"):
+    if not isinstance(body, (bytes, str)):
+        body = json.dumps(body)
+    if isinstance(body, str):
+        body = body.encode()
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", content_type.encode()), (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _stream(receive, send, chunks, content_type, headers=()):
+    """Send an endless async generator until the client goes away.
+
+    The generator is cancelled as soon as the client disconnects, even
+    while it is waiting for the next frame or event.
+    """
+    await send({"type": "http.response.start", "status": 200,
+                "headers": [(b"content-type", content_type.encode())] + list(headers)})
+
+    async def pump():
+        async for chunk in chunks:
+            await send({"type": "http.response.body", "body": chunk.encode() if isinstance(chunk, str) else chunk,
+                        "more_body": True})
+
+    tasks = [asyncio.ensure_future(pump()), asyncio.ensure_future(_wait_for_disconnect(receive))]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _wsgi(scope, receive, send):
+    """Serve a request with the Flask app on a worker thread, streaming its response."""
+    body = await _read_body(receive)
+    host, port = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": host,
+        "SERVER_PORT": str(port),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"] = scope["client"][0]
+    for name, value in scope["headers"]:
+        key, value = name.decode("latin-1").upper().replace("-", "_"), value.decode("latin-1")
+        if key == "CONTENT_TYPE":
+            environ[key] = value
+        elif key != "CONTENT_LENGTH":
+            key = "HTTP_" + key
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response["status"] = int(status.split(" ", 1)[0])
+        response["headers"] = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+
+    loop = asyncio.get_running_loop()
+    result = await loop.run_in_executor(_blocking, dashboard.app.wsgi_app, environ, start_response)
+    chunks = iter(result)
+    try:
+        # Exports are generators over the database, so every chunk is produced off the event loop
+        chunk = await loop.run_in_executor(_blocking, next, chunks, None)
+        await send({"type": "http.response.start", "status": response["status"], "headers": response["headers"]})
+        while chunk is not None:
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            chunk = await loop.run_in_executor(_blocking, next, chunks, None)
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        if hasattr(result, "close"):
+            await loop.run_in_executor(_blocking, result.close)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await asyncio.get_running_loop().run_in_executor(None, dashboard.server.stop)
+            _blocking.shutdown(wait=False)
+            _writes.shutdown(wait=False)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    """ASGI entry point for the dashboard.
+
+    Video feeds, server-sent events, marking and the latest name are served
+    on the event loop: a viewer or event client is a coroutine, not a
+    thread, and frames are fanned out once per loop. Capture, inference and
+    JPEG encoding stay on the pipeline's own threads. Attendance writes and
+    every other (Flask) route run on thread pools, so slow database work
+    never stalls the streams.
+    """
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+    path, method = scope["path"], scope["method"]
+
+    if path == "/video_feed" or path.startswith("/video_feed/"):
+        camera_id = _camera_id(path.rpartition("/")[2] if path != "/video_feed" else 0)
+        if camera_id is None:
+            return await _respond(send, "Unknown camera", 404, "text/plain")
+        camera = dashboard.server.camera(camera_id)
+        return await _stream(receive, send, camera.broadcaster.astream(),
+                             "multipart/x-mixed-replace; boundary=frame")
+    if path == "/events":
+        return await _stream(receive, send, dashboard.events.astream(), "text/event-stream",
+                             [(b"cache-control", b"no-cache"), (b"x-accel-buffering", b"no")])
+    if path == "/mark_attendance" and method == "POST":
+        await _read_body(receive)
+        camera_id = _camera_id(_query(scope).get("camera", 0))
+        result = await asyncio.get_running_loop().run_in_executor(_writes, dashboard.mark, camera_id)
+        return await _respond(send, result)
+    if path == "/get_latest_name":
+        camera_id = _camera_id(_query(scope).get("camera", 0))
+        name = dashboard.latest_names[camera_id] if camera_id is not None else "Unknown"
+        return await _respond(send, {"name": name})
+    return await _wsgi(scope, receive, send)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the dashboard with an asyncio (ASGI) server.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args()
+    try:
+        import uvicorn
+    except ImportError:
+        print("The async server needs uvicorn (pip install uvicorn), or run any ASGI server on asgi:application.")
+        sys.exit(1)
+    # Streams never end on their own, so do not wait long for them on shutdown
+    uvicorn.run(application, host=args.host, port=args.port, log_level="warning", timeout_graceful_shutdown=2)
+
+
+if __name__ == "__main__":
+    main()
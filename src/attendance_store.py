@@ -0,0 +1,470 @@
+import argparse
+import csv
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from slots import SLOT_RULES
+
+COLUMNS = ("id", "name", "timestamp", "status", "slot")
+CSV_HEADER = ["Name", "Timestamp", "Status", "Lecture Slot"]
+
+# Pre-aggregated reporting tables, kept up to date by triggers on every insert
+# (from any process) so reports never scan the attendance log. A student
+# counts once per day and slot; a streak is consecutive lecture days of a slot
+# (days on which anyone attended it). Marks for the latest lecture day extend
+# streaks incrementally; a mark for an earlier day (a backfilled video, an
+# import) recomputes the slot's affected streaks from the log.
+REPORT_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS slot_rules (
+        slot TEXT PRIMARY KEY,
+        late_after TEXT NOT NULL,
+        alert_after TEXT
+    );
+    CREATE TABLE IF NOT EXISTS day_stats (
+        slot TEXT NOT NULL,
+        day TEXT NOT NULL,
+        present INTEGER NOT NULL,
+        late INTEGER NOT NULL,
+        alerts INTEGER NOT NULL,
+        PRIMARY KEY (slot, day)
+    );
+    CREATE TABLE IF NOT EXISTS student_stats (
+        name TEXT NOT NULL,
+        slot TEXT NOT NULL,
+        present INTEGER NOT NULL,
+        late INTEGER NOT NULL,
+        late_minutes REAL NOT NULL,
+        first_day TEXT NOT NULL,
+        last_day TEXT NOT NULL,
+        streak INTEGER NOT NULL,
+        best_streak INTEGER NOT NULL,
+        PRIMARY KEY (name, slot)
+    );
+    -- The rows the reports count: the first one of each name, slot and day
+    CREATE VIEW IF NOT EXISTS counted_marks AS
+    SELECT a.*, CASE WHEN a.status = 'Late' THEN max(0, (julianday(a.timestamp) - julianday(a.day || ' ' ||
+               coalesce((SELECT late_after FROM slot_rules WHERE slot = a.slot), '00:00'))) * 1440) ELSE 0 END
+               AS late_minutes
+    FROM attendance a
+    WHERE a.slot IS NOT NULL AND a.status IS NOT NULL AND NOT EXISTS (
+        SELECT 1 FROM attendance b WHERE b.day = a.day AND b.name = a.name AND b.slot = a.slot AND b.id < a.id);
+    -- Latest and longest run of consecutive lecture days per student and slot
+    CREATE VIEW IF NOT EXISTS student_streaks AS
+    SELECT name, slot, length AS streak, best_streak FROM (
+        SELECT name, slot, length, max(length) OVER (PARTITION BY name, slot) AS best_streak,
+               row_number() OVER (PARTITION BY name, slot ORDER BY last_day DESC) AS latest
+        FROM (
+            SELECT name, slot, count(*) AS length, max(day) AS last_day FROM (
+                SELECT m.name, m.slot, m.day,
+                       d.n - row_number() OVER (PARTITION BY m.name, m.slot ORDER BY m.day) AS run
+                FROM counted_marks m JOIN (
+                    SELECT slot, day, row_number() OVER (PARTITION BY slot ORDER BY day) AS n FROM day_stats
+                ) d ON d.slot = m.slot AND d.day = m.day)
+            GROUP BY name, slot, run))
+    WHERE latest = 1;
+"""
+
+# Created apart from REPORT_SCHEMA so that opening a store never drops it:
+# an insert from another process in between would skip the reports
+REPORT_TRIGGER = """CREATE TRIGGER attendance_report AFTER INSERT ON attendance
+    WHEN NEW.slot IS NOT NULL AND NEW.status IS NOT NULL AND NOT EXISTS (
+        SELECT 1 FROM attendance WHERE day = NEW.day AND name = NEW.name AND slot = NEW.slot AND id <> NEW.id)
+    BEGIN
+        INSERT INTO day_stats (slot, day, present, late, alerts)
+        VALUES (NEW.slot, NEW.day, 1, NEW.status = 'Late',
+                NEW.status = 'Late' AND substr(NEW.timestamp, 12, 5) >=
+                    coalesce((SELECT alert_after FROM slot_rules WHERE slot = NEW.slot), '99:99'))
+        ON CONFLICT (slot, day) DO UPDATE SET
+            present = present + 1, late = late + excluded.late, alerts = alerts + excluded.alerts;
+        INSERT INTO student_stats (name, slot, present, late, late_minutes, first_day, last_day, streak, best_streak)
+        VALUES (NEW.name, NEW.slot, 1, NEW.status = 'Late',
+                CASE WHEN NEW.status = 'Late' THEN max(0, (julianday(NEW.timestamp) - julianday(NEW.day || ' ' ||
+                    coalesce((SELECT late_after FROM slot_rules WHERE slot = NEW.slot), '00:00'))) * 1440) ELSE 0 END,
+                NEW.day, NEW.day, 1, 1)
+        ON CONFLICT (name, slot) DO UPDATE SET
+            present = present + 1,
+            late = late + excluded.late,
+            late_minutes = late_minutes + excluded.late_minutes,
+            first_day = min(first_day, excluded.first_day),
+            last_day = max(last_day, excluded.last_day),
+            streak = CASE
+                WHEN last_day = (SELECT max(day) FROM day_stats WHERE slot = NEW.slot AND day < NEW.day) THEN streak + 1
+                ELSE 1 END,
+            best_streak = max(best_streak, CASE
+                WHEN last_day = (SELECT max(day) FROM day_stats WHERE slot = NEW.slot AND day < NEW.day) THEN streak + 1
+                ELSE 1 END);
+        -- Backfill (not the slot's latest lecture day): recompute this student's streaks, or
+        -- everyone's in the slot if the mark created a lecture day they missed. The guards
+        -- have no column references, so for ordinary marks the scans stop before reading a row.
+        {student}
+        {everyone}
+    END"""
+
+# Recomputes the streaks of the marks matching `where` (NEW.name or the whole slot) in NEW.slot;
+# CROSS JOIN makes SQLite read one student's marks through the name index instead of every lecture day
+_BACKFILL_STREAKS = """UPDATE student_stats SET streak = s.streak, best_streak = s.best_streak
+        FROM (
+            SELECT name, length AS streak, best_streak FROM (
+                SELECT name, length, max(length) OVER (PARTITION BY name) AS best_streak,
+                       row_number() OVER (PARTITION BY name ORDER BY last_day DESC) AS latest
+                FROM (
+                    SELECT name, count(*) AS length, max(day) AS last_day FROM (
+                        SELECT m.name, m.day, d.n - row_number() OVER (PARTITION BY m.name ORDER BY m.day) AS run
+                        FROM counted_marks m {join} (
+                            SELECT day, row_number() OVER (ORDER BY day) AS n FROM day_stats
+                            WHERE slot = NEW.slot AND {guard}
+                        ) d ON d.day = m.day
+                        WHERE m.slot = NEW.slot AND {where} AND {guard})
+                    GROUP BY name, run))
+            WHERE latest = 1) s
+        WHERE student_stats.slot = NEW.slot AND student_stats.name = s.name;"""
+_BACKFILL = "NEW.day < (SELECT max(day) FROM day_stats WHERE slot = NEW.slot)"
+_NEW_DAY = "(SELECT present FROM day_stats WHERE slot = NEW.slot AND day = NEW.day) = 1"
+REPORT_TRIGGER = REPORT_TRIGGER.format(
+    student=_BACKFILL_STREAKS.format(join="CROSS JOIN", where="m.name = NEW.name",
+                                     guard=f"{_BACKFILL} AND NOT {_NEW_DAY}"),
+    everyone=_BACKFILL_STREAKS.format(join="JOIN", where="1", guard=f"{_BACKFILL} AND {_NEW_DAY}"))
+
+
+class AttendanceStore:
+    """Append-only attendance log in SQLite (WAL mode).
+
+    Rows are never updated or deleted. The current day's rows and the last
+    event are kept in memory, so the dashboard's hot paths (today's log,
+    "was the last mark late?") never touch the disk; older history is read
+    with indexed, paginated queries.
+
+    One-mark-per-slot deduplication lives in the `marks` table, claimed in
+    the same transaction as the attendance row, so it survives restarts and
+    holds across processes sharing the database. Today's marks are cached
+    in memory and past days are evicted when the date changes.
+    """
+
+    def __init__(self, path="../attendance.db"):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS attendance (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                timestamp TEXT NOT NULL,
+                day TEXT NOT NULL,
+                status TEXT,
+                slot TEXT
+            );
+            CREATE UNIQUE INDEX IF NOT EXISTS attendance_name_time ON attendance(name, timestamp);
+            CREATE INDEX IF NOT EXISTS attendance_day ON attendance(day, id);
+            CREATE TABLE IF NOT EXISTS marks (
+                day TEXT NOT NULL,
+                name TEXT NOT NULL,
+                slot TEXT NOT NULL,
+                PRIMARY KEY (day, name, slot)
+            );
+        """)
+        self._conn.executescript(REPORT_SCHEMA)
+        self._conn.executemany("INSERT OR REPLACE INTO slot_rules (slot, late_after, alert_after) VALUES (?, ?, ?)",
+                               SLOT_RULES)
+        self._install_trigger()
+        self._lock = threading.Lock()
+        self._day = None
+        self._day_rows = []
+        self._last = None
+        self._marked_day = None
+        self._marked = set()
+        with self._lock:
+            self._load_day(datetime.now().strftime("%Y-%m-%d"))
+            self._load_marks(self._day)
+            self._last = self._fetch_one("SELECT {} FROM attendance ORDER BY id DESC LIMIT 1")
+
+    def _install_trigger(self):
+        """Create or upgrade the report trigger, rebuilding the reports it missed.
+
+        The check, the swap and the rebuild share one write transaction, so
+        no other process can insert while the trigger is missing.
+        """
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            current = conn.execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'attendance_report'").fetchone()
+            if current is None or current[0] != REPORT_TRIGGER:
+                # Databases created before the reporting tables existed, or by an older trigger
+                conn.execute("DROP TRIGGER IF EXISTS attendance_report")
+                conn.execute(REPORT_TRIGGER)
+                self._refill_reports()
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def rebuild_reports(self):
+        """Recompute the reporting tables from the log.
+
+        Each table is refilled by one aggregate query inside SQLite, so no
+        rows are loaded into Python and the log itself is never rewritten.
+        """
+        with self._lock:
+            self._rebuild_reports()
+
+    def _rebuild_reports(self):
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._refill_reports()
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _refill_reports(self):
+        conn = self._conn
+        conn.execute("DELETE FROM day_stats")
+        conn.execute("DELETE FROM student_stats")
+        conn.execute("""
+            INSERT INTO day_stats (slot, day, present, late, alerts)
+            SELECT m.slot, m.day, count(*), sum(m.status = 'Late'),
+                   sum(m.status = 'Late' AND substr(m.timestamp, 12, 5) >= coalesce(r.alert_after, '99:99'))
+            FROM counted_marks m LEFT JOIN slot_rules r ON r.slot = m.slot
+            GROUP BY m.slot, m.day""")
+        # student_streaks reads the lecture days from day_stats, so this goes second
+        conn.execute("""
+            INSERT INTO student_stats (name, slot, present, late, late_minutes, first_day, last_day,
+                                       streak, best_streak)
+            SELECT m.name, m.slot, count(*), sum(m.status = 'Late'), sum(m.late_minutes), min(m.day), max(m.day),
+                   s.streak, s.best_streak
+            FROM counted_marks m JOIN student_streaks s ON s.name = m.name AND s.slot = m.slot
+            GROUP BY m.name, m.slot""")
+
+    def _fetch_one(self, query, params=()):
+        row = self._conn.execute(query.format(", ".join(COLUMNS)), params).fetchone()
+        return dict(zip(COLUMNS, row)) if row else None
+
+    def _fetch_all(self, query, params=()):
+        rows = self._conn.execute(query.format(", ".join(COLUMNS)), params).fetchall()
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    def _load_day(self, day):
+        self._day = day
+        self._day_rows = self._fetch_all("SELECT {} FROM attendance WHERE day = ? ORDER BY id", (day,))
+
+    def _load_marks(self, day):
+        """Rebuild the in-memory dedup set for day and drop older days' marks."""
+        self._conn.execute("BEGIN IMMEDIATE")
+        self._conn.execute("DELETE FROM marks WHERE day < ?", (day,))
+        # Rows written before the marks table existed still count as marked
+        self._conn.execute("INSERT OR IGNORE INTO marks (day, name, slot) "
+                           "SELECT day, name, slot FROM attendance WHERE day = ? AND slot IS NOT NULL", (day,))
+        self._conn.execute("COMMIT")
+        self._marked_day = day
+        self._marked = set(self._conn.execute("SELECT name, slot FROM marks WHERE day = ?", (day,)).fetchall())
+
+    def _insert(self, name, ts, status, slot):
+        cursor = self._conn.execute(
+            "INSERT INTO attendance (name, timestamp, day, status, slot) VALUES (?, ?, ?, ?, ?)",
+            (name, ts, ts[:10], status, slot))
+        row = {"id": cursor.lastrowid, "name": name, "timestamp": ts, "status": status, "slot": slot}
+        if ts[:10] != self._day:
+            self._load_day(ts[:10])
+        else:
+            self._day_rows.append(row)
+        self._last = row
+        return row
+
+    def add(self, name, timestamp, status=None, slot=None):
+        """Append one attendance event and return it as a dict."""
+        with self._lock:
+            return self._insert(name, timestamp.strftime("%Y-%m-%d %H:%M:%S"), status, slot)
+
+    def _marked_in_log(self, day, name, slot):
+        return self._conn.execute("SELECT 1 FROM attendance WHERE day = ? AND name = ? AND slot = ?",
+                                  (day, name, slot)).fetchone() is not None
+
+    def mark_once(self, name, timestamp, status, slot):
+        """Record the first mark of name in slot for that day.
+
+        Returns the new row, or None if that person/slot/day was already
+        marked, by this process or any other one using the same database.
+        """
+        ts = timestamp.strftime("%Y-%m-%d %H:%M:%S")
+        day = ts[:10]
+        with self._lock:
+            if day > self._marked_day:
+                self._load_marks(day)
+            current = day == self._marked_day
+            if current and (name, slot) in self._marked:
+                return None
+            # BEGIN IMMEDIATE takes the write lock, so the check and the insert
+            # are atomic with respect to other processes
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if current:
+                    claimed = self._conn.execute("INSERT OR IGNORE INTO marks (day, name, slot) VALUES (?, ?, ?)",
+                                                 (day, name, slot)).rowcount > 0
+                else:
+                    claimed = not self._marked_in_log(day, name, slot)
+                row = self._insert(name, ts, status, slot) if claimed else None
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            if current:
+                self._marked.add((name, slot))
+            return row
+
+    def last_event(self):
+        """The most recent event, or None if the log is empty."""
+        return self._last
+
+    def day(self, day=None):
+        """All events of one day (default today), oldest first."""
+        day = day or datetime.now().strftime("%Y-%m-%d")
+        with self._lock:
+            if day == self._day:
+                return list(self._day_rows)
+            return self._fetch_all("SELECT {} FROM attendance WHERE day = ? ORDER BY id", (day,))
+
+    def page(self, page=1, per_page=50):
+        """One page of the full history, newest first."""
+        offset = (max(page, 1) - 1) * per_page
+        with self._lock:
+            return self._fetch_all("SELECT {} FROM attendance ORDER BY id DESC LIMIT ? OFFSET ?", (per_page, offset))
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM attendance").fetchone()[0]
+
+    def student_stats(self, slot=None, name=None):
+        """Per-student, per-slot aggregates from the precomputed tables.
+
+        rate is the share of the slot's lecture days (since the student's
+        first attendance) they attended; current_streak is 0 unless they
+        attended the slot's latest lecture day.
+        """
+        where, params = [], []
+        if slot:
+            where.append("s.slot = ?")
+            params.append(slot)
+        if name:
+            where.append("s.name = ?")
+            params.append(name)
+        query = f"""
+            SELECT s.name, s.slot, s.present, s.late, s.late_minutes, s.first_day, s.last_day, s.best_streak,
+                   CASE WHEN s.last_day = (SELECT max(day) FROM day_stats WHERE slot = s.slot)
+                        THEN s.streak ELSE 0 END,
+                   (SELECT count(*) FROM day_stats d WHERE d.slot = s.slot AND d.day >= s.first_day)
+            FROM student_stats s {'WHERE ' + ' AND '.join(where) if where else ''}
+            ORDER BY s.name, s.slot"""
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        stats = []
+        for name, slot, present, late, late_minutes, first_day, last_day, best, current, days in rows:
+            stats.append({
+                "name": name, "slot": slot, "present": present, "lecture_days": days,
+                "rate": round(present / days, 4) if days else 0.0,
+                "late": late, "late_rate": round(late / present, 4) if present else 0.0,
+                "avg_minutes_late": round(late_minutes / late, 1) if late else 0.0,
+                "current_streak": current, "best_streak": best,
+                "first_day": first_day, "last_day": last_day,
+            })
+        return stats
+
+    def day_stats(self, start=None, end=None, slot=None):
+        """Per-day, per-slot attendance and lateness counts, oldest first."""
+        where, params = [], []
+        for clause, value in (("day >= ?", start), ("day <= ?", end), ("slot = ?", slot)):
+            if value:
+                where.append(clause)
+                params.append(value)
+        query = (f"SELECT day, slot, present, late, alerts FROM day_stats "
+                 f"{'WHERE ' + ' AND '.join(where) if where else ''} ORDER BY day, slot")
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [dict(zip(("day", "slot", "present", "late", "alerts"), row)) for row in rows]
+
+    def alert_count(self):
+        """Late marks that triggered the latecomer alert, over the whole history."""
+        with self._lock:
+            return self._conn.execute("SELECT coalesce(sum(alerts), 0) FROM day_stats").fetchone()[0]
+
+    def iter_rows(self, batch_size=1000, start=None, end=None, names=None):
+        """Yield events oldest first, reading batch_size rows at a time.
+
+        start/end ("YYYY-MM-DD", inclusive) and names restrict the export.
+        """
+        where, params = ["id > ?"], []
+        if start:
+            where.append("day >= ?")
+            params.append(start)
+        if end:
+            where.append("day <= ?")
+            params.append(end)
+        if names:
+            where.append(f"name IN ({', '.join('?' * len(names))})")
+            params.extend(names)
+        query = f"SELECT {{}} FROM attendance WHERE {' AND '.join(where)} ORDER BY id LIMIT ?"
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self._fetch_all(query, (last_id, *params, batch_size))
+            if not rows:
+                return
+            yield from rows
+            last_id = rows[-1]["id"]
+
+    def import_csv(self, csv_path):
+        """Import a legacy attendance.csv; returns the number of new rows.
+
+        Old files mix 2-column (Name, Timestamp) and 4-column (Name,
+        Timestamp, Status, Lecture Slot) rows; missing fields become NULL.
+        Re-importing the same file adds nothing.
+        """
+        rows = []
+        with open(csv_path, newline="") as f:
+            for line in csv.reader(f):
+                if len(line) < 2 or line[0] == "Name":
+                    continue
+                try:
+                    ts = datetime.strptime(line[1].strip(), "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d %H:%M:%S")
+                except ValueError:
+                    print(f"⚠️ Skipping malformed row: {line}")
+                    continue
+                status = line[2] if len(line) > 2 and line[2] else None
+                slot = line[3] if len(line) > 3 and line[3] else None
+                rows.append((line[0], ts, ts[:10], status, slot))
+        with self._lock:
+            self._conn.execute("BEGIN")
+            # rowcount, unlike total_changes, leaves out rows written by the report trigger
+            imported = self._conn.executemany(
+                "INSERT OR IGNORE INTO attendance (name, timestamp, day, status, slot) VALUES (?, ?, ?, ?, ?)",
+                rows).rowcount
+            self._conn.execute("COMMIT")
+            self._load_day(self._day)
+            self._load_marks(self._marked_day)
+            self._last = self._fetch_one("SELECT {} FROM attendance ORDER BY id DESC LIMIT 1")
+        return imported
+
+
+def open_store(db_path="../attendance.db", legacy_csv="../attendance.csv"):
+    """Open the store, importing the legacy CSV the first time it is created."""
+    is_new = not os.path.exists(db_path)
+    store = AttendanceStore(db_path)
+    if is_new and os.path.exists(legacy_csv):
+        print(f"Imported {store.import_csv(legacy_csv)} rows from {legacy_csv}")
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import a legacy attendance CSV into the attendance store.")
+    parser.add_argument("csv", nargs="?", default="../attendance.csv")
+    parser.add_argument("--db", default="../attendance.db")
+    args = parser.parse_args()
+    store = AttendanceStore(args.db)
+    print(f"Imported {store.import_csv(args.csv)} new rows into {args.db} ({store.count()} total)")
+
+
+if __name__ == "__main__":
+    main()
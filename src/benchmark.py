@@ -0,0 +1,299 @@
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from build_database import list_images
+from matcher import GalleryMatcher
+from quality import QualityGate
+from recognition import _tile_faces, detect_faces, embed_faces, recognize_faces
+
+
+def percentiles(seconds):
+    """Latency summary in milliseconds."""
+    ms = np.asarray(seconds, dtype=np.float64) * 1000
+    if not len(ms):
+        return {"count": 0}
+    return {
+        "count": int(len(ms)),
+        "mean": round(float(ms.mean()), 3),
+        "p50": round(float(np.percentile(ms, 50)), 3),
+        "p90": round(float(np.percentile(ms, 90)), 3),
+        "p99": round(float(np.percentile(ms, 99)), 3),
+        "max": round(float(ms.max()), 3),
+    }
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB (None where unsupported, e.g. Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1024 * 1024 if os.uname().sysname == "Darwin" else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1)
+
+
+def split_dataset(images, enroll, holdout_every):
+    """Split into (gallery images, genuine probes, impostor probes), each a list of (person, path).
+
+    Every holdout_every-th person is left out of the gallery entirely, so
+    their images measure false accepts; everyone else enrolls their first
+    `enroll` images and probes with the rest.
+    """
+    gallery, genuine, impostor = [], [], []
+    for i, (person, paths) in enumerate(sorted(images.items())):
+        if holdout_every and i % holdout_every == holdout_every - 1:
+            impostor.extend((person, p) for p in paths)
+        else:
+            gallery.extend((person, p) for p in paths[:enroll])
+            genuine.extend((person, p) for p in paths[enroll:])
+    return gallery, genuine, impostor
+
+
+def embed_images(items, stages, gate=None):
+    """Detect and embed one image at a time, recording per-stage latency.
+
+    Images where the detector finds nothing are embedded whole, as
+    build_database does for enrollment. With a quality gate every face is
+    still embedded, so accuracy can be compared with and without it;
+    returns (people, embeddings, whether each face passed the gate).
+    """
+    people, embeddings, passed = [], [], []
+    for person, path in items:
+        img = cv2.imread(path)
+        if img is None:
+            stages["unreadable"] += 1
+            continue
+        start = time.perf_counter()
+        faces = detect_faces(img)
+        stages["detect"].append(time.perf_counter() - start)
+        if faces:
+            face = max(faces, key=lambda f: f["confidence"])
+        else:
+            stages["no_face"] += 1
+            face = {"face": img[:, :, ::-1] / 255.0}
+        if gate is not None:
+            start = time.perf_counter()
+            passed.append(gate.check(face)[0])
+            stages["quality"].append(time.perf_counter() - start)
+        else:
+            passed.append(True)
+        start = time.perf_counter()
+        embedding = embed_faces([face])[0]
+        stages["embed"].append(time.perf_counter() - start)
+        people.append(person)
+        embeddings.append(embedding)
+    return people, np.asarray(embeddings, dtype=np.float32), np.asarray(passed, dtype=bool)
+
+
+def accuracy(matcher, genuine_people, genuine, impostor, thresholds):
+    """Rank-1 accuracy and, per threshold, true/false accept rates.
+
+    tar: genuine probes accepted as the right person; misid: genuine probes
+    accepted as someone else; far: impostor probes accepted as anyone.
+    """
+    names, g_dist = matcher.search(genuine) if len(genuine) else ([], np.empty((0, 1)))
+    correct = np.array([n[0] == p for n, p in zip(names, genuine_people)], dtype=bool)
+    g_dist = np.asarray(g_dist, dtype=np.float64)[:, 0]
+    i_dist = np.asarray(matcher.search(impostor)[1], dtype=np.float64)[:, 0] if len(impostor) else np.empty(0)
+
+    if thresholds is None:
+        all_dist = np.concatenate([g_dist, i_dist])
+        thresholds = np.linspace(all_dist.min(), all_dist.max(), 21) if len(all_dist) else []
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    g_accept = g_dist[:, None] <= thresholds[None, :]
+    i_accept = i_dist[:, None] <= thresholds[None, :]
+    tar = (g_accept & correct[:, None]).mean(axis=0) if len(g_dist) else np.zeros(len(thresholds))
+    misid = (g_accept & ~correct[:, None]).mean(axis=0) if len(g_dist) else np.zeros(len(thresholds))
+    far = i_accept.mean(axis=0) if len(i_dist) else np.zeros(len(thresholds))
+    return {
+        "rank1": round(float(correct.mean()), 4) if len(correct) else None,
+        "thresholds": [
+            {"threshold": round(float(t), 4), "tar": round(float(a), 4),
+             "misid": round(float(m), 4), "far": round(float(f), 4)}
+            for t, a, m, f in zip(thresholds, tar, misid, far)
+        ],
+    }
+
+
+def quality_report(gate, stages, matcher, genuine_people, genuine, genuine_passed,
+                   impostor, impostor_passed, thresholds):
+    """What the quality gate skips, what that saves, and accuracy on the faces it keeps."""
+    skipped = int((~genuine_passed).sum() + (~impostor_passed).sum())
+    mean_embed = float(np.mean(stages["embed"])) if stages["embed"] else 0.0
+    kept_people = [p for p, ok in zip(genuine_people, genuine_passed) if ok]
+    return {
+        **gate.snapshot(),
+        "gate": percentiles(stages["quality"]),
+        "embed_ms_saved": round(skipped * mean_embed * 1000, 3),
+        "gate_ms_spent": round(sum(stages["quality"]) * 1000, 3),
+        "kept_genuine": int(genuine_passed.sum()),
+        "kept_impostor": int(impostor_passed.sum()),
+        "accuracy_kept": accuracy(matcher, kept_people, genuine[genuine_passed],
+                                  impostor[impostor_passed], thresholds),
+    }
+
+
+def bench_frames(crops, matcher, faces_per_frame, repeats, threshold):
+    """End-to-end latency of recognize_faces on synthetic frames holding n faces."""
+    results = {}
+    for n_faces in faces_per_frame:
+        frame = _tile_faces(crops, n_faces)
+        latencies, found = [], 0
+        for _ in range(repeats):
+            start = time.perf_counter()
+            found += len(recognize_faces(frame, matcher, threshold))
+            latencies.append(time.perf_counter() - start)
+        total = sum(latencies)
+        results[str(n_faces)] = {
+            "latency": percentiles(latencies),
+            "detected_per_frame": found / repeats,
+            "frames_per_sec": round(repeats / total, 3) if total > 0 else None,
+            "faces_per_sec": round(found / total, 3) if total > 0 else None,
+        }
+    return results
+
+
+def compare(current, previous_path):
+    """Print how the headline numbers moved since a previous result file."""
+    with open(previous_path, encoding="utf-8") as f:
+        previous = json.load(f)
+
+    def show(label, old, new, lower_is_better):
+        if old is None or new is None:
+            return
+        change = (new - old) / old * 100 if old else 0.0
+        worse = change > 5 if lower_is_better else change < -5
+        print(f"  {label:<28} {old:>10.3f} -> {new:>10.3f} ({change:+.1f}%){'  ⚠️' if worse else ''}")
+
+    print(f"📊 Compared with {previous_path} ({previous.get('created')}):")
+    for stage in ("detect", "embed", "match"):
+        for stat in ("p50", "p99"):
+            show(f"{stage} {stat} ms", previous["stages"][stage].get(stat), current["stages"][stage].get(stat), True)
+    show("images/sec", previous["throughput"]["images_per_sec"], current["throughput"]["images_per_sec"], False)
+    show("embed batch faces/sec", previous["throughput"]["embed_batch_faces_per_sec"],
+         current["throughput"]["embed_batch_faces_per_sec"], False)
+    show("rank-1 accuracy", previous["accuracy"]["rank1"], current["accuracy"]["rank1"], False)
+    show("peak RSS MB", previous["memory"]["peak_rss_mb"], current["memory"]["peak_rss_mb"], True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark detection, embedding and matching without a camera.")
+    parser.add_argument("--dataset", default="../processed_dataset")
+    parser.add_argument("--enroll", type=int, default=3, help="Images per person used for the gallery")
+    parser.add_argument("--holdout-every", type=int, default=5,
+                        help="Leave every Nth person out of the gallery to measure false accepts (0 = none)")
+    parser.add_argument("--metric", default="euclidean", choices=["euclidean", "cosine"])
+    parser.add_argument("--thresholds", type=float, nargs="+", help="Default: 21 steps over the observed distances")
+    parser.add_argument("--threshold", type=float, default=2.5, help="Threshold for the synthetic frame runs")
+    parser.add_argument("--faces", type=int, nargs="+", default=[1, 5, 20], help="Faces per synthetic frame")
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--output", help="Default: ../benchmarks/benchmark_<timestamp>.json")
+    parser.add_argument("--compare", help="Previous result file to compare against")
+    parser.add_argument("--quality", action="store_true",
+                        help="Also report what the quality gate would skip and accuracy on the faces it keeps")
+    args = parser.parse_args()
+
+    images = list_images(args.dataset)
+    gallery_items, genuine_items, impostor_items = split_dataset(images, args.enroll, args.holdout_every)
+    if not gallery_items:
+        print(f"⚠️ No images found in {args.dataset}")
+        return
+    print(f"📂 {len(images)} people: {len(gallery_items)} gallery images, "
+          f"{len(genuine_items)} genuine probes, {len(impostor_items)} impostor probes")
+
+    # Build the models before timing anything
+    warmup = cv2.imread(gallery_items[0][1])
+    embed_faces([{"face": warmup[:, :, ::-1] / 255.0}])
+    detect_faces(warmup)
+
+    stages = {"detect": [], "embed": [], "match": [], "quality": [], "unreadable": 0, "no_face": 0}
+    gate = QualityGate() if args.quality else None
+    gallery_people, gallery_embeddings, _ = embed_images(gallery_items, stages)
+    matcher = GalleryMatcher(gallery_people, gallery_embeddings, metric=args.metric)
+    # Only probes go through the gate: enrollment images are curated
+    genuine_people, genuine, genuine_passed = embed_images(genuine_items, stages, gate)
+    _, impostor, impostor_passed = embed_images(impostor_items, stages, gate)
+
+    probes = np.concatenate([p for p in (genuine, impostor) if len(p)]) if len(genuine) + len(impostor) else genuine
+    for probe in probes:
+        start = time.perf_counter()
+        matcher.identify(probe[None, :], args.threshold)
+        stages["match"].append(time.perf_counter() - start)
+
+    # Batched embedding throughput, as the live pipeline does for multi-face frames
+    crops = [cv2.imread(path) for _, path in gallery_items[:32]]
+    crops = [c for c in crops if c is not None]
+    batch = [{"face": c[:, :, ::-1] / 255.0} for c in crops]
+    start = time.perf_counter()
+    for _ in range(args.repeats):
+        embed_faces(batch)
+    batch_elapsed = time.perf_counter() - start
+
+    # One image = detect + embed + match, using the mean match time for gallery images too
+    mean_match = float(np.mean(stages["match"])) if stages["match"] else 0.0
+    per_image = sum(stages["detect"]) + sum(stages["embed"]) + mean_match * len(stages["embed"])
+    result = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "dataset": {
+            "people": len(images),
+            "gallery_images": len(gallery_people),
+            "genuine_probes": len(genuine),
+            "impostor_probes": len(impostor),
+            "unreadable": stages["unreadable"],
+            "no_face": stages["no_face"],
+        },
+        "stages": {name: percentiles(stages[name]) for name in ("detect", "embed", "match")},
+        "throughput": {
+            "images_per_sec": round(len(stages["embed"]) / per_image, 3) if per_image > 0 else None,
+            "embed_batch_size": len(batch),
+            "embed_batch_faces_per_sec": round(len(batch) * args.repeats / batch_elapsed, 3) if batch_elapsed > 0 else None,
+        },
+        "frames": bench_frames(crops, matcher, args.faces, args.repeats, args.threshold),
+        "memory": {
+            "peak_rss_mb": peak_rss_mb(),
+            "gallery_mb": round(matcher.embeddings.nbytes / 1024 / 1024, 3),
+        },
+        "accuracy": accuracy(matcher, genuine_people, genuine, impostor, args.thresholds),
+    }
+    if gate is not None:
+        result["quality"] = quality_report(gate, stages, matcher, genuine_people, genuine, genuine_passed,
+                                           impostor, impostor_passed, args.thresholds)
+
+    for name, stats in result["stages"].items():
+        print(f"⏱️ {name:<7} p50 {stats.get('p50', 0):8.2f} ms  p90 {stats.get('p90', 0):8.2f} ms  "
+              f"p99 {stats.get('p99', 0):8.2f} ms")
+    print(f"🚀 {result['throughput']['images_per_sec']} images/sec one at a time, "
+          f"{result['throughput']['embed_batch_faces_per_sec']} faces/sec embedded in batches of {len(batch)}")
+    for n_faces, stats in result["frames"].items():
+        print(f"🖼️ {n_faces:>3} faces/frame: p50 {stats['latency'].get('p50', 0):.1f} ms, "
+              f"{stats['faces_per_sec']} faces/sec")
+    print(f"🎯 Rank-1 accuracy: {result['accuracy']['rank1']}")
+    for row in result["accuracy"]["thresholds"]:
+        print(f"   threshold {row['threshold']:8.3f}: TAR {row['tar']:.3f}  misid {row['misid']:.3f}  FAR {row['far']:.3f}")
+    if gate is not None:
+        q = result["quality"]
+        print(f"🔍 Quality gate skipped {q['skipped']}/{q['checked']} probes ({q['skip_rate']:.1%}): "
+              f"saved {q['embed_ms_saved']:.1f} ms of embedding for {q['gate_ms_spent']:.1f} ms of checks")
+        print(f"   rank-1 on kept probes {q['accuracy_kept']['rank1']} vs {result['accuracy']['rank1']} on all")
+    print(f"💾 Peak RSS {result['memory']['peak_rss_mb']} MB, gallery {result['memory']['gallery_mb']} MB")
+
+    output = args.output or os.path.join("../benchmarks", f"benchmark_{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=1)
+    print(f"🎉 Results saved to {output}")
+
+    if args.compare:
+        compare(result, args.compare)
+
+
+if __name__ == "__main__":
+    main()
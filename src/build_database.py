@@ -1,47 +1,230 @@
+import argparse
+import hashlib
+import json
 import os
+import pickle
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
 import cv2
 import numpy as np
-import pandas as pd
-from deepface import DeepFace
+from ann_index import IVFIndex, index_path_for, kmeans
+from gallery import atomic_path, gallery_fingerprint, load_gallery, metadata_path_for, save_gallery
+from quantize import KINDS, QuantizedIndex, quantized_path_for
 
 # Paths
 processed_dataset_path = "../processed_dataset/"
-output_db_path = "../known_faces.pkl"
+output_db_path = "../known_faces.npy"
+cache_path = "../embedding_cache.pkl"
+
+# Representative embeddings kept per person
+per_person = 5
+
+
+def file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def embed_image(img_path):
+    """Embed one enrollment image. Runs in a worker process."""
+    from deepface import DeepFace
+
+    img = cv2.imread(img_path)
+    if img is None:
+        return img_path, None, "Could not read image"
+    try:
+        result = DeepFace.represent(img, model_name="Facenet", enforce_detection=False)
+        return img_path, np.asarray(result[0]["embedding"], dtype=np.float32), None
+    except Exception as e:
+        return img_path, None, str(e)
+
 
-# Dictionary to hold average embeddings for each person
-embeddings_dict = {}
+def load_cache(path):
+    """Per-image cache: image path -> {"mtime", "size", "sha1", "embedding"}."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "rb") as f:
+        return pickle.load(f)
 
-print("📦 Building face embeddings database...")
 
-for person in os.listdir(processed_dataset_path):
-    person_path = os.path.join(processed_dataset_path, person)
-    if not os.path.isdir(person_path):
-        continue
+def save_cache(cache, path):
+    with atomic_path(path) as tmp_path:
+        with open(tmp_path, "wb") as f:
+            pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
 
-    embeddings = []
-    for img_file in os.listdir(person_path):
-        img_path = os.path.join(person_path, img_file)
-        img = cv2.imread(img_path)
 
-        if img is None:
-            print(f"⚠️ Could not read image: {img_path}")
+def list_images(dataset_path, people=None):
+    """Map each person folder (optionally only `people`) to its image paths."""
+    images = {}
+    for person in sorted(os.listdir(dataset_path)):
+        person_path = os.path.join(dataset_path, person)
+        if not os.path.isdir(person_path) or (people and person not in people):
             continue
+        images[person] = [os.path.join(person_path, f) for f in sorted(os.listdir(person_path))]
+    return images
+
+
+def cached_embedding(cache, img_path):
+    """Return the cached embedding if the image is unchanged, else None.
+
+    mtime/size is checked first; if only the mtime changed (e.g. a copy or
+    touch) the content hash decides, and the entry is refreshed.
+    """
+    entry = cache.get(img_path)
+    if entry is None:
+        return None
+    stat = os.stat(img_path)
+    if entry["mtime"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+        return entry["embedding"]
+    if entry["size"] == stat.st_size and entry["sha1"] == file_hash(img_path):
+        entry["mtime"] = stat.st_mtime_ns
+        return entry["embedding"]
+    return None
+
+
+def representatives(embeddings, k):
+    """Up to k embeddings summarising one person: all of them, or k-means centroids."""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if len(embeddings) <= k:
+        return embeddings
+    centroids, _ = kmeans(embeddings, k)
+    return centroids
+
+
+def embed_dataset(images, cache, workers=None):
+    """Embed every image in images ({person: paths}), reusing and updating cache.
 
-        try:
-            # Generate face embedding
-            result = DeepFace.represent(img, model_name="Facenet", enforce_detection=False)
-            embeddings.append(result[0]["embedding"])
-        except Exception as e:
-            print(f"❌ Error processing {img_path}: {e}")
+    Returns ({path: embedding}, number of images embedded, seconds spent embedding).
+    """
+    per_image = {}
+    to_embed = []
+    for paths in images.values():
+        for img_path in paths:
+            embedding = cached_embedding(cache, img_path)
+            if embedding is not None:
+                per_image[img_path] = embedding
+            else:
+                to_embed.append(img_path)
+
+    total = sum(len(paths) for paths in images.values())
+    print(f"📦 {total} images, {total - len(to_embed)} cached, {len(to_embed)} to embed")
+
+    start = time.perf_counter()
+    if to_embed:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for img_path, embedding, error in pool.map(embed_image, to_embed, chunksize=8):
+                if embedding is None:
+                    print(f"❌ Error processing {img_path}: {error}")
+                    continue
+                stat = os.stat(img_path)
+                cache[img_path] = {"mtime": stat.st_mtime_ns, "size": stat.st_size,
+                                   "sha1": file_hash(img_path), "embedding": embedding}
+                per_image[img_path] = embedding
+    return per_image, len(to_embed), time.perf_counter() - start
+
+
+def build(dataset_path, db_path, cache_file, workers=None, people=None, remove=(), k=per_person):
+    # Start from the existing database when only some people are (re)enrolled
+    embeddings_dict = {}
+    calibration = {}
+    if os.path.exists(db_path) and os.path.exists(metadata_path_for(db_path)):
+        with open(metadata_path_for(db_path), encoding="utf-8") as f:
+            calibration = {k: v for k, v in json.load(f).items() if k in ("match_threshold", "calibration")}
+    if (people or remove) and os.path.exists(db_path):
+        names, embeddings, _ = load_gallery(db_path, mmap=False)
+        rows = defaultdict(list)
+        for i, name in enumerate(names):
+            rows[name].append(i)
+        embeddings_dict = {name: embeddings[idx] for name, idx in rows.items()}
+    for person in remove:
+        if embeddings_dict.pop(person, None) is not None:
+            print(f"🗑️ Removed {person}")
+
+    cache = load_cache(cache_file)
+    images = list_images(dataset_path, people) if (people or not remove) else {}
+
+    print("📦 Building face embeddings database")
+    per_image, embedded, elapsed = embed_dataset(images, cache, workers)
+    total = sum(len(paths) for paths in images.values())
+
+    for person, paths in images.items():
+        embeddings = [per_image[p] for p in paths if p in per_image]
+        if embeddings:
+            embeddings_dict[person] = representatives(embeddings, k)
+            print(f"✅ Processed {person} with {len(embeddings)} valid images "
+                  f"({len(embeddings_dict[person])} representatives)")
+        else:
+            embeddings_dict.pop(person, None)
+            print(f"⚠️ No valid embeddings for {person}")
+
+    # Drop cache entries for images that were deleted or whose person was removed
+    scanned = {p for paths in images.values() for p in paths}
+    removed_dirs = tuple(os.path.join(dataset_path, person) + os.sep for person in remove)
+    full_scan = people is None and not remove
+    cache = {p: e for p, e in cache.items()
+             if os.path.exists(p) and not p.startswith(removed_dirs) and (p in scanned or not full_scan)}
+    save_cache(cache, cache_file)
+
+    # Save the database
+    # One row per representative; a person's rows share their name
+    names = [person for person, rows in embeddings_dict.items() for _ in rows]
+    embeddings = np.concatenate(list(embeddings_dict.values())) if names else np.empty((0, 0))
+    # A calibrated threshold only holds for the rows it was calibrated on
+    if calibration and calibration.get("calibration", {}).get("gallery") != gallery_fingerprint(names, embeddings):
+        print("⚠️ The enrolled people or their representatives changed, so the calibrated threshold was dropped "
+              "(run calibrate.py again)")
+        calibration = {}
+    save_gallery(db_path, names, embeddings, per_person=k, **calibration)
+    print(f"\n🎉 Database saved successfully to: {db_path} ({len(embeddings_dict)} people, {len(names)} embeddings)")
+
+    # Build the approximate nearest-neighbour index used for large galleries
+    if embeddings_dict:
+        index = IVFIndex.build(names, embeddings)
+        with atomic_path(index_path_for(db_path)) as tmp_path:
+            index.save(tmp_path)
+        print(f"🔎 ANN index ({index.n_lists} lists) saved to: {index_path_for(db_path)}")
+    elif os.path.exists(index_path_for(db_path)):
+        os.remove(index_path_for(db_path))
+
+    # Re-quantize any quantized codes saved for this gallery, so they never go stale
+    for kind in KINDS:
+        path = quantized_path_for(db_path, kind)
+        if not os.path.exists(path):
+            continue
+        if not embeddings_dict:
+            os.remove(path)
             continue
+        previous = np.load(path)
+        kwargs = {"m": previous["codebooks"].shape[0]} if kind == "pq" else {}
+        quantized = QuantizedIndex.build(names, embeddings, kind, str(previous["metric"]), **kwargs)
+        with atomic_path(path) as tmp_path:
+            quantized.save(tmp_path)
+        print(f"🗜️ {kind} codes ({quantized.nbytes() / 1024:.1f} KB) saved to: {path}")
+
+    hit_rate = (total - embedded) / total if total else 0.0
+    rate = embedded / elapsed if elapsed > 0 else 0.0
+    print(f"⏱️ Embedded {embedded} images in {elapsed:.1f}s ({rate:.2f} images/sec), "
+          f"cache hit rate {hit_rate:.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the known faces database from the processed dataset.")
+    parser.add_argument("--dataset", default=processed_dataset_path)
+    parser.add_argument("--output", default=output_db_path)
+    parser.add_argument("--cache", default=cache_path)
+    parser.add_argument("--workers", type=int, default=None, help="Embedding processes (default: CPU count)")
+    parser.add_argument("--add", nargs="+", default=None, metavar="PERSON",
+                        help="Only (re)enroll these people, keeping everyone else")
+    parser.add_argument("--remove", nargs="+", default=(), metavar="PERSON",
+                        help="Remove these people from the database")
+    parser.add_argument("--per-person", type=int, default=per_person,
+                        help="Representative embeddings (k-means centroids) kept per person")
+    args = parser.parse_args()
+    build(args.dataset, args.output, args.cache, args.workers, set(args.add) if args.add else None, args.remove,
+          args.per_person)
 
-    if embeddings:
-        embeddings_dict[person] = np.mean(embeddings, axis=0)
-        print(f"✅ Processed {person} with {len(embeddings)} valid images")
-    else:
-        print(f"⚠️ No valid embeddings for {person}")
 
-# Save the database
-df = pd.DataFrame(embeddings_dict.items(), columns=["Name", "Embedding"])
-df.to_pickle(output_db_path)
-print(f"\n🎉 Database saved successfully to: {output_db_path}")
+if __name__ == "__main__":
+    main()
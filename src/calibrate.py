@@ -0,0 +1,201 @@
+import argparse
+import time
+from datetime import datetime
+
+import numpy as np
+
+from ann_index import kmeans
+from build_database import cache_path, embed_dataset, list_images, load_cache, output_db_path, per_person, \
+    processed_dataset_path, save_cache
+from gallery import gallery_fingerprint, load_gallery, update_metadata
+from matcher import GalleryMatcher
+
+
+def distance_block(block, embeddings, sq_norms, metric):
+    """Distances from every row of block to every row of embeddings."""
+    dots = block @ embeddings.T
+    if metric == "cosine":
+        return 1.0 - dots
+    block_sq = np.einsum("ij,ij->i", block, block)
+    return np.sqrt(np.maximum(block_sq[:, None] + sq_norms[None, :] - 2.0 * dots, 0.0))
+
+
+def distance_statistics(embeddings, labels, metric="euclidean", bins=4096, chunk=1024):
+    """All-pairs genuine/impostor histograms, computed chunk by chunk.
+
+    Returns (bin edges, genuine pair histogram, impostor pair histogram).
+    Only a chunk x N distance block is in memory at a time, so this scales
+    to galleries whose full pair matrix would not fit.
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    if metric == "cosine":
+        embeddings = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    labels = np.asarray(labels)
+    n = len(embeddings)
+    sq_norms = np.einsum("ij,ij->i", embeddings, embeddings)
+    max_dist = 2.0 if metric == "cosine" else 2.0 * float(np.sqrt(sq_norms.max())) if n else 1.0
+    edges = np.linspace(0.0, max_dist, bins + 1)
+    genuine_hist = np.zeros(bins, dtype=np.int64)
+    impostor_hist = np.zeros(bins, dtype=np.int64)
+    columns = np.arange(n)
+
+    for start in range(0, n, chunk):
+        end = min(start + chunk, n)
+        dist = np.minimum(distance_block(embeddings[start:end], embeddings, sq_norms, metric), max_dist)
+        same = labels[start:end, None] == labels[None, :]
+        # Count each unordered pair once
+        upper = columns[None, :] > np.arange(start, end)[:, None]
+        genuine_hist += np.histogram(dist[same & upper], edges)[0]
+        impostor_hist += np.histogram(dist[~same & upper], edges)[0]
+    return edges, genuine_hist, impostor_hist
+
+
+def row_distances(a, b, metric):
+    """Distance between each row of a and the same row of b."""
+    if metric == "cosine":
+        norms = np.maximum(np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1), 1e-12)
+        return 1.0 - np.einsum("ij,ij->i", a, b) / norms
+    return np.linalg.norm(a - b, axis=1)
+
+
+def gallery_scores(embeddings, labels, matcher, k, chunk=1024):
+    """Distance of every image to its own person and to the closest other person in the gallery.
+
+    Images are matched the way recognition matches a face: against the
+    gallery's representatives. The impostor score uses the enrolled rows of
+    everyone else. The genuine score uses the person's representatives
+    (up to k k-means centroids, as build_database makes them) with the image
+    left out: its own centroid becomes the mean of the other images in its
+    cluster, or is dropped if it was the only one. Each person is clustered
+    once and scored in one pass.
+
+    Returns (nearest genuine, nearest impostor); inf where there is none.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    labels = np.asarray(labels)
+    nearest_impostor = np.full(len(labels), np.inf)
+    for start in range(0, len(labels), chunk):
+        identities, dist = matcher.identity_distances(embeddings[start:start + chunk])
+        own = labels[start:start + chunk, None] == identities.astype(str)[None, :]
+        nearest_impostor[start:start + chunk] = np.where(own, np.inf, dist).min(axis=1, initial=np.inf)
+
+    nearest_genuine = np.full(len(labels), np.inf)
+    for person in np.unique(labels):
+        rows = np.flatnonzero(labels == person)
+        images = embeddings[rows]
+        if len(images) <= k:
+            # Enrolled as-is, one row per image
+            centroids, assigned = images, np.arange(len(images))
+        else:
+            centroids, assigned = kmeans(images, k)
+        counts = np.bincount(assigned, minlength=len(centroids))
+        dist = GalleryMatcher([person] * len(centroids), centroids, matcher.metric).distances(images)
+        others = counts[assigned] - 1
+        left_out = (centroids[assigned] * counts[assigned, None] - images) / np.maximum(others, 1)[:, None]
+        dist[np.arange(len(images)), assigned] = np.where(
+            others > 0, row_distances(images, left_out, matcher.metric), np.inf)
+        nearest_genuine[rows] = dist.min(axis=1)
+    return nearest_genuine, nearest_impostor
+
+
+def threshold_for_far(nearest_impostor, target_far):
+    """Largest threshold at which at most target_far of the images match someone else."""
+    scores = np.sort(nearest_impostor[np.isfinite(nearest_impostor)])
+    if not len(scores):
+        raise ValueError("Need at least two people to calibrate")
+    allowed = int(np.floor(target_far * len(scores)))
+    if allowed >= len(scores):
+        return float(scores[-1])
+    # Just below the first impostor score that would exceed the target
+    return float(np.nextafter(scores[allowed], 0.0))
+
+
+def rates_at(threshold, edges, genuine_hist, impostor_hist, nearest_genuine, nearest_impostor):
+    """FAR/FRR at threshold, per image (against the gallery) and per pair (histogram)."""
+    genuine = nearest_genuine[np.isfinite(nearest_genuine)]
+    impostor = nearest_impostor[np.isfinite(nearest_impostor)]
+    accepted_bins = edges[1:] <= threshold
+    return {
+        "far": float((impostor <= threshold).mean()) if len(impostor) else 0.0,
+        "frr": float((genuine > threshold).mean()) if len(genuine) else 0.0,
+        "pair_far": float(impostor_hist[accepted_bins].sum() / max(impostor_hist.sum(), 1)),
+        "pair_frr": float(1 - genuine_hist[accepted_bins].sum() / max(genuine_hist.sum(), 1)),
+    }
+
+
+def describe(edges, hist):
+    centers = (edges[:-1] + edges[1:]) / 2
+    total = hist.sum()
+    if not total:
+        return {"pairs": 0}
+    mean = float((centers * hist).sum() / total)
+    std = float(np.sqrt(((centers - mean) ** 2 * hist).sum() / total))
+    return {"pairs": int(total), "mean": round(mean, 4), "std": round(std, 4)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate the match threshold for a target false-accept rate.")
+    parser.add_argument("--dataset", default=processed_dataset_path)
+    parser.add_argument("--gallery", default=output_db_path, help="Gallery to match against and receive the threshold")
+    parser.add_argument("--cache", default=cache_path)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--metric", default="euclidean", choices=["euclidean", "cosine"])
+    parser.add_argument("--target-far", type=float, default=0.01,
+                        help="Fraction of strangers allowed to match an enrolled person")
+    parser.add_argument("--dry-run", action="store_true", help="Print the threshold without saving it")
+    args = parser.parse_args()
+
+    names, gallery, metadata = load_gallery(args.gallery, mmap=False)
+    matcher = GalleryMatcher(names, gallery, metric=args.metric)
+    k = metadata.get("per_person", per_person)
+    enrolled = set(map(str, names))
+
+    # Only enrolled people can be falsely accepted as themselves, so others are left out
+    images = {person: paths for person, paths in list_images(args.dataset).items() if person in enrolled}
+    cache = load_cache(args.cache)
+    per_image, _, _ = embed_dataset(images, cache, args.workers)
+    save_cache(cache, args.cache)
+    labels = [person for person, paths in images.items() for p in paths if p in per_image]
+    embeddings = np.array([per_image[p] for paths in images.values() for p in paths if p in per_image],
+                          dtype=np.float32)
+
+    start = time.perf_counter()
+    edges, genuine_hist, impostor_hist = distance_statistics(embeddings, labels, args.metric)
+    nearest_genuine, nearest_impostor = gallery_scores(embeddings, labels, matcher, k)
+    elapsed = time.perf_counter() - start
+    genuine, impostor = describe(edges, genuine_hist), describe(edges, impostor_hist)
+    print(f"📏 {len(labels)} images of {len(set(labels))} people against {len(names)} gallery rows "
+          f"(up to {k} per person): {genuine['pairs']} genuine and {impostor['pairs']} impostor pairs "
+          f"in {elapsed:.2f}s")
+    print(f"   genuine  distance {genuine.get('mean', 0):.3f} ± {genuine.get('std', 0):.3f}")
+    print(f"   impostor distance {impostor.get('mean', 0):.3f} ± {impostor.get('std', 0):.3f}")
+
+    stats = (edges, genuine_hist, impostor_hist, nearest_genuine, nearest_impostor)
+    for far in sorted({0.1, 0.01, 0.001, args.target_far}, reverse=True):
+        t = threshold_for_far(nearest_impostor, far)
+        rates = rates_at(t, *stats)
+        print(f"   target FAR {far:<6}: threshold {t:.4f}  FAR {rates['far']:.4f}  FRR {rates['frr']:.4f}")
+
+    threshold = threshold_for_far(nearest_impostor, args.target_far)
+    rates = rates_at(threshold, *stats)
+    calibration = {
+        "metric": args.metric,
+        "target_far": args.target_far,
+        **{field: round(v, 4) for field, v in rates.items()},
+        "images": len(labels),
+        "people": len(set(labels)),
+        "per_person": k,
+        "genuine": genuine,
+        "impostor": impostor,
+        # build_database drops the calibration once the gallery no longer matches this
+        "gallery": gallery_fingerprint(names, gallery),
+        "calibrated": datetime.now().isoformat(timespec="seconds"),
+    }
+    print(f"🎯 Threshold {threshold:.4f} ({args.metric}): FAR {rates['far']:.2%}, FRR {rates['frr']:.2%}")
+    if not args.dry_run:
+        update_metadata(args.gallery, match_threshold=threshold, calibration=calibration)
+        print(f"🎉 Saved to the metadata of {args.gallery}")
+
+
+if __name__ == "__main__":
+    main()
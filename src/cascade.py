@@ -0,0 +1,142 @@
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from recognition import DETECTOR_BACKEND, detect_faces
+
+
+def _offset_area(area, dx, dy):
+    """Shift a DeepFace facial_area (box and eye points) by (dx, dy)."""
+    area = dict(area)
+    area["x"] += dx
+    area["y"] += dy
+    for eye in ("left_eye", "right_eye"):
+        if area.get(eye) is not None:
+            area[eye] = (area[eye][0] + dx, area[eye][1] + dy)
+    return area
+
+
+def _merge_regions(regions):
+    """Union overlapping (x0, y0, x1, y1) regions so each face is searched once."""
+    merged = []
+    for region in sorted(regions):
+        for i, other in enumerate(merged):
+            if region[0] <= other[2] and other[0] <= region[2] and region[1] <= other[3] and other[1] <= region[3]:
+                merged[i] = (min(region[0], other[0]), min(region[1], other[1]),
+                             max(region[2], other[2]), max(region[3], other[3]))
+                break
+        else:
+            merged.append(region)
+    return merged
+
+
+class DetectorCascade:
+    """Cheap gates in front of MTCNN.
+
+    On a downscaled grayscale frame, a frame-difference gate skips frames in
+    which nothing moved (the previous detections are reused), and a Haar
+    cascade proposes candidate regions. MTCNN then only runs on those
+    regions, padded, instead of the full frame.
+    """
+
+    def __init__(self, use_motion=True, use_haar=True, scale=0.5, motion_threshold=25,
+                 min_motion=0.002, pad=0.4, detector_backend=DETECTOR_BACKEND):
+        self.use_motion = use_motion
+        self.use_haar = use_haar
+        self.scale = scale
+        self.motion_threshold = motion_threshold
+        self.min_motion = min_motion
+        self.pad = pad
+        self.detector_backend = detector_backend
+        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+        self._previous = None
+        self._last_faces = []
+        self.stats = {"frames": 0, "no_motion": 0, "no_candidates": 0, "mtcnn_calls": 0, "latency_ms_avg": 0.0}
+
+    def reset(self):
+        """Forget the previous frame and its faces, e.g. before jumping to another part of a video."""
+        self._previous = None
+        self._last_faces = []
+
+    def detect(self, frame):
+        """Same contract as recognition.detect_faces, but gated."""
+        start = time.perf_counter()
+        faces = self._detect(frame)
+        self.stats["frames"] += 1
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.stats["latency_ms_avg"] += (elapsed_ms - self.stats["latency_ms_avg"]) / self.stats["frames"]
+        return faces
+
+    def _detect(self, frame):
+        small = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+
+        if self.use_motion:
+            previous, self._previous = self._previous, gray
+            if previous is not None and previous.shape == gray.shape:
+                changed = cv2.absdiff(gray, previous) > self.motion_threshold
+                if np.count_nonzero(changed) < self.min_motion * changed.size:
+                    self.stats["no_motion"] += 1
+                    return self._last_faces
+
+        if not self.use_haar:
+            self.stats["mtcnn_calls"] += 1
+            self._last_faces = detect_faces(frame, self.detector_backend)
+            return self._last_faces
+
+        candidates = self.face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=3, minSize=(15, 15))
+        if len(candidates) == 0:
+            self.stats["no_candidates"] += 1
+            self._last_faces = []
+            return self._last_faces
+
+        height, width = frame.shape[:2]
+        regions = []
+        for (x, y, w, h) in candidates:
+            x, y, w, h = (int(v / self.scale) for v in (x, y, w, h))
+            pad_x, pad_y = int(w * self.pad), int(h * self.pad)
+            regions.append((max(0, x - pad_x), max(0, y - pad_y), min(width, x + w + pad_x), min(height, y + h + pad_y)))
+
+        faces = []
+        for x0, y0, x1, y1 in _merge_regions(regions):
+            self.stats["mtcnn_calls"] += 1
+            for face in detect_faces(frame[y0:y1, x0:x1], self.detector_backend):
+                face["facial_area"] = _offset_area(face["facial_area"], x0, y0)
+                faces.append(face)
+        self._last_faces = faces
+        return faces
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-frame detection cost with and without the cascade.")
+    parser.add_argument("--source", default="0", help="Camera index or video file")
+    parser.add_argument("--frames", type=int, default=200)
+    args = parser.parse_args()
+
+    cap = cv2.VideoCapture(int(args.source) if args.source.isdigit() else args.source)
+    frames = []
+    while len(frames) < args.frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(cv2.resize(frame, (640, 480)))
+    cap.release()
+    if not frames:
+        print("Error: Could not read any frames.")
+        return
+
+    detect_faces(frames[0])  # Warm up MTCNN
+    runs = [("mtcnn only", lambda f: detect_faces(f)), ("cascade", DetectorCascade().detect)]
+    for label, detect in runs:
+        wall, cpu = time.perf_counter(), time.process_time()
+        for frame in frames:
+            detect(frame)
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        print(f"{label:>10}: {1000 * wall / len(frames):.1f} ms/frame, "
+              f"{1000 * cpu / len(frames):.1f} ms CPU/frame, {100 * cpu / wall:.0f}% CPU")
+
+
+if __name__ == "__main__":
+    main()
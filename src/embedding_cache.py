@@ -0,0 +1,133 @@
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from quality import _gray
+from recognition import embed_faces
+
+
+def dhash(face_img, hash_size=16):
+    """Difference hash of a face crop as an int of hash_size**2 bits.
+
+    Each bit says whether a pixel of the grayscale crop, shrunk to
+    (hash_size + 1) x hash_size, is brighter than its right neighbour, so
+    the hash survives small shifts, noise and exposure changes.
+    """
+    small = cv2.resize(_gray(face_img), (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+class EmbeddingCache:
+    """Bounded LRU cache in front of the embedding model.
+
+    A drop-in replacement for embed_faces: faces whose crop hashes within
+    max_distance bits of a cached crop reuse its embedding, the rest are
+    embedded in one batch and cached. Someone standing in front of the
+    camera produces near-identical crops frame after frame, so most of
+    them never reach Facenet. Safe to share between inference threads.
+    """
+
+    def __init__(self, embed=embed_faces, capacity=512, max_distance=10, hash_size=16):
+        self.embed = embed
+        self.capacity = capacity
+        self.max_distance = max_distance
+        self.hash_size = hash_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"lookups": 0, "hits": 0, "misses": 0, "evictions": 0,
+                      "embedded": 0, "embed_sec": 0.0, "hash_sec": 0.0, "saved_sec": 0.0}
+
+    def __call__(self, faces):
+        start = time.perf_counter()
+        keys = [dhash(face["face"], self.hash_size) for face in faces]
+        hash_sec = time.perf_counter() - start
+
+        with self._lock:
+            cached = [self._lookup(key) for key in keys]
+        missing = [i for i, embedding in enumerate(cached) if embedding is None]
+
+        embed_sec = 0.0
+        if missing:
+            start = time.perf_counter()
+            fresh = self.embed([faces[i] for i in missing])
+            embed_sec = time.perf_counter() - start
+            for i, embedding in zip(missing, fresh):
+                cached[i] = embedding
+
+        with self._lock:
+            for i in missing:
+                self._insert(keys[i], cached[i])
+            hits = len(faces) - len(missing)
+            self.stats["lookups"] += len(faces)
+            self.stats["hits"] += hits
+            self.stats["misses"] += len(missing)
+            self.stats["embedded"] += len(missing)
+            self.stats["embed_sec"] += embed_sec
+            self.stats["hash_sec"] += hash_sec
+            # Credit each hit with the average model time per face so far
+            if self.stats["embedded"]:
+                self.stats["saved_sec"] += hits * self.stats["embed_sec"] / self.stats["embedded"]
+
+        if not faces:
+            return self.embed([])
+        return np.asarray(cached, dtype=np.float32)
+
+    def _lookup(self, key):
+        """Embedding of the closest cached crop within max_distance bits, or None."""
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        best, best_distance = None, self.max_distance + 1
+        for other in self._entries:
+            distance = bin(key ^ other).count("1")
+            if distance < best_distance:
+                best, best_distance = other, distance
+        if best is None:
+            return None
+        self._entries.move_to_end(best)
+        return self._entries[best]
+
+    def _insert(self, key, embedding):
+        self._entries[key] = embedding
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def snapshot(self):
+        with self._lock:
+            s = dict(self.stats)
+            size = len(self._entries)
+        return {
+            "capacity": self.capacity,
+            "size": size,
+            "lookups": s["lookups"],
+            "hits": s["hits"],
+            "misses": s["misses"],
+            "hit_rate": s["hits"] / s["lookups"] if s["lookups"] else 0.0,
+            "evictions": s["evictions"],
+            "saved_ms": round(s["saved_sec"] * 1000, 3),
+            "hash_ms": round(s["hash_sec"] * 1000, 3),
+            "embed_ms_per_face": round(s["embed_sec"] / s["embedded"] * 1000, 3) if s["embedded"] else None,
+        }
+
+    def metrics(self):
+        """Values for MetricsRegistry.add_values."""
+        s = self.snapshot()
+        return {
+            "embedding_cache_lookups_total": ("counter", "Faces looked up in the embedding cache.", s["lookups"]),
+            "embedding_cache_hits_total": ("counter", "Faces whose embedding came from the cache.", s["hits"]),
+            "embedding_cache_evictions_total": ("counter", "Cached embeddings evicted to stay under capacity.",
+                                                s["evictions"]),
+            "embedding_cache_saved_seconds_total": ("counter", "Estimated model time saved by cache hits.",
+                                                    s["saved_ms"] / 1000),
+            "embedding_cache_entries": ("gauge", "Embeddings currently cached.", s["size"]),
+        }
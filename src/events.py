@@ -0,0 +1,116 @@
+import asyncio
+import json
+import queue
+import threading
+from collections import deque
+
+
+class _AsyncSubscriber:
+    """Pending messages of one asyncio client; the oldest is discarded when it falls behind."""
+
+    def __init__(self, max_pending):
+        self.pending = deque(maxlen=max_pending)
+        self.ready = asyncio.Event()
+
+
+class EventBus:
+    """Publishes dashboard events to Server-Sent Events subscribers.
+
+    Each subscriber has a bounded queue; if a client stops reading, its
+    oldest events are discarded rather than blocking the publisher.
+    `initial` events (e.g. the current name) are replayed to new
+    subscribers so a fresh page starts in the right state. astream() serves
+    subscribers on an asyncio event loop without a thread each.
+    """
+
+    def __init__(self, max_pending=100, heartbeat=15.0):
+        self.max_pending = max_pending
+        self.heartbeat = heartbeat
+        self._subscribers = set()
+        self._async_subscribers = {}  # event loop -> its _AsyncSubscribers
+        self._initial = {}
+        self._lock = threading.Lock()
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers) + sum(len(v) for v in self._async_subscribers.values())
+
+    def publish(self, event, data, initial=False, key=None):
+        """Send one event to every subscriber; initial=True also keeps it for new ones.
+
+        Initial events replace the previous one with the same key (default
+        the event name), e.g. one current name per camera.
+        """
+        message = f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        with self._lock:
+            if initial:
+                self._initial[key or event] = message
+            subscribers = list(self._subscribers)
+            loops = list(self._async_subscribers)
+        for loop in loops:
+            try:
+                loop.call_soon_threadsafe(self._fan_out, loop, message)
+            except RuntimeError:
+                pass  # The loop was closed
+        for q in subscribers:
+            while True:
+                try:
+                    q.put_nowait(message)
+                    break
+                except queue.Full:
+                    try:
+                        q.get_nowait()
+                    except queue.Empty:
+                        pass
+
+    def stream(self):
+        """Yield SSE messages for one client until it disconnects."""
+        q = queue.Queue(maxsize=self.max_pending)
+        with self._lock:
+            self._subscribers.add(q)
+            initial = list(self._initial.values())
+        try:
+            yield from initial
+            while True:
+                try:
+                    yield q.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+        finally:
+            with self._lock:
+                self._subscribers.discard(q)
+
+    def _fan_out(self, loop, message):
+        with self._lock:
+            subscribers = list(self._async_subscribers.get(loop, ()))
+        for subscriber in subscribers:
+            subscriber.pending.append(message)
+            subscriber.ready.set()
+
+    async def astream(self):
+        """Async version of stream() for ASGI servers."""
+        loop = asyncio.get_running_loop()
+        subscriber = _AsyncSubscriber(self.max_pending)
+        pending, ready = subscriber.pending, subscriber.ready
+        with self._lock:
+            self._async_subscribers.setdefault(loop, set()).add(subscriber)
+            initial = list(self._initial.values())
+        try:
+            for message in initial:
+                yield message
+            while True:
+                if not pending:
+                    ready.clear()
+                    try:
+                        await asyncio.wait_for(ready.wait(), self.heartbeat)
+                    except asyncio.TimeoutError:
+                        yield ": keep-alive\n\n"
+                        continue
+                yield pending.popleft()
+        finally:
+            with self._lock:
+                subscribers = self._async_subscribers.get(loop, set())
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    self._async_subscribers.pop(loop, None)
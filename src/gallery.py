@@ -0,0 +1,124 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+
+MODEL_NAME = "Facenet"
+
+
+@contextmanager
+def atomic_path(path):
+    """Yield a temporary path next to path and move it into place on success."""
+    base, ext = os.path.splitext(path)
+    tmp_path = f"{base}.tmp{os.getpid()}{ext}"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def metadata_path_for(gallery_path):
+    """The JSON sidecar holding names and metadata for a .npy gallery."""
+    return os.path.splitext(gallery_path)[0] + ".json"
+
+
+def gallery_fingerprint(names, embeddings):
+    """Hash of the gallery rows, recorded with a calibration to tell when it goes stale."""
+    digest = hashlib.sha1("\n".join(map(str, names)).encode())
+    digest.update(np.ascontiguousarray(embeddings, dtype=np.float32).data)
+    return digest.hexdigest()
+
+
+def save_gallery(gallery_path, names, embeddings, **metadata):
+    """Write the gallery as a raw float32 .npy matrix plus a JSON sidecar.
+
+    Row i of the matrix belongs to names[i]. Each file is written to a
+    temporary path and moved into place, so neither is ever half-written.
+    The matrix goes first and the sidecar records the fingerprint of both,
+    so a reader that catches the new matrix with the old sidecar is told
+    (see load_gallery) instead of pairing names with the wrong rows.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if embeddings.ndim != 2:
+        embeddings = embeddings.reshape(len(names), -1)
+    embeddings = np.ascontiguousarray(embeddings)
+    metadata = {
+        "model_name": MODEL_NAME,
+        "dim": int(embeddings.shape[1]),
+        "count": len(names),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        **metadata,
+        "fingerprint": gallery_fingerprint(names, embeddings),
+        "names": list(names),
+    }
+    with atomic_path(gallery_path) as tmp_path:
+        np.save(tmp_path, embeddings)
+    with atomic_path(metadata_path_for(gallery_path)) as tmp_path:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(metadata, f, indent=1)
+
+
+def load_gallery(gallery_path, mmap=True, attempts=3):
+    """Return (names, embeddings, metadata).
+
+    With mmap=True the matrix is memory-mapped read-only, so startup does
+    not copy it and every process on the machine shares the same pages.
+    The matrix is checked against the sidecar's fingerprint (one pass over
+    it); a mismatch while save_gallery is swapping the files is retried,
+    anything else raises ValueError.
+    """
+    for attempt in range(attempts):
+        with open(metadata_path_for(gallery_path), encoding="utf-8") as f:
+            metadata = json.load(f)
+        names = metadata.pop("names")
+        embeddings = np.load(gallery_path, mmap_mode="r" if mmap else None)
+        if embeddings.dtype == np.float32 and embeddings.shape == (len(names), metadata["dim"]) and (
+                # Galleries written before fingerprints can only be checked by shape
+                "fingerprint" not in metadata or metadata["fingerprint"] == gallery_fingerprint(names, embeddings)):
+            return names, embeddings, metadata
+        if attempt + 1 < attempts:
+            time.sleep(0.2)
+    raise ValueError(f"Gallery {gallery_path} does not match its metadata")
+
+
+def update_metadata(gallery_path, **metadata):
+    """Add or replace metadata fields of an existing gallery without touching its matrix."""
+    path = metadata_path_for(gallery_path)
+    with open(path, encoding="utf-8") as f:
+        current = json.load(f)
+    names = current.pop("names")
+    current.update(metadata)
+    current["names"] = names
+    with atomic_path(path) as tmp_path:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=1)
+
+
+def convert_pickle(pickle_path, gallery_path):
+    """Convert a known_faces.pkl DataFrame (Name, Embedding) to the gallery format."""
+    import pandas as pd
+
+    df = pd.read_pickle(pickle_path)
+    embeddings = np.stack(df["Embedding"].tolist()) if len(df) else np.empty((0, 0))
+    save_gallery(gallery_path, df["Name"].tolist(), embeddings, source=os.path.basename(pickle_path))
+    return len(df)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert known_faces.pkl to the memory-mappable gallery format.")
+    parser.add_argument("--pickle", default="../known_faces.pkl")
+    parser.add_argument("--output", default="../known_faces.npy")
+    args = parser.parse_args()
+    count = convert_pickle(args.pickle, args.output)
+    print(f"🎉 Converted {count} entries to {args.output} (+ {metadata_path_for(args.output)})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+
+
+def percentiles(seconds):
+    """Latency summary in milliseconds."""
+    ms = np.asarray(seconds, dtype=np.float64) * 1000
+    if not len(ms):
+        return {"count": 0}
+    return {"count": int(len(ms)), "p50": round(float(np.percentile(ms, 50)), 2),
+            "p95": round(float(np.percentile(ms, 95)), 2), "p99": round(float(np.percentile(ms, 99)), 2),
+            "max": round(float(ms.max()), 2)}
+
+
+async def _open(host, port, method, path):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n".encode())
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    while (await reader.readline()) not in (b"\r\n", b""):
+        pass
+    return reader, writer, status
+
+
+async def count_stream(host, port, path, marker, until, stats):
+    """Hold one streaming connection open and count occurrences of marker (frames or events)."""
+    start = time.monotonic()
+    try:
+        reader, writer, status = await _open(host, port, "GET", path)
+        if status != 200:
+            raise ConnectionError(f"HTTP {status}")
+        count, first, tail = 0, None, b""
+        while time.monotonic() < until:
+            try:
+                data = await asyncio.wait_for(reader.read(65536), until - time.monotonic())
+            except asyncio.TimeoutError:
+                break
+            if not data:
+                raise ConnectionError("closed by server")
+            # Keep a tail so a marker split across two reads is still counted once
+            seen = (tail + data).count(marker)
+            if seen and first is None:
+                first = time.monotonic() - start
+            count += seen
+            tail = (tail + data)[-(len(marker) - 1):]
+        writer.close()
+        stats["counts"].append(count / max(until - start, 1e-9))
+        if first is not None:
+            stats["first"].append(first)
+    except (OSError, ConnectionError, ValueError, IndexError) as e:
+        stats["errors"].append(str(e))
+
+
+async def api_client(host, port, paths, until, stats):
+    """Request the API paths in turn, one connection per request, until the deadline."""
+    i = 0
+    while time.monotonic() < until:
+        method, path = paths[i % len(paths)]
+        i += 1
+        start = time.monotonic()
+        try:
+            reader, writer, status = await _open(host, port, method, path)
+            await reader.read()
+            writer.close()
+            if status >= 500:
+                raise ConnectionError(f"HTTP {status} for {path}")
+            stats["latency"].append(time.monotonic() - start)
+        except (OSError, ConnectionError, ValueError, IndexError) as e:
+            stats["errors"].append(str(e))
+            await asyncio.sleep(0.1)
+
+
+async def run(host, port, viewers, sse, api, duration, camera):
+    until = time.monotonic() + duration
+    video = {"counts": [], "first": [], "errors": []}
+    events = {"counts": [], "first": [], "errors": []}
+    calls = {"latency": [], "errors": []}
+    paths = [("GET", f"/get_latest_name?camera={camera}"), ("POST", f"/mark_attendance?camera={camera}"),
+             ("GET", "/pipeline_stats"), ("GET", "/reports/days")]
+    tasks = [count_stream(host, port, f"/video_feed/{camera}", b"--frame", until, video) for _ in range(viewers)]
+    tasks += [count_stream(host, port, "/events", b"\n\n", until, events) for _ in range(sse)]
+    tasks += [api_client(host, port, paths, until, calls) for _ in range(api)]
+    await asyncio.gather(*tasks)
+    fps = np.asarray(video["counts"])
+    return {
+        "config": {"viewers": viewers, "sse": sse, "api": api, "duration": duration},
+        "video": {
+            "connected": len(fps),
+            "errors": len(video["errors"]),
+            "fps_p5": round(float(np.percentile(fps, 5)), 2) if len(fps) else None,
+            "fps_p50": round(float(np.percentile(fps, 50)), 2) if len(fps) else None,
+            "first_frame": percentiles(video["first"]),
+        },
+        "events": {"connected": len(events["counts"]), "errors": len(events["errors"])},
+        "api": {**percentiles(calls["latency"]), "errors": len(calls["errors"]),
+                "requests_per_sec": round(len(calls["latency"]) / duration, 1)},
+        "sample_errors": (video["errors"] + events["errors"] + calls["errors"])[:5],
+    }
+
+
+async def wait_for_server(host, port, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return True
+        except OSError:
+            await asyncio.sleep(0.5)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the dashboard: MJPEG viewers, event clients and API calls.")
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--viewers", type=int, default=200, help="Concurrent /video_feed connections")
+    parser.add_argument("--sse", type=int, default=100, help="Concurrent /events connections")
+    parser.add_argument("--api", type=int, default=20, help="Clients calling the JSON endpoints back to back")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds")
+    parser.add_argument("--camera", type=int, default=0)
+    parser.add_argument("--serve", action="store_true",
+                        help="Start asgi.py on a fake camera (CAMERA_SOURCES=fake) for the test and stop it after")
+    parser.add_argument("--output", help="Also write the results as JSON")
+    args = parser.parse_args()
+
+    url = urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+    server = None
+    if args.serve:
+        env = {**os.environ, "CAMERA_SOURCES": os.environ.get("CAMERA_SOURCES", "fake")}
+        server = subprocess.Popen([sys.executable, "asgi.py", "--host", host, "--port", str(port)], env=env,
+                                  cwd=os.path.dirname(os.path.abspath(__file__)))
+    try:
+        if not asyncio.run(wait_for_server(host, port, 120)):
+            print(f"❌ Nothing is listening on {host}:{port}")
+            return
+        print(f"🚦 {args.viewers} viewers, {args.sse} event clients and {args.api} API clients "
+              f"against {args.url} for {args.duration:.0f}s")
+        result = asyncio.run(run(host, port, args.viewers, args.sse, args.api, args.duration, args.camera))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(10)
+
+    v, a = result["video"], result["api"]
+    print(f"🎥 {v['connected']}/{args.viewers} viewers: {v['fps_p50']} fps median, {v['fps_p5']} fps p5, "
+          f"first frame p95 {v['first_frame'].get('p95')} ms, {v['errors']} errors")
+    print(f"📡 {result['events']['connected']}/{args.sse} event clients, {result['events']['errors']} errors")
+    print(f"⚡ API: {a['requests_per_sec']} req/s, p50 {a.get('p50')} ms, p95 {a.get('p95')} ms, "
+          f"p99 {a.get('p99')} ms, {a['errors']} errors")
+    for error in result["sample_errors"]:
+        print(f"   ⚠️ {error}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=1)
+        print(f"🎉 Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+import os
+
+import numpy as np
+
+from ann_index import IVFIndex, index_path_for
+from gallery import load_gallery
+from quantize import QuantizedIndex, quantized_path_for
+
+
+class GalleryMatcher:
+    """Vectorized nearest-neighbour matching against the enrolled gallery.
+
+    The gallery is held as one contiguous float32 matrix with its norms
+    precomputed, so matching any number of probe embeddings is a single
+    matrix product instead of a Python loop over known faces.
+
+    A person may own several rows (representative embeddings). Row distances
+    are then reduced per identity with `aggregate`: "min" (closest row) or
+    "mean_top" (mean of the top_m closest rows). Rows are grouped into a
+    padded (identities, max rows) index table once, so the reduction is a
+    single gather + sort on the distance matrix.
+
+    An optional approximate index (see ann_index.py) or quantized codes with
+    full-precision re-ranking (see quantize.py) can be attached for very
+    large galleries; search() then uses it unless exact=True is passed.
+    """
+
+    def __init__(self, names, embeddings, metric="euclidean", index=None, aggregate="min", top_m=2):
+        if metric not in ("euclidean", "cosine"):
+            raise ValueError(f"Unknown metric: {metric}")
+        if aggregate not in ("min", "mean_top"):
+            raise ValueError(f"Unknown aggregate: {aggregate}")
+        self.metric = metric
+        self.aggregate = aggregate
+        self.top_m = top_m
+        self.names = np.asarray(names, dtype=object)
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.ndim != 2:
+            embeddings = embeddings.reshape(len(self.names), -1)
+        self.embeddings = np.ascontiguousarray(embeddings)
+        self.sq_norms = np.einsum("ij,ij->i", self.embeddings, self.embeddings)
+        self.norms = np.sqrt(self.sq_norms)
+        self.index = index
+        self.metadata = {}
+        self._group_rows()
+
+    def _group_rows(self):
+        """Build the identity -> rows table used to aggregate row distances."""
+        self.identities, labels = np.unique(self.names.astype(str), return_inverse=True)
+        self.identities = self.identities.astype(object)
+        counts = np.bincount(labels, minlength=len(self.identities))
+        self.max_per_identity = int(counts.max()) if len(counts) else 0
+        self._groups = None
+        if self.max_per_identity <= 1:
+            return
+        # groups[i, j] is the j-th row of identity i, or the padding column len(self)
+        order = np.argsort(labels, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        slots = np.arange(self.max_per_identity)[None, :]
+        rows = order[np.minimum(offsets[:, None] + slots, len(order) - 1)]
+        self._groups = np.where(slots < counts[:, None], rows, len(self.names))
+
+    @classmethod
+    def load(cls, path, metric="euclidean", use_ann=False, quantized=None, **kwargs):
+        """Load the gallery written by build_database.py (.npy) or a legacy .pkl.
+
+        With use_ann=True the ANN index stored next to the gallery is loaded
+        too; with quantized="sq8" or "pq" the quantized codes are (they take
+        precedence over the ANN index). If either is missing, matching falls
+        back to exact search.
+        """
+        if path.endswith(".pkl"):
+            matcher = cls.from_pickle(path, metric=metric, **kwargs)
+        else:
+            names, embeddings, metadata = load_gallery(path)
+            matcher = cls(names, embeddings, metric=metric, **kwargs)
+            matcher.metadata = metadata
+        if use_ann:
+            matcher.load_index(index_path_for(path))
+        if quantized:
+            matcher.load_quantized(quantized_path_for(path, quantized))
+        return matcher
+
+    @classmethod
+    def from_pickle(cls, path, metric="euclidean", **kwargs):
+        """Load a legacy known_faces.pkl DataFrame (Name, Embedding)."""
+        import pandas as pd
+
+        df = pd.read_pickle(path)
+        embeddings = np.stack(df["Embedding"].tolist()) if len(df) else np.empty((0, 0))
+        return cls(df["Name"].tolist(), embeddings, metric=metric, **kwargs)
+
+    def load_index(self, path):
+        """Attach the ANN index at path, keeping exact search if it cannot be used."""
+        if not os.path.exists(path):
+            print(f"⚠️ ANN index not found at {path}, using exact matching.")
+            return
+        if self.metric != IVFIndex.metric:
+            print(f"⚠️ ANN index only supports {IVFIndex.metric} distance, using exact matching.")
+            return
+        try:
+            index = IVFIndex.load(path, self.embeddings, self.sq_norms)
+        except ValueError as e:
+            print(f"⚠️ {e}, using exact matching.")
+            return
+        if len(index) != len(self) or not np.array_equal(index.names.astype(str), self.names.astype(str)):
+            print(f"⚠️ ANN index at {path} is out of date (run build_database.py), using exact matching.")
+            return
+        self.index = index
+
+    def load_quantized(self, path, rerank=20):
+        """Attach the quantized codes at path, keeping the current search if they cannot be used."""
+        if not os.path.exists(path):
+            print(f"⚠️ Quantized gallery not found at {path}, using {'ANN' if self.index else 'exact'} matching.")
+            return
+        index = QuantizedIndex.load(path, embeddings=self.embeddings, rerank=rerank)
+        if index.metric != self.metric:
+            print(f"⚠️ Quantized gallery was built for {index.metric} distance, not {self.metric}.")
+            return
+        if len(index) != len(self) or not np.array_equal(index.names.astype(str), self.names.astype(str)):
+            print(f"⚠️ Quantized gallery at {path} is out of date (run quantize.py --save).")
+            return
+        self.index = index
+
+    def threshold(self, default):
+        """The calibrated match threshold from the gallery metadata, or default.
+
+        A threshold calibrated for another metric does not apply and is ignored.
+        """
+        calibration = self.metadata.get("calibration", {})
+        if "match_threshold" in self.metadata and calibration.get("metric", "euclidean") == self.metric:
+            return float(self.metadata["match_threshold"])
+        return default
+
+    def __len__(self):
+        return len(self.names)
+
+    def identity_distances(self, probes):
+        """Return (identity names, (n_probes, n_identities) aggregated distances)."""
+        dist = self.distances(probes)
+        if self._groups is None:
+            return self.names, dist
+        padded = np.concatenate([dist, np.full((len(dist), 1), np.inf, dtype=dist.dtype)], axis=1)
+        grouped = padded[:, self._groups]
+        if self.aggregate == "min":
+            return self.identities, grouped.min(axis=2)
+        m = min(self.top_m, self.max_per_identity)
+        closest = np.sort(grouped, axis=2)[:, :, :m]
+        finite = np.isfinite(closest)
+        return self.identities, (np.where(finite, closest, 0).sum(axis=2) / finite.sum(axis=2)).astype(np.float32)
+
+    def distances(self, probes):
+        """Return the (n_probes, n_gallery) distance matrix."""
+        probes = np.atleast_2d(np.asarray(probes, dtype=np.float32))
+        products = probes @ self.embeddings.T
+        if self.metric == "cosine":
+            probe_norms = np.linalg.norm(probes, axis=1)
+            denom = np.maximum(np.outer(probe_norms, self.norms), 1e-12)
+            return 1.0 - products / denom
+
+        # ||p - g||^2 = ||p||^2 - 2 p.g + ||g||^2
+        probe_sq_norms = np.einsum("ij,ij->i", probes, probes)
+        sq_dist = probe_sq_norms[:, None] - 2.0 * products + self.sq_norms[None, :]
+        np.maximum(sq_dist, 0.0, out=sq_dist)
+        return np.sqrt(sq_dist)
+
+    def search(self, probes, k=1, exact=False):
+        """Return (names, distances) of the k closest identities per probe.
+
+        Both arrays have shape (n_probes, k) and are sorted by distance.
+        """
+        if self.index is not None and not exact:
+            return self._index_search(probes, k)
+
+        k = min(k, len(self.identities))
+        if k == 0:
+            n_probes = np.atleast_2d(probes).shape[0]
+            return np.empty((n_probes, 0), dtype=object), np.empty((n_probes, 0), dtype=np.float32)
+        names, dist = self.identity_distances(probes)
+
+        if k < dist.shape[1]:
+            idx = np.argpartition(dist, k - 1, axis=1)[:, :k]
+        else:
+            idx = np.broadcast_to(np.arange(dist.shape[1]), dist.shape).copy()
+        top = np.take_along_axis(dist, idx, axis=1)
+        order = np.argsort(top, axis=1)
+        idx = np.take_along_axis(idx, order, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        return names[idx], top
+
+    def _index_search(self, probes, k):
+        """ANN search over rows, reduced to distinct identities (closest row wins)."""
+        names, dist = self.index.search(probes, k=k * max(self.max_per_identity, 1))
+        if self.max_per_identity <= 1:
+            return names, dist
+        k = min(k, len(self.identities))
+        out_names = np.full((len(names), k), "Unknown", dtype=object)
+        out_dist = np.full((len(names), k), np.inf, dtype=np.float32)
+        for i, (row_names, row_dist) in enumerate(zip(names, dist)):
+            _, first = np.unique(row_names.astype(str), return_index=True)
+            first = np.sort(first)[:k]
+            out_names[i, :len(first)] = row_names[first]
+            out_dist[i, :len(first)] = row_dist[first]
+        return out_names, out_dist
+
+    def identify(self, probes, threshold):
+        """Return the best name per probe, or "Unknown" if it is not within threshold."""
+        names, dist = self.search(probes, k=1)
+        if names.shape[1] == 0:
+            n_probes = names.shape[0]
+            return ["Unknown"] * n_probes, np.full(n_probes, np.inf, dtype=np.float32)
+        best_names, best_dist = names[:, 0], dist[:, 0]
+        return [name if d < threshold else "Unknown" for name, d in zip(best_names, best_dist)], best_dist
@@ -0,0 +1,175 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+
+# Histogram bucket upper bounds in seconds (Prometheus "le" labels)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class StageStats:
+    """Latency/throughput counters for one pipeline stage.
+
+    Keeps a rolling window (for fps and p95 over the last `window` events)
+    and cumulative histogram buckets, drops and errors (for Prometheus).
+    Errors are also counted per exception type.
+    """
+
+    def __init__(self, name, window=100):
+        self.name = name
+        self.count = 0
+        self.dropped = 0
+        self.errors = 0
+        self.error_types = {}
+        self.latency_sum = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self._latencies = deque(maxlen=window)
+        self._times = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency, dropped=0):
+        with self._lock:
+            self.count += 1
+            self.dropped += dropped
+            self.latency_sum += latency
+            self.buckets[bisect_left(LATENCY_BUCKETS, latency)] += 1
+            self._latencies.append(latency)
+            self._times.append(time.monotonic())
+
+    def record_error(self, error=None):
+        with self._lock:
+            self.errors += 1
+            kind = type(error).__name__ if error is not None else "Exception"
+            self.error_types[kind] = self.error_types.get(kind, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            times = list(self._times)
+            count, dropped, errors = self.count, self.dropped, self.errors
+        span = times[-1] - times[0] if len(times) > 1 else 0.0
+        return {
+            "count": count,
+            "dropped": dropped,
+            "errors": errors,
+            "fps": (len(times) - 1) / span if span > 0 else 0.0,
+            "latency_ms_avg": 1000 * sum(latencies) / len(latencies) if latencies else 0.0,
+            "latency_ms_p95": 1000 * latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0,
+        }
+
+    def histogram(self):
+        """(cumulative bucket counts incl. +Inf, sum, count, error types), read consistently."""
+        with self._lock:
+            cumulative, total = [], 0
+            for n in self.buckets:
+                total += n
+                cumulative.append(total)
+            return cumulative, self.latency_sum, self.count, dict(self.error_types)
+
+
+def _labels(labels, **extra):
+    items = {**labels, **extra}
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items.items()) + "}" if items else ""
+
+
+class MetricsRegistry:
+    """Collects StageStats from the pipeline and renders them for /metrics."""
+
+    def __init__(self, prefix="attendance"):
+        self.prefix = prefix
+        self._stages = {}
+        self._values = []
+        self._lock = threading.Lock()
+        self._log_thread = None
+
+    def add(self, stats, **labels):
+        """Register an existing StageStats under its name and labels."""
+        key = (stats.name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self._stages[key] = stats
+        return stats
+
+    def stage(self, name, **labels):
+        """Get or create the StageStats for name and labels."""
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            if key not in self._stages:
+                self._stages[key] = StageStats(name)
+            return self._stages[key]
+
+    def add_values(self, read, **labels):
+        """Register read(), returning {metric: (kind, help, value)}, for counters outside StageStats."""
+        with self._lock:
+            self._values.append((read, labels))
+
+    def _items(self):
+        with self._lock:
+            return sorted(self._stages.items(), key=lambda item: item[0])
+
+    def render(self):
+        """All stages in the Prometheus text exposition format."""
+        p = self.prefix
+        latency, drops, errors, fps, p95 = [], [], [], [], []
+        for (name, labels), stats in self._items():
+            labels = {"stage": name, **dict(labels)}
+            cumulative, total_sum, count, error_types = stats.histogram()
+            for bound, n in zip(LATENCY_BUCKETS + ("+Inf",), cumulative):
+                latency.append(f"{p}_stage_latency_seconds_bucket{_labels(labels, le=bound)} {n}")
+            latency.append(f"{p}_stage_latency_seconds_sum{_labels(labels)} {total_sum:.6f}")
+            latency.append(f"{p}_stage_latency_seconds_count{_labels(labels)} {count}")
+            snapshot = stats.snapshot()
+            drops.append(f"{p}_stage_dropped_total{_labels(labels)} {snapshot['dropped']}")
+            for kind, n in sorted(error_types.items()):
+                errors.append(f"{p}_stage_errors_total{_labels(labels, type=kind)} {n}")
+            fps.append(f"{p}_stage_fps{_labels(labels)} {snapshot['fps']:.3f}")
+            p95.append(f"{p}_stage_latency_p95_seconds{_labels(labels)} {snapshot['latency_ms_p95'] / 1000:.6f}")
+
+        lines = []
+        for metric, kind, text, samples in (
+                ("stage_latency_seconds", "histogram", "Latency of each pipeline stage.", latency),
+                ("stage_dropped_total", "counter", "Frames skipped because a stage fell behind.", drops),
+                ("stage_errors_total", "counter", "Exceptions raised in a stage, by type.", errors),
+                ("stage_fps", "gauge", "Events per second over the recent window.", fps),
+                ("stage_latency_p95_seconds", "gauge", "95th percentile latency over the recent window.", p95)):
+            lines.append(f"# HELP {p}_{metric} {text}")
+            lines.append(f"# TYPE {p}_{metric} {kind}")
+            lines.extend(samples)
+
+        with self._lock:
+            values = list(self._values)
+        # Samples of one metric must be contiguous, even when several sources report it
+        grouped = {}
+        for read, labels in values:
+            for metric, (kind, text, value) in read().items():
+                grouped.setdefault(metric, (kind, text, []))[2].append(f"{p}_{metric}{_labels(labels)} {value}")
+        for metric, (kind, text, samples) in grouped.items():
+            lines.append(f"# HELP {p}_{metric} {text}")
+            lines.append(f"# TYPE {p}_{metric} {kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """One line with fps, p95 latency, drops and errors of every stage."""
+        parts = []
+        for (name, labels), stats in self._items():
+            s = stats.snapshot()
+            label = name + "".join(f"[{v}]" for _, v in labels)
+            part = f"{label} {s['fps']:.1f}fps p95 {s['latency_ms_p95']:.1f}ms"
+            if s["dropped"]:
+                part += f" drop {s['dropped']}"
+            if s["errors"]:
+                part += f" err {s['errors']}"
+            parts.append(part)
+        return " | ".join(parts)
+
+    def start_logging(self, interval):
+        """Print summary() every interval seconds on a background thread."""
+        def run():
+            while True:
+                time.sleep(interval)
+                print(f"[metrics] {self.summary()}")
+
+        if self._log_thread is None:
+            self._log_thread = threading.Thread(target=run, daemon=True)
+            self._log_thread.start()
+        return self
@@ -0,0 +1,72 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from recognition import DETECTOR_BACKEND, MODEL_NAME, detect_faces, embed_faces
+
+
+@contextmanager
+def timed(phases, name):
+    """Record how long the enclosed block took, in seconds, as phases[name]."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases[name] = round(time.perf_counter() - start, 3)
+
+
+class ModelManager:
+    """Loads the detector and recognition models once and warms them up.
+
+    start() does this on a background thread so the web UI can serve while
+    TensorFlow initialises; `ready` tells callers when recognition can run.
+    Every phase is timed and kept in `phases`.
+    """
+
+    def __init__(self, model_name=MODEL_NAME, detector_backend=DETECTOR_BACKEND):
+        self.model_name = model_name
+        self.detector_backend = detector_backend
+        self.phases = {}
+        self.error = None
+        self._ready = threading.Event()
+        self._thread = None
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def start(self):
+        """Load the models in the background; returns immediately."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.load, daemon=True)
+            self._thread.start()
+        return self
+
+    def wait(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def load(self):
+        """Load and warm up the models on the calling thread."""
+        try:
+            with timed(self.phases, "import_deepface"):
+                from deepface import DeepFace
+            with timed(self.phases, "build_" + self.model_name.lower()):
+                DeepFace.build_model(self.model_name)
+            # The first call of each model builds its graph; do it on dummy input now
+            with timed(self.phases, "warmup_" + self.detector_backend):
+                detect_faces(np.zeros((480, 640, 3), dtype=np.uint8), self.detector_backend)
+            with timed(self.phases, "warmup_embedding"):
+                embed_faces([{"face": np.zeros((160, 160, 3), dtype=np.float32)}], self.model_name)
+            self.phases["total"] = round(sum(self.phases.values()), 3)
+            print(f"Models ready: {self.phases}")
+        except Exception as e:
+            self.error = str(e)
+            print(f"Model loading failed: {self.error}")
+        finally:
+            if self.error is None:
+                self._ready.set()
+
+    def status(self):
+        return {"ready": self.ready, "error": self.error, "phases": dict(self.phases)}
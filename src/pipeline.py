@@ -0,0 +1,540 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+from metrics import StageStats
+
+
+class CaptureThread(threading.Thread):
+    """Reads the camera continuously and always holds only the latest frame."""
+
+    def __init__(self, cap, size=(640, 480), on_frame=None):
+        super().__init__(daemon=True)
+        self.cap = cap
+        self.size = size
+        self.on_frame = on_frame
+        self.stats = StageStats("capture")
+        self._frame = None
+        self._captured_at = 0.0
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            start = time.perf_counter()
+            ret, frame = self.cap.read()
+            if ret:
+                frame = cv2.resize(frame, self.size)
+            else:
+                print("Error: Could not read frame.")
+                frame = np.zeros((self.size[1], self.size[0], 3), dtype=np.uint8)
+                cv2.putText(frame, "Webcam Error", (200, 240),
+                            cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+                self.stats.record_error()
+                time.sleep(0.1)  # Don't spin on a dead camera
+
+            with self._cond:
+                self._frame = frame
+                self._captured_at = time.monotonic()
+                self._seq += 1
+                self._cond.notify_all()
+            self.stats.record(time.perf_counter() - start)
+            if self.on_frame is not None:
+                self.on_frame()
+
+    def peek(self):
+        """Return (seq, frame, captured_at) of the latest frame without waiting."""
+        with self._cond:
+            return self._seq, self._frame, self._captured_at
+
+    def wait_for_frame(self, after_seq, timeout=1.0):
+        """Block until a frame newer than after_seq exists; return (seq, frame)."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > after_seq or self._stop_event.is_set(), timeout)
+            return self._seq, self._frame
+
+    def stop(self):
+        self._stop_event.set()
+        with self._cond:
+            self._cond.notify_all()
+
+
+class LoopingCapture:
+    """Plays a video file in a loop at its native frame rate.
+
+    Stands in for a live camera or RTSP stream during development and load
+    tests; exposes the read()/isOpened()/release() subset of VideoCapture.
+    """
+
+    def __init__(self, path):
+        self.cap = cv2.VideoCapture(path)
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.interval = 1.0 / fps if fps and fps > 0 else 1.0 / 30
+        self._next = time.monotonic()
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def read(self):
+        ret, frame = self.cap.read()
+        if not ret:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read()
+        self._next += self.interval
+        delay = self._next - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            self._next = time.monotonic()
+        return ret, frame
+
+    def release(self):
+        self.cap.release()
+
+
+class FakeCapture:
+    """Synthetic camera: a moving bar and a frame counter at a fixed frame rate.
+
+    Needs no device or file, so load tests can run anywhere; exposes the
+    same read()/isOpened()/release() subset of VideoCapture.
+    """
+
+    def __init__(self, fps=30.0, size=(640, 480)):
+        self.interval = 1.0 / fps
+        self.size = size
+        self.count = 0
+        self._next = time.monotonic()
+
+    def isOpened(self):
+        return True
+
+    def read(self):
+        width, height = self.size
+        frame = np.full((height, width, 3), 40, dtype=np.uint8)
+        x = self.count * 8 % width
+        frame[:, x:x + 40] = (200, 120, 40)
+        cv2.putText(frame, f"Fake camera {self.count}", (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+        self.count += 1
+        self._next += self.interval
+        delay = self._next - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            self._next = time.monotonic()
+        return True, frame
+
+    def release(self):
+        pass
+
+
+def open_source(source):
+    """Open a camera source: a device index ("0"), a video file, a stream URL,
+    or "fake" / "fake:<fps>" for a synthetic camera."""
+    source = str(source)
+    if source == "fake" or source.startswith("fake:"):
+        return FakeCapture(float(source.partition(":")[2] or 30))
+    if source.isdigit():
+        return cv2.VideoCapture(int(source))
+    if os.path.exists(source):
+        return LoopingCapture(source)
+    return cv2.VideoCapture(source)
+
+
+class _Subscriber:
+    """Bounded per-viewer frame buffer; the oldest frame is dropped when full."""
+
+    def __init__(self, max_pending):
+        self.frames = deque(maxlen=max_pending)
+        self.dropped = 0
+        self.cond = threading.Condition()
+
+    def put(self, jpeg):
+        with self.cond:
+            if len(self.frames) == self.frames.maxlen:
+                self.dropped += 1
+            self.frames.append(jpeg)
+            self.cond.notify()
+
+    def get(self, timeout=1.0):
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.frames, timeout):
+                return None
+            return self.frames.popleft()
+
+
+class _AsyncSubscriber:
+    """_Subscriber for a viewer served by an asyncio event loop; only touched from that loop."""
+
+    def __init__(self, max_pending):
+        self.frames = deque(maxlen=max_pending)
+        self.dropped = 0
+        self.ready = asyncio.Event()
+
+    def put(self, jpeg):
+        if len(self.frames) == self.frames.maxlen:
+            self.dropped += 1
+        self.frames.append(jpeg)
+        self.ready.set()
+
+    async def get(self):
+        while not self.frames:
+            self.ready.clear()
+            await self.ready.wait()
+        return self.frames.popleft()
+
+
+class FrameBroadcaster:
+    """Fans encoded JPEG frames out to any number of MJPEG viewers.
+
+    publish() never blocks: a viewer that cannot keep up loses its oldest
+    pending frames instead of holding back the encoder or other viewers.
+    Viewers are either threads (stream()) or coroutines on an asyncio event
+    loop (astream()); each loop is woken once per frame and hands it to all
+    of its viewers, so one thread can serve hundreds of them.
+    """
+
+    def __init__(self, max_pending=2):
+        self.max_pending = max_pending
+        self._subscribers = set()
+        self._async_subscribers = {}  # event loop -> its viewers
+        self._lock = threading.Lock()
+        self._dropped_by_departed = 0
+
+    @property
+    def viewer_count(self):
+        with self._lock:
+            return len(self._subscribers) + sum(len(v) for v in self._async_subscribers.values())
+
+    def publish(self, jpeg):
+        with self._lock:
+            subscribers = list(self._subscribers)
+            loops = list(self._async_subscribers)
+        for subscriber in subscribers:
+            subscriber.put(jpeg)
+        for loop in loops:
+            try:
+                loop.call_soon_threadsafe(self._fan_out, loop, jpeg)
+            except RuntimeError:
+                pass  # The loop was closed
+
+    def _fan_out(self, loop, jpeg):
+        with self._lock:
+            subscribers = list(self._async_subscribers.get(loop, ()))
+        for subscriber in subscribers:
+            subscriber.put(jpeg)
+
+    def stream(self):
+        """Yield multipart JPEG chunks for one viewer until it disconnects."""
+        subscriber = _Subscriber(self.max_pending)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        try:
+            while True:
+                jpeg = subscriber.get()
+                if jpeg is not None:
+                    yield (b'--frame\r\n'
+                           b'Content-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n')
+        finally:
+            with self._lock:
+                self._subscribers.discard(subscriber)
+                self._dropped_by_departed += subscriber.dropped
+
+    async def astream(self):
+        """Async version of stream() for ASGI servers; no thread per viewer."""
+        loop = asyncio.get_running_loop()
+        subscriber = _AsyncSubscriber(self.max_pending)
+        with self._lock:
+            self._async_subscribers.setdefault(loop, set()).add(subscriber)
+        try:
+            while True:
+                jpeg = await subscriber.get()
+                yield (b'--frame\r\n'
+                       b'Content-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n')
+        finally:
+            with self._lock:
+                subscribers = self._async_subscribers.get(loop, set())
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    self._async_subscribers.pop(loop, None)
+                self._dropped_by_departed += subscriber.dropped
+
+    def stats(self):
+        with self._lock:
+            subscribers = list(self._subscribers) + [s for v in self._async_subscribers.values() for s in v]
+            dropped = self._dropped_by_departed + sum(s.dropped for s in subscribers)
+            return {"viewers": len(subscribers), "dropped": dropped}
+
+
+class EncoderThread(threading.Thread):
+    """Annotates and JPEG-encodes each captured frame once for all viewers."""
+
+    def __init__(self, capture, inference, draw, broadcaster):
+        super().__init__(daemon=True)
+        self.capture = capture
+        self.inference = inference
+        self.draw = draw
+        self.broadcaster = broadcaster
+        self.draw_stats = StageStats("draw")
+        self.stats = StageStats("encode")
+        self._stop_event = threading.Event()
+
+    def run(self):
+        seq = 0
+        while not self._stop_event.is_set():
+            new_seq, frame = self.capture.wait_for_frame(seq)
+            if new_seq == seq or frame is None:
+                continue
+            dropped = new_seq - seq - 1 if seq else 0
+            seq = new_seq
+            # Nobody is watching, so there is nothing to encode
+            if not self.broadcaster.viewer_count:
+                continue
+            start = time.perf_counter()
+            frame = frame.copy()
+            try:
+                self.draw(frame, self.inference.latest)
+            except Exception as e:
+                print(f"Drawing failed: {str(e)}")
+                self.draw_stats.record_error(e)
+            drawn = time.perf_counter()
+            self.draw_stats.record(drawn - start, dropped)
+            ret, buffer = cv2.imencode(".jpg", frame)
+            if ret:
+                self.broadcaster.publish(buffer.tobytes())
+            else:
+                self.stats.record_error()
+            self.stats.record(time.perf_counter() - drawn, dropped)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+class Camera:
+    """One camera: its capture thread, latest recognition result and viewers.
+
+    recognizer implements prepare(frame) -> (state, faces to embed) and
+    finish(state, embeddings) -> annotations, so the shared InferencePool
+    can batch the embedding step across cameras.
+    """
+
+    def __init__(self, camera_id, source, recognizer, draw, size=(640, 480), max_pending=2):
+        self.id = camera_id
+        self.source = str(source)
+        self.recognizer = recognizer
+        self.capture = CaptureThread(open_source(source), size)
+        self.stats = StageStats("inference")
+        self.detect_stats = StageStats("detect")
+        self.match_stats = StageStats("match")
+        self.broadcaster = FrameBroadcaster(max_pending)
+        self.encoder = EncoderThread(self.capture, self, draw, self.broadcaster)
+        self.last_seq = 0
+        self.busy = False
+        self._result = None
+        self._lock = threading.Lock()
+
+    @property
+    def opened(self):
+        return self.capture.cap.isOpened()
+
+    @property
+    def latest(self):
+        """Most recent recognition result (None before the first one)."""
+        with self._lock:
+            return self._result
+
+    def set_result(self, result):
+        with self._lock:
+            self._result = result
+
+    def mjpeg_stream(self):
+        return self.broadcaster.stream()
+
+    def snapshot(self):
+        return {
+            "source": self.source,
+            "capture": self.capture.stats.snapshot(),
+            "inference": self.stats.snapshot(),
+            "detect": self.detect_stats.snapshot(),
+            "match": self.match_stats.snapshot(),
+            "draw": self.encoder.draw_stats.snapshot(),
+            "encode": self.encoder.stats.snapshot(),
+            "viewers": self.broadcaster.stats(),
+        }
+
+
+class InferencePool:
+    """Worker threads shared by all cameras.
+
+    Each worker claims the newest unprocessed frame of up to max_batch
+    cameras, runs each camera's recognizer.prepare, embeds every face from
+    all claimed frames in one batched model call, and hands the embeddings
+    back to the owning camera's recognizer.finish. A camera is only ever
+    processed by one worker at a time, and older frames are skipped.
+    """
+
+    def __init__(self, cameras, embed, workers=1, max_batch=8, ready=None, on_result=None):
+        self.cameras = cameras
+        self.embed = embed
+        self.max_batch = max_batch
+        self.ready = ready
+        self.on_result = on_result
+        self.stats = StageStats("batch")
+        self.embed_stats = StageStats("embed")
+        self.batch_sizes = deque(maxlen=100)
+        self._cond = threading.Condition()
+        self._stop_event = threading.Event()
+        self._threads = [threading.Thread(target=self._work, daemon=True) for _ in range(workers)]
+        for camera in cameras:
+            camera.capture.on_frame = self.notify
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self.notify()
+
+    def notify(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def _claim(self):
+        """Claim cameras that have a frame newer than the last one processed."""
+        with self._cond:
+            while not self._stop_event.is_set():
+                if self.ready is None or self.ready():
+                    claimed = []
+                    # Serve the cameras that have waited longest first
+                    for camera in sorted(self.cameras, key=lambda c: c.capture.peek()[2]):
+                        seq, frame, captured_at = camera.capture.peek()
+                        if camera.busy or frame is None or seq == camera.last_seq:
+                            continue
+                        camera.busy = True
+                        claimed.append((camera, seq, frame, captured_at))
+                        if len(claimed) == self.max_batch:
+                            break
+                    if claimed:
+                        return claimed
+                self._cond.wait(timeout=0.5)
+            return []
+
+    def _release(self, claimed):
+        with self._cond:
+            for camera, seq, _, _ in claimed:
+                camera.last_seq = seq
+                camera.busy = False
+            self._cond.notify_all()
+
+    def _work(self):
+        while not self._stop_event.is_set():
+            claimed = self._claim()
+            if not claimed:
+                continue
+            start = time.perf_counter()
+            prepared = []
+            for camera, seq, frame, captured_at in claimed:
+                stage_start = time.perf_counter()
+                try:
+                    state, faces = camera.recognizer.prepare(frame)
+                except Exception as e:
+                    print(f"Detection failed on camera {camera.id}: {str(e)}")
+                    camera.detect_stats.record_error(e)
+                    state, faces = None, []
+                camera.detect_stats.record(time.perf_counter() - stage_start)
+                prepared.append((state, faces))
+
+            all_faces = [face for _, faces in prepared for face in faces]
+            embeddings = None
+            if all_faces:
+                stage_start = time.perf_counter()
+                try:
+                    embeddings = self.embed(all_faces)
+                except Exception as e:
+                    print(f"Embedding failed: {str(e)}")
+                    self.embed_stats.record_error(e)
+                self.embed_stats.record(time.perf_counter() - stage_start)
+
+            offset = 0
+            for (camera, seq, frame, captured_at), (state, faces) in zip(claimed, prepared):
+                chunk = embeddings[offset:offset + len(faces)] if embeddings is not None else None
+                offset += len(faces)
+                result = []
+                if state is not None and (chunk is not None or not faces):
+                    stage_start = time.perf_counter()
+                    try:
+                        result = camera.recognizer.finish(state, chunk)
+                    except Exception as e:
+                        print(f"Recognition failed on camera {camera.id}: {str(e)}")
+                        camera.match_stats.record_error(e)
+                    camera.match_stats.record(time.perf_counter() - stage_start)
+                camera.set_result(result)
+                if self.on_result is not None:
+                    self.on_result(camera, result)
+                # Latency is measured from capture to result
+                dropped = seq - camera.last_seq - 1 if camera.last_seq else 0
+                camera.stats.record(time.monotonic() - captured_at, dropped)
+
+            self.batch_sizes.append(len(claimed))
+            self.stats.record(time.perf_counter() - start)
+            self._release(claimed)
+
+    def snapshot(self):
+        sizes = list(self.batch_sizes)
+        stats = self.stats.snapshot()
+        stats["workers"] = len(self._threads)
+        stats["embed"] = self.embed_stats.snapshot()
+        stats["avg_batch_cameras"] = sum(sizes) / len(sizes) if sizes else 0.0
+        return stats
+
+
+class RecognitionServer:
+    """Several cameras served from one process with a shared inference pool.
+
+    make_recognizer(camera_id) builds each camera's recognizer (so stateful
+    detectors and trackers are per camera); draw(frame, annotations)
+    overlays results on the MJPEG stream. Each camera keeps its own capture
+    rate and a single encoder for all of its viewers.
+    """
+
+    def __init__(self, sources, make_recognizer, draw, embed, workers=1, max_batch=8,
+                 size=(640, 480), max_pending=2, ready=None, on_result=None):
+        self.cameras = [Camera(i, source, make_recognizer(i), draw, size, max_pending)
+                        for i, source in enumerate(sources)]
+        self.pool = InferencePool(self.cameras, embed, workers, max_batch, ready, on_result)
+
+    def start(self):
+        for camera in self.cameras:
+            camera.capture.start()
+            camera.encoder.start()
+        self.pool.start()
+
+    def stop(self):
+        self.pool.stop()
+        for camera in self.cameras:
+            camera.capture.stop()
+            camera.encoder.stop()
+
+    def camera(self, camera_id):
+        return self.cameras[camera_id]
+
+    def register(self, registry):
+        """Expose every stage of every camera, plus the shared pool, in a MetricsRegistry."""
+        for camera in self.cameras:
+            for stats in (camera.capture.stats, camera.detect_stats, camera.match_stats, camera.stats,
+                          camera.encoder.draw_stats, camera.encoder.stats):
+                registry.add(stats, camera=camera.id)
+        registry.add(self.pool.embed_stats)
+        registry.add(self.pool.stats)
+
+    def stats(self):
+        return {
+            "cameras": {camera.id: camera.snapshot() for camera in self.cameras},
+            "pool": self.pool.snapshot(),
+        }
@@ -1,42 +1,178 @@
-import cv2
+import argparse
+import json
 import os
-import numpy as np
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
 
-# Load OpenCV's pre-trained Haar Cascade for face detection
-face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+import cv2
 
 # Paths (relative to project root)
-input_dataset_path = "C:/Users/Prarthana/Downloads/dba_39"
 output_dataset_path = "../processed_dataset"
 
-# Create output directory if it doesn't exist
-if not os.path.exists(output_dataset_path):
-    os.makedirs(output_dataset_path)
-
-# Process each batchmate's folder
-for batchmate in os.listdir(input_dataset_path):
-    batchmate_path = os.path.join(input_dataset_path, batchmate)
-    output_batchmate_path = os.path.join(output_dataset_path, batchmate)
-    
-    if not os.path.exists(output_batchmate_path):
-        os.makedirs(output_batchmate_path)
-
-    # Process each image
-    for img_file in os.listdir(batchmate_path):
-        img_path = os.path.join(batchmate_path, img_file)
-        img = cv2.imread(img_path)
-
-        # Convert to grayscale for face detection
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-
-        # Detect faces
-        faces = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
-
-        # Crop and save each detected face
-        for i, (x, y, w, h) in enumerate(faces):
-            face = img[y:y+h, x:x+w]  # Crop the face
-            face_resized = cv2.resize(face, (224, 224))  # Resize to 224x224
-            output_path = os.path.join(output_batchmate_path, f"{img_file.split('.')[0]}_face{i}.jpg")
-            cv2.imwrite(output_path, face_resized)
-
-print("Preprocessing complete! Check the 'processed_dataset' folder.")
\ No newline at end of file
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+# Loaded once per worker process
+_face_cascade = None
+
+
+def haar_faces(img, size):
+    """Crop faces with OpenCV's pre-trained Haar cascade."""
+    global _face_cascade
+    if _face_cascade is None:
+        _face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+    # Convert to grayscale for face detection
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    faces = _face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
+    return [cv2.resize(img[y:y + h, x:x + w], (size, size)) for (x, y, w, h) in faces]
+
+
+def mtcnn_faces(img, size):
+    """Aligned face crops from the detector used at recognition time."""
+    from recognition import detect_faces
+
+    crops = []
+    for face in detect_faces(img, "mtcnn"):
+        # DeepFace crops are RGB in [0, 1]
+        crop = (face["face"][:, :, ::-1] * 255).clip(0, 255).astype("uint8")
+        crops.append(cv2.resize(crop, (size, size)))
+    return crops
+
+
+def process_image(job):
+    """Crop and save every face of one image. Runs in a worker process.
+
+    Returns (source path, written paths, error message or None).
+    """
+    img_path, output_dir, detector, size = job
+    img = cv2.imread(img_path)
+    if img is None:
+        return img_path, [], "Could not read image"
+    try:
+        crops = mtcnn_faces(img, size) if detector == "mtcnn" else haar_faces(img, size)
+        stem = os.path.splitext(os.path.basename(img_path))[0]
+        outputs = []
+        for i, face in enumerate(crops):
+            output_path = os.path.join(output_dir, f"{stem}_face{i}.jpg")
+            if not cv2.imwrite(output_path, face):
+                raise OSError(f"Could not write {output_path}")
+            outputs.append(output_path)
+        return img_path, outputs, None
+    except Exception as e:
+        return img_path, [], str(e)
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def is_up_to_date(entry, img_path):
+    """Whether img_path is unchanged since its outputs in the manifest were written."""
+    if entry is None:
+        return False
+    stat = os.stat(img_path)
+    return (entry["mtime"] == stat.st_mtime_ns and entry["size"] == stat.st_size
+            and all(os.path.exists(p) for p in entry["outputs"]))
+
+
+def preprocess(input_path, output_path, workers=None, detector="haar", size=224, force=False, manifest_path=None):
+    manifest_path = manifest_path or os.path.join(output_path, "manifest.json")
+    previous = load_manifest(manifest_path)
+    # Crops from another detector or size are not up to date
+    same_config = previous.get("detector") == detector and previous.get("size") == size
+    previous_files = previous.get("files", {})
+    files = dict(previous_files) if same_config and not force else {}
+
+    jobs, skipped = [], 0
+    for batchmate in sorted(os.listdir(input_path)):
+        batchmate_path = os.path.join(input_path, batchmate)
+        if not os.path.isdir(batchmate_path):
+            continue
+        output_batchmate_path = os.path.join(output_path, batchmate)
+        os.makedirs(output_batchmate_path, exist_ok=True)
+        for img_file in sorted(os.listdir(batchmate_path)):
+            if not img_file.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            img_path = os.path.join(batchmate_path, img_file)
+            if is_up_to_date(files.get(img_path), img_path):
+                skipped += 1
+            else:
+                jobs.append((img_path, output_batchmate_path, detector, size))
+    print(f"📂 {len(jobs) + skipped} images: {skipped} up to date, {len(jobs)} to process")
+
+    failures, no_face, faces = [], [], 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for img_path, outputs, error in pool.map(process_image, jobs, chunksize=8):
+            # Crops from an earlier run that this run did not rewrite are stale
+            for old in previous_files.get(img_path, {}).get("outputs", []):
+                if old not in outputs and os.path.exists(old):
+                    os.remove(old)
+            if error:
+                print(f"❌ {img_path}: {error}")
+                failures.append({"path": img_path, "error": error})
+                files.pop(img_path, None)
+                continue
+            if not outputs:
+                no_face.append(img_path)
+            faces += len(outputs)
+            stat = os.stat(img_path)
+            files[img_path] = {"mtime": stat.st_mtime_ns, "size": stat.st_size, "outputs": outputs}
+    elapsed = time.perf_counter() - start
+
+    # Forget images that were deleted from the input folder, and their crops
+    removed = 0
+    for img_path, entry in previous_files.items():
+        if os.path.exists(img_path):
+            continue
+        files.pop(img_path, None)
+        for old in entry.get("outputs", []):
+            if os.path.exists(old):
+                os.remove(old)
+        removed += 1
+    manifest = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "input": input_path,
+        "output": output_path,
+        "detector": detector,
+        "size": size,
+        "processed": len(jobs),
+        "skipped": skipped,
+        "removed": removed,
+        "failed": len(failures),
+        "faces": faces,
+        "elapsed_sec": round(elapsed, 3),
+        "images_per_sec": round(len(jobs) / elapsed, 3) if elapsed > 0 else None,
+        "failures": failures,
+        "no_face": no_face,
+        "files": files,
+    }
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+
+    print(f"⏱️ Processed {len(jobs)} images in {elapsed:.1f}s "
+          f"({manifest['images_per_sec'] or 0:.2f} images/sec): {faces} faces, "
+          f"{len(no_face)} without a face, {len(failures)} failed, {removed} deleted photos forgotten")
+    print(f"Preprocessing complete! Check the '{output_path}' folder (manifest: {manifest_path}).")
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crop faces from the raw dataset into processed_dataset.")
+    parser.add_argument("--input", required=True, help="Folder with one sub-folder per person")
+    parser.add_argument("--output", default=output_dataset_path)
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--detector", default="haar", choices=["haar", "mtcnn"],
+                        help="mtcnn uses the same detector and alignment as recognition")
+    parser.add_argument("--size", type=int, default=224, help="Side of the saved square crops")
+    parser.add_argument("--force", action="store_true", help="Reprocess images that are up to date")
+    parser.add_argument("--manifest", default=None, help="Default: <output>/manifest.json")
+    args = parser.parse_args()
+    preprocess(args.input, args.output, args.workers, args.detector, args.size, args.force, args.manifest)
+
+
+if __name__ == "__main__":
+    main()
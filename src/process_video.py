@@ -0,0 +1,176 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import cv2
+
+from attendance_store import open_store
+from slots import get_lecture_slot, is_on_time
+
+# Set in each worker process by _init_worker
+_recognizer = None
+_cascade = None
+
+
+def _init_worker(gallery_path, threshold, use_cascade):
+    """Load the gallery and models once per worker process."""
+    global _recognizer, _cascade
+    from cascade import DetectorCascade
+    from matcher import GalleryMatcher
+    from models import ModelManager
+    from recognition import FrameRecognizer
+
+    matcher = GalleryMatcher.load(gallery_path)
+    _cascade = DetectorCascade() if use_cascade else None
+    _recognizer = FrameRecognizer(matcher, matcher.threshold(threshold), detector=_cascade.detect if _cascade else None)
+    ModelManager().load()
+
+
+def _resize(frame, max_side=640):
+    """Shrink frame so its longer side is max_side, keeping the aspect ratio."""
+    scale = max_side / max(frame.shape[:2])
+    if scale >= 1:
+        return frame
+    return cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+
+def process_chunk(job):
+    """Recognize faces in frames [start, end) of a video.
+
+    Frames are sampled every `idle_step` frames while nobody is in view and
+    every `busy_step` frames after a face was seen; skipped frames are only
+    grabbed, not decoded into images. Returns the sightings as
+    (video msec, name, distance) plus frame counters.
+    """
+    video_path, start, end, idle_step, busy_step, fps = job
+    # The motion gate compares with the previous frame, which belongs to whatever chunk this worker ran last
+    if _cascade is not None:
+        _cascade.reset()
+    cap = cv2.VideoCapture(video_path)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    sightings = []
+    stats = {"frames": 0, "sampled": 0, "faces": 0, "errors": 0}
+    next_sample = start
+    for index in range(start, end):
+        if not cap.grab():
+            break
+        stats["frames"] += 1
+        if index < next_sample:
+            continue
+        ret, frame = cap.retrieve()
+        if not ret:
+            break
+        # The container's clock, not the frame index: phone videos are often variable frame rate
+        msec = cap.get(cv2.CAP_PROP_POS_MSEC) or index * 1000.0 / fps
+        stats["sampled"] += 1
+        try:
+            faces = _recognizer.update(_resize(frame))
+        except Exception as e:
+            print(f"Detection failed at frame {index}: {str(e)}")
+            stats["errors"] += 1
+            faces = []
+        stats["faces"] += len(faces)
+        for face in faces:
+            if face["name"] != "Unknown":
+                sightings.append((msec, face["name"], face["distance"]))
+        next_sample = index + (busy_step if faces else idle_step)
+    cap.release()
+    return sightings, stats
+
+
+def first_sightings(sightings, min_hits, start_time):
+    """The earliest sighting of each name in each lecture slot.
+
+    Sightings outside lecture hours are dropped first, and a name must be
+    seen in at least min_hits sampled frames of a slot to count for it.
+    Returns {(name, slot): (wall-clock time, distance)}.
+    """
+    hits, first = {}, {}
+    for msec, name, distance in sorted(sightings):
+        seen_at = (start_time + timedelta(milliseconds=msec)).replace(microsecond=0)
+        slot = get_lecture_slot(seen_at)
+        if not slot:
+            continue
+        hits[name, slot] = hits.get((name, slot), 0) + 1
+        first.setdefault((name, slot), (seen_at, distance))
+    return {key: first[key] for key in first if hits[key] >= min_hits}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mark attendance from a recorded video, faster than real time.")
+    parser.add_argument("video")
+    parser.add_argument("--start", help="Wall-clock time of the first frame, 'YYYY-MM-DD HH:MM:SS' "
+                                        "(default: file modification time minus the video length)")
+    parser.add_argument("--gallery", default="../known_faces.npy")
+    parser.add_argument("--db", default="../attendance.db")
+    parser.add_argument("--threshold", type=float, default=1.2, help="Used when the gallery is not calibrated")
+    parser.add_argument("--sample-fps", type=float, default=2.0, help="Sampling rate while no face is in view")
+    parser.add_argument("--busy-fps", type=float, default=5.0, help="Sampling rate while faces are in view")
+    parser.add_argument("--min-hits", type=int, default=2, help="Sampled frames a person must appear in")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--no-cascade", action="store_true", help="Run MTCNN on every sampled frame")
+    parser.add_argument("--dry-run", action="store_true", help="Print the rows without writing them")
+    args = parser.parse_args()
+
+    cap = cv2.VideoCapture(args.video)
+    if not cap.isOpened():
+        print(f"Error: Could not open {args.video}.")
+        return
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    if total <= 0:
+        # Some streams and containers do not report a length, and chunking needs one
+        print(f"Error: {args.video} does not report its frame count, so it cannot be split into chunks.")
+        return
+    duration = total / fps
+    if args.start:
+        start_time = datetime.strptime(args.start, "%Y-%m-%d %H:%M:%S")
+    else:
+        start_time = datetime.fromtimestamp(os.path.getmtime(args.video)) - timedelta(seconds=duration)
+
+    idle_step = max(1, round(fps / args.sample_fps))
+    busy_step = max(1, round(fps / args.busy_fps))
+    # More chunks than workers so a chunk full of faces does not hold up the rest
+    n_chunks = max(1, min(args.workers * 4, total // (idle_step * 10) or 1))
+    bounds = [total * i // n_chunks for i in range(n_chunks + 1)]
+    jobs = [(args.video, bounds[i], bounds[i + 1], idle_step, busy_step, fps) for i in range(n_chunks)]
+    print(f"🎞️ {args.video}: {total} frames at {fps:.1f} fps ({duration:.0f}s), "
+          f"{n_chunks} chunks on {args.workers} workers")
+
+    start = time.perf_counter()
+    sightings = []
+    totals = {"frames": 0, "sampled": 0, "faces": 0, "errors": 0}
+    with ProcessPoolExecutor(args.workers, initializer=_init_worker,
+                             initargs=(args.gallery, args.threshold, not args.no_cascade)) as pool:
+        for chunk_sightings, stats in pool.map(process_chunk, jobs):
+            sightings.extend(chunk_sightings)
+            for key in totals:
+                totals[key] += stats[key]
+    elapsed = time.perf_counter() - start
+
+    store = None if args.dry_run else open_store(args.db)
+    marked = 0
+    firsts = first_sightings(sightings, args.min_hits, start_time)
+    outside = {name for _, name, _ in sightings} - {name for name, _ in firsts}
+    for (name, slot), (seen_at, distance) in sorted(firsts.items(), key=lambda x: x[1]):
+        status = "On Time" if is_on_time(seen_at, slot) else "Late"
+        if store is None or store.mark_once(name, seen_at, status, slot):
+            marked += 1
+            print(f"{name},{seen_at},{status},{slot} (distance {distance:.2f})")
+        else:
+            print(f"{name}: already marked in {slot}")
+    for name in sorted(outside):
+        print(f"{name}: not seen often enough during lecture hours, not marked")
+
+    rate = totals["frames"] / elapsed if elapsed > 0 else 0.0
+    print(f"⏱️ {totals['frames']} frames ({totals['sampled']} analyzed, {totals['faces']} faces, "
+          f"{totals['errors']} errors) in {elapsed:.1f}s: {rate:.1f} fps, "
+          f"{duration / elapsed if elapsed > 0 else 0.0:.1f}x real time")
+    print(f"🎉 {marked} attendance rows {'found' if args.dry_run else 'written'}")
+
+
+if __name__ == "__main__":
+    main()
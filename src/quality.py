@@ -0,0 +1,95 @@
+import cv2
+import numpy as np
+
+
+def _gray(face_img):
+    """uint8 grayscale from a DeepFace crop (RGB float in [0, 1]) or a BGR uint8 image."""
+    img = np.asarray(face_img)
+    if img.dtype != np.uint8:
+        img = (np.clip(img, 0, 1) * 255).astype(np.uint8)
+    return cv2.cvtColor(img, cv2.COLOR_RGB2GRAY) if img.ndim == 3 else img
+
+
+def face_quality(face, sample_size=112):
+    """Cheap quality measurements of one detected face.
+
+    sharpness is the variance of the Laplacian of the crop resized to
+    sample_size (so it is comparable across face sizes), size the smaller
+    side of the detected box in pixels, brightness the mean gray level, and
+    yaw the horizontal offset of the eyes' midpoint from the box centre as
+    a fraction of the box width (0 = frontal, ~0.5 = profile). yaw is None
+    when the detector gave no eye keypoints.
+    """
+    gray = _gray(face["face"])
+    area = face.get("facial_area", {})
+    size = min(area["w"], area["h"]) if "w" in area else min(gray.shape[:2])
+    sample = cv2.resize(gray, (sample_size, sample_size), interpolation=cv2.INTER_AREA)
+    yaw = None
+    left, right = area.get("left_eye"), area.get("right_eye")
+    if left is not None and right is not None and area.get("w"):
+        mid_x = (left[0] + right[0]) / 2
+        yaw = abs(mid_x - (area["x"] + area["w"] / 2)) / area["w"]
+    return {
+        "sharpness": float(cv2.Laplacian(sample, cv2.CV_64F).var()),
+        "size": int(size),
+        "brightness": float(sample.mean()),
+        "yaw": yaw,
+    }
+
+
+class QualityGate:
+    """Skips faces that are not worth embedding.
+
+    A face passes if it is at least min_size pixels, sharp enough, neither
+    too dark nor overexposed, and (when keypoints are available) not turned
+    too far sideways. score() ranks passing faces so a tracker can keep the
+    best crop of each track.
+    """
+
+    def __init__(self, min_size=40, min_sharpness=30.0, min_brightness=40.0, max_brightness=220.0, max_yaw=0.25):
+        self.min_size = min_size
+        self.min_sharpness = min_sharpness
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        self.max_yaw = max_yaw
+        self.stats = {"checked": 0, "passed": 0, "skipped": 0,
+                      "too_small": 0, "blurry": 0, "too_dark": 0, "too_bright": 0, "side_on": 0}
+
+    def check(self, face):
+        """Return (passed, score, measurements) for one face and count the outcome."""
+        q = face_quality(face)
+        reasons = []
+        if q["size"] < self.min_size:
+            reasons.append("too_small")
+        if q["sharpness"] < self.min_sharpness:
+            reasons.append("blurry")
+        if q["brightness"] < self.min_brightness:
+            reasons.append("too_dark")
+        elif q["brightness"] > self.max_brightness:
+            reasons.append("too_bright")
+        if q["yaw"] is not None and q["yaw"] > self.max_yaw:
+            reasons.append("side_on")
+
+        self.stats["checked"] += 1
+        self.stats["passed" if not reasons else "skipped"] += 1
+        for reason in reasons:
+            self.stats[reason] += 1
+        return not reasons, self.score(q), q
+
+    def score(self, q):
+        """Higher is better: sharpness and size, penalised for pose and bad exposure."""
+        exposure = 1.0 - abs(q["brightness"] - 128.0) / 128.0
+        frontal = 1.0 - min((q["yaw"] or 0.0) / 0.5, 1.0)
+        return float(np.log1p(q["sharpness"]) * np.log1p(q["size"]) * (0.5 + 0.5 * exposure) * (0.5 + 0.5 * frontal))
+
+    def filter(self, faces):
+        """Split faces into (worth embedding, skipped)."""
+        kept, skipped = [], []
+        for face in faces:
+            (kept if self.check(face)[0] else skipped).append(face)
+        return kept, skipped
+
+    def snapshot(self):
+        stats = dict(self.stats)
+        stats["skip_rate"] = stats["skipped"] / stats["checked"] if stats["checked"] else 0.0
+        return stats
@@ -0,0 +1,335 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+from ann_index import _sq_distances, kmeans
+
+KINDS = ("sq8", "pq")
+
+
+def quantized_path_for(gallery_path, kind):
+    """Where the quantized codes for a given gallery file are stored."""
+    return os.path.splitext(gallery_path)[0] + f".{kind}.npz"
+
+
+class ScalarQuantizer:
+    """8-bit scalar quantization: each dimension is mapped to 256 levels
+    between its gallery minimum and maximum (4x smaller than float32)."""
+
+    kind = "sq8"
+    # Rows converted to float at a time; small enough to stay in cache
+    chunk_size = 2048
+
+    def __init__(self, low, scale):
+        self.low = np.asarray(low, dtype=np.float32)
+        self.scale = np.asarray(scale, dtype=np.float32)
+
+    @classmethod
+    def train(cls, embeddings):
+        low, high = embeddings.min(axis=0), embeddings.max(axis=0)
+        return cls(low, np.maximum(high - low, 1e-12) / 255.0)
+
+    def layout(self, codes):
+        return np.ascontiguousarray(codes, dtype=np.uint8)
+
+    def encode(self, embeddings):
+        return np.clip(np.rint((embeddings - self.low) / self.scale), 0, 255).astype(np.uint8)
+
+    def decode(self, codes):
+        return self.low + codes.astype(np.float32) * self.scale
+
+    def prepare(self, probes):
+        """Per-probe terms shared by every gallery row."""
+        return probes * self.scale, probes @ self.low
+
+    def code_sq_norms(self, codes):
+        decoded = self.decode(codes)
+        return np.einsum("ij,ij->i", decoded, decoded)
+
+    def dots(self, prepared, codes):
+        """Dot products of the probes with the decoded rows, without decoding them all."""
+        scaled, offsets = prepared
+        return scaled @ codes.T.astype(np.float32) + offsets[:, None]
+
+    def params(self):
+        return {"low": self.low, "scale": self.scale}
+
+
+class ProductQuantizer:
+    """Product quantization: the vector is split into m sub-vectors and each
+    is replaced by the index of its closest of 256 k-means centroids, so a
+    128-d Facenet embedding takes m bytes (32x smaller than float32 at m=16)."""
+
+    kind = "pq"
+    chunk_size = 65536
+
+    def __init__(self, codebooks):
+        # codebooks[j] holds the centroids of sub-vector j: (m, n_centroids, sub_dim)
+        self.codebooks = np.asarray(codebooks, dtype=np.float32)
+
+    @property
+    def m(self):
+        return self.codebooks.shape[0]
+
+    @classmethod
+    def train(cls, embeddings, m=16, seed=0):
+        dim = embeddings.shape[1]
+        if dim % m:
+            raise ValueError(f"Embedding size {dim} is not divisible into {m} sub-vectors")
+        sub = dim // m
+        n_centroids = min(256, len(embeddings))
+        codebooks = np.zeros((m, n_centroids, sub), dtype=np.float32)
+        for j in range(m):
+            centroids, _ = kmeans(embeddings[:, j * sub:(j + 1) * sub], n_centroids, seed=seed)
+            codebooks[j, :len(centroids)] = centroids
+        return cls(codebooks)
+
+    def layout(self, codes):
+        # Column-major, so the codes of one sub-vector are contiguous for dots()
+        return np.asfortranarray(codes, dtype=np.uint8)
+
+    def _split(self, vectors):
+        return vectors.reshape(len(vectors), self.m, -1)
+
+    def encode(self, embeddings):
+        parts = self._split(np.asarray(embeddings, dtype=np.float32))
+        return np.stack([np.argmin(_sq_distances(parts[:, j], self.codebooks[j]), axis=1)
+                         for j in range(self.m)], axis=1).astype(np.uint8)
+
+    def decode(self, codes):
+        return self.codebooks[np.arange(self.m), codes].reshape(len(codes), -1)
+
+    def prepare(self, probes):
+        """Per-probe lookup table of dot products with every centroid: (n_probes, m, n_centroids)."""
+        return np.einsum("pjd,jcd->pjc", self._split(probes), self.codebooks)
+
+    def code_sq_norms(self, codes):
+        centroid_sq = np.einsum("jcd,jcd->jc", self.codebooks, self.codebooks)
+        return centroid_sq[np.arange(self.m), codes].sum(axis=1)
+
+    def dots(self, table, codes):
+        """Asymmetric dot products: table lookups summed over the sub-vectors."""
+        out = np.zeros((len(table), len(codes)), dtype=np.float32)
+        for j in range(self.m):
+            out += table[:, j].take(codes[:, j], axis=1)
+        return out
+
+    def params(self):
+        return {"codebooks": self.codebooks}
+
+
+QUANTIZERS = {"sq8": ScalarQuantizer, "pq": ProductQuantizer}
+
+
+class QuantizedIndex:
+    """Gallery matching on quantized codes with full-precision re-ranking.
+
+    Probes stay in float32 and are compared with the codes directly
+    (asymmetric distance), so only the small code matrix is scanned. The
+    `rerank` closest rows are then re-scored against the float embeddings,
+    which when loaded through GalleryMatcher are a memory map: only those
+    few rows are ever read. Pass embeddings=None to skip re-ranking.
+
+    Has the same search() as IVFIndex, so GalleryMatcher can use it as its
+    index. For the cosine metric vectors are normalized before quantizing.
+    """
+
+    def __init__(self, names, quantizer, codes, metric="euclidean", embeddings=None, rerank=20):
+        if metric not in ("euclidean", "cosine"):
+            raise ValueError(f"Unknown metric: {metric}")
+        self.names = np.asarray(names, dtype=object)
+        self.quantizer = quantizer
+        self.codes = quantizer.layout(codes)
+        self.code_sq_norms = quantizer.code_sq_norms(self.codes).astype(np.float32)
+        self.metric = metric
+        self.embeddings = embeddings
+        self.rerank = rerank
+
+    @classmethod
+    def build(cls, names, embeddings, kind="sq8", metric="euclidean", rerank=20, **kwargs):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        vectors = _normalize(embeddings) if metric == "cosine" else embeddings
+        quantizer = QUANTIZERS[kind].train(vectors, **kwargs)
+        return cls(names, quantizer, quantizer.encode(vectors), metric, embeddings, rerank)
+
+    @property
+    def kind(self):
+        return self.quantizer.kind
+
+    def __len__(self):
+        return len(self.names)
+
+    def nbytes(self):
+        """Memory used by the codes and quantizer parameters."""
+        return self.codes.nbytes + self.code_sq_norms.nbytes + sum(p.nbytes for p in self.quantizer.params().values())
+
+    def save(self, path):
+        np.savez(path, kind=self.kind, metric=self.metric, names=self.names.astype(str), codes=self.codes,
+                 **self.quantizer.params())
+
+    @classmethod
+    def load(cls, path, embeddings=None, rerank=20):
+        data = np.load(path, allow_pickle=False)
+        kind = str(data["kind"])
+        if kind == "pq":
+            quantizer = ProductQuantizer(data["codebooks"])
+        else:
+            quantizer = ScalarQuantizer(data["low"], data["scale"])
+        return cls(data["names"].astype(object), quantizer, data["codes"], str(data["metric"]), embeddings, rerank)
+
+    def approximate_distances(self, probes):
+        """(n_probes, n_gallery) squared L2 distances from the probes to the decoded codes."""
+        prepared = self.quantizer.prepare(probes)
+        probe_sq = np.einsum("ij,ij->i", probes, probes)
+        out = np.empty((len(probes), len(self)), dtype=np.float32)
+        chunk_size = self.quantizer.chunk_size
+        for start in range(0, len(self), chunk_size):
+            end = min(start + chunk_size, len(self))
+            dots = self.quantizer.dots(prepared, self.codes[start:end])
+            out[:, start:end] = probe_sq[:, None] - 2.0 * dots + self.code_sq_norms[None, start:end]
+        np.maximum(out, 0.0, out=out)
+        return out
+
+    def _to_metric(self, sq_dist):
+        # For unit vectors ||a - b||^2 = 2 - 2 cos, so cosine distance is half the squared L2
+        return sq_dist / 2.0 if self.metric == "cosine" else np.sqrt(sq_dist)
+
+    def _exact(self, probe, rows):
+        """Full-precision distances from one probe to the given gallery rows."""
+        gallery = np.asarray(self.embeddings[rows], dtype=np.float32)
+        if self.metric == "cosine":
+            norms = np.maximum(np.linalg.norm(gallery, axis=1) * np.linalg.norm(probe), 1e-12)
+            return 1.0 - gallery @ probe / norms
+        return np.sqrt(_sq_distances(probe[None, :], gallery)[0])
+
+    def search(self, probes, k=1, rerank=None):
+        """Return (names, distances) of the k nearest rows per probe, like IVFIndex.search."""
+        probes = np.atleast_2d(np.asarray(probes, dtype=np.float32))
+        rerank = self.rerank if rerank is None else rerank
+        k = min(k, len(self))
+        out_names = np.full((len(probes), k), "Unknown", dtype=object)
+        out_dist = np.full((len(probes), k), np.inf, dtype=np.float32)
+        if k == 0 or not len(probes):
+            return out_names, out_dist
+
+        queries = _normalize(probes) if self.metric == "cosine" else probes
+        sq_dist = self.approximate_distances(queries)
+        n_candidates = min(max(k, rerank if self.embeddings is not None else 0), len(self))
+        if n_candidates < len(self):
+            candidates = np.argpartition(sq_dist, n_candidates - 1, axis=1)[:, :n_candidates]
+        else:
+            candidates = np.broadcast_to(np.arange(len(self)), sq_dist.shape)
+
+        for i, probe in enumerate(probes):
+            rows = candidates[i]
+            if self.embeddings is not None and rerank:
+                dist = self._exact(probe, rows)
+            else:
+                dist = self._to_metric(sq_dist[i, rows])
+            top = np.argsort(dist)[:k]
+            out_names[i] = self.names[rows[top]]
+            out_dist[i] = dist[top]
+        return out_names, out_dist
+
+
+def _normalize(vectors):
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def _time_search(search, probes):
+    """Search one probe per call, as the live pipeline does. Returns (names, distances), ms per query."""
+    search(probes[:1])
+    start = time.perf_counter()
+    results = [search(probe[None, :]) for probe in probes]
+    elapsed = time.perf_counter() - start
+    return (np.concatenate([r[0] for r in results]), np.concatenate([r[1] for r in results])), \
+        elapsed * 1000 / len(probes)
+
+
+def evaluate(matcher, index, probes, threshold):
+    """Compare quantized matching with and without re-ranking against the float matcher.
+
+    Returns memory of both representations, ms per query, top-1 agreement
+    with exact search, and how many accept/reject decisions at threshold
+    changed.
+    """
+    probes = np.atleast_2d(np.asarray(probes, dtype=np.float32))
+    exact_index, matcher.index = matcher.index, None
+    (exact_names, exact_dist), exact_ms = _time_search(lambda p: matcher.search(p, k=1), probes)
+    report = {
+        "kind": index.kind,
+        "float_mb": round(matcher.embeddings.nbytes / 1024 / 1024, 3),
+        "quantized_mb": round(index.nbytes() / 1024 / 1024, 3),
+        "exact_ms_per_query": round(exact_ms, 4),
+    }
+    report["memory_ratio"] = round(report["float_mb"] / report["quantized_mb"], 2) if index.nbytes() else None
+
+    exact_accept = exact_dist[:, 0] < threshold
+    for label, rerank in (("adc", 0), ("rerank", index.rerank)):
+        matcher.index = index
+        saved, index.rerank = index.rerank, rerank
+        (names, dist), ms = _time_search(lambda p: matcher.search(p, k=1), probes)
+        index.rerank = saved
+        report[label] = {
+            "ms_per_query": round(ms, 4),
+            "speedup": round(exact_ms / ms, 2) if ms > 0 else None,
+            "top1_agreement": round(float((names[:, 0] == exact_names[:, 0]).mean()), 4),
+            "decisions_changed": int(((dist[:, 0] < threshold) != exact_accept).sum()),
+            "mean_abs_distance_error": round(float(np.abs(dist[:, 0] - exact_dist[:, 0]).mean()), 5),
+        }
+    report["rerank_candidates"] = index.rerank
+    matcher.index = exact_index
+    return report
+
+
+def main():
+    from gallery import atomic_path
+    from matcher import GalleryMatcher
+
+    parser = argparse.ArgumentParser(
+        description="Build quantized gallery codes and report memory, speed and accuracy against float matching.")
+    parser.add_argument("--gallery", default="../known_faces.npy")
+    parser.add_argument("--kind", default="both", choices=KINDS + ("both",))
+    parser.add_argument("--metric", default="euclidean", choices=["euclidean", "cosine"])
+    parser.add_argument("--pq-m", type=int, default=16, help="Sub-vectors per embedding for product quantization")
+    parser.add_argument("--rerank", type=int, default=20, help="Closest rows re-scored with full precision")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--noise", type=float, default=0.3, help="Std of noise added to gallery vectors to make queries")
+    parser.add_argument("--threshold", type=float, default=None, help="Default: the gallery's calibrated threshold, else 1.2")
+    parser.add_argument("--save", action="store_true", help="Write the codes next to the gallery for QUANTIZED_GALLERY")
+    args = parser.parse_args()
+
+    matcher = GalleryMatcher.load(args.gallery, metric=args.metric)
+    threshold = args.threshold if args.threshold is not None else matcher.threshold(1.2)
+    rng = np.random.default_rng(0)
+    picks = rng.integers(0, len(matcher), size=args.queries)
+    probes = matcher.embeddings[picks] + rng.normal(0, args.noise, size=(args.queries, matcher.embeddings.shape[1]))
+    print(f"Gallery size: {len(matcher)} rows of {matcher.embeddings.shape[1]} floats, "
+          f"{args.queries} queries, threshold {threshold:.3f}")
+
+    for kind in (KINDS if args.kind == "both" else (args.kind,)):
+        start = time.perf_counter()
+        kwargs = {"m": args.pq_m} if kind == "pq" else {}
+        index = QuantizedIndex.build(matcher.names, matcher.embeddings, kind, args.metric, args.rerank, **kwargs)
+        built = time.perf_counter() - start
+        report = evaluate(matcher, index, probes, threshold)
+        print(f"\n{kind}: {report['float_mb']} MB -> {report['quantized_mb']} MB "
+              f"({report['memory_ratio']}x smaller), built in {built:.2f}s")
+        print(f"  exact          {report['exact_ms_per_query']:.4f} ms/query")
+        for label in ("adc", "rerank"):
+            r = report[label]
+            name = "codes only" if label == "adc" else f"re-rank top {report['rerank_candidates']}"
+            print(f"  {name:<14} {r['ms_per_query']:.4f} ms/query ({r['speedup']}x), "
+                  f"top-1 agreement {r['top1_agreement']:.2%}, {r['decisions_changed']} accept/reject changes, "
+                  f"distance error {r['mean_abs_distance_error']:.4f}")
+        if args.save:
+            path = quantized_path_for(args.gallery, kind)
+            with atomic_path(path) as tmp_path:
+                index.save(tmp_path)
+            print(f"  💾 Saved to {path}")
+
+
+if __name__ == "__main__":
+    main()
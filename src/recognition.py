@@ -0,0 +1,152 @@
+import argparse
+import os
+import time
+
+import cv2
+import numpy as np
+
+MODEL_NAME = "Facenet"
+DETECTOR_BACKEND = "mtcnn"
+
+
+def _deepface():
+    """Import DeepFace (and TensorFlow) on first use rather than at import time."""
+    from deepface import DeepFace
+    from deepface.modules import preprocessing
+
+    return DeepFace, preprocessing
+
+
+def detect_faces(frame, detector_backend=DETECTOR_BACKEND):
+    """Detect and align every face in a BGR frame.
+
+    Returns DeepFace face objects (RGB "face" crop in [0, 1], "facial_area",
+    "confidence"); an empty list when no face is found.
+    """
+    DeepFace, _ = _deepface()
+    faces = DeepFace.extract_faces(frame, detector_backend=detector_backend,
+                                   enforce_detection=False, align=True)
+    # With enforce_detection=False DeepFace returns the whole frame with zero
+    # confidence when nothing is found
+    return [face for face in faces if face["confidence"] > 0]
+
+
+def embed_faces(faces, model_name=MODEL_NAME):
+    """Embed all face crops with one batched model call. Returns an (N, dim) array."""
+    DeepFace, preprocessing = _deepface()
+    model = DeepFace.build_model(model_name)
+    target_size = model.input_shape
+    batch = []
+    for face in faces:
+        # Same preprocessing as DeepFace.represent: RGB -> BGR, pad/resize, normalize
+        img = face["face"][:, :, ::-1]
+        img = preprocessing.resize_image(img=img, target_size=(target_size[1], target_size[0]))
+        img = preprocessing.normalize_input(img=img, normalization="base")
+        batch.append(img[0])
+    if not batch:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.asarray(model.model(np.stack(batch), training=False), dtype=np.float32)
+
+
+def _face_result(face, name, distance):
+    area = face["facial_area"]
+    return {
+        "box": (area["x"], area["y"], area["w"], area["h"]),
+        "name": name,
+        "distance": float(distance),
+        "facial_area": area,
+    }
+
+
+class FrameRecognizer:
+    """Per-frame detect/embed/identify, split around the embedding step.
+
+    prepare(frame) returns (state, faces to embed) and finish(state,
+    embeddings) the results, so a caller can batch the embedding of several
+    frames (e.g. several cameras) into one model call. With a quality gate
+    (quality.QualityGate), faces that fail it are not embedded or returned.
+    """
+
+    def __init__(self, matcher, threshold, detector_backend=DETECTOR_BACKEND, detector=None, quality=None):
+        self.matcher = matcher
+        self.threshold = threshold
+        self.detector_backend = detector_backend
+        self.detector = detector
+        self.quality = quality
+
+    def prepare(self, frame):
+        faces = self.detector(frame) if self.detector else detect_faces(frame, self.detector_backend)
+        if self.quality is not None:
+            faces, _ = self.quality.filter(faces)
+        return faces, faces
+
+    def finish(self, faces, embeddings):
+        if not faces:
+            return []
+        names, distances = self.matcher.identify(embeddings, self.threshold)
+        return [_face_result(face, name, distance) for face, name, distance in zip(faces, names, distances)]
+
+    def update(self, frame):
+        state, faces = self.prepare(frame)
+        return self.finish(state, embed_faces(faces) if faces else None)
+
+
+def recognize_faces(frame, matcher, threshold, detector_backend=DETECTOR_BACKEND, detector=None):
+    """Detect, embed and identify every face in frame.
+
+    detector, if given, replaces detect_faces (e.g. DetectorCascade.detect).
+    Returns one dict per face with "box" (x, y, w, h), "name", "distance"
+    and the raw "facial_area" from the detector.
+    """
+    return FrameRecognizer(matcher, threshold, detector_backend, detector).update(frame)
+
+
+def _tile_faces(crops, n_faces, cell=160):
+    """Lay n_faces crops out on a grid so one frame holds that many faces."""
+    cols = int(np.ceil(np.sqrt(n_faces)))
+    rows = int(np.ceil(n_faces / cols))
+    frame = np.full((rows * cell, cols * cell, 3), 255, dtype=np.uint8)
+    for i in range(n_faces):
+        r, c = divmod(i, cols)
+        frame[r * cell:(r + 1) * cell, c * cell:(c + 1) * cell] = cv2.resize(crops[i % len(crops)], (cell, cell))
+    return frame
+
+
+def main():
+    from matcher import GalleryMatcher
+
+    parser = argparse.ArgumentParser(description="Measure multi-face recognition throughput.")
+    parser.add_argument("--dataset", default="../processed_dataset")
+    parser.add_argument("--gallery", default="../known_faces.npy")
+    parser.add_argument("--faces", type=int, nargs="+", default=[1, 5, 20])
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+
+    crops = []
+    for person in sorted(os.listdir(args.dataset)):
+        person_path = os.path.join(args.dataset, person)
+        if os.path.isdir(person_path):
+            for img_file in sorted(os.listdir(person_path))[:1]:
+                img = cv2.imread(os.path.join(person_path, img_file))
+                if img is not None:
+                    crops.append(img)
+    if not crops:
+        print(f"⚠️ No images found in {args.dataset}")
+        return
+
+    matcher = GalleryMatcher.load(args.gallery)
+    recognize_faces(crops[0], matcher, threshold=2.5)  # Warm up models
+
+    for n_faces in args.faces:
+        frame = _tile_faces(crops, n_faces)
+        found = 0
+        start = time.perf_counter()
+        for _ in range(args.repeats):
+            found += len(recognize_faces(frame, matcher, threshold=2.5))
+        elapsed = time.perf_counter() - start
+        print(f"{n_faces:>3} faces/frame: {found / args.repeats:.1f} detected, "
+              f"{args.repeats / elapsed:.2f} frames/s, {found / elapsed:.2f} faces/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,74 @@
 import cv2
-import numpy as np
-import pandas as pd
-from deepface import DeepFace
-import csv
-from datetime import datetime, time
-import os
-from collections import defaultdict
+from datetime import datetime
 import winsound
 import time as time_module  # To add a pause between beeps
+from matcher import GalleryMatcher
+from recognition import FrameRecognizer, embed_faces
+from tracker import FaceTracker
+from cascade import DetectorCascade
+from quality import QualityGate
+from embedding_cache import EmbeddingCache
+from models import ModelManager
+from attendance_store import open_store
+from metrics import MetricsRegistry
+from slots import get_lecture_slot, is_late_alert, is_on_time
 
 # Paths
-known_faces_path = "../known_faces.pkl"
-attendance_file = "../attendance.csv"
+known_faces_path = "../known_faces.npy"
+attendance_db = "../attendance.db"
+attendance_file = "../attendance.csv"  # Legacy log, imported into the store once
+
+# Follow faces between detections instead of re-embedding every frame
+USE_TRACKING = True
+
+# Gate MTCNN behind motion detection and a Haar cascade on a downscaled frame
+USE_CASCADE = True
+
+# Skip embedding blurry, tiny, badly lit or side-on faces (tracks keep their best crop)
+USE_QUALITY_GATE = True
+
+# Reuse the embedding of a near-identical crop instead of running Facenet again
+USE_EMBEDDING_CACHE = True
+
+# Match threshold used until the gallery is calibrated (python calibrate.py)
+DEFAULT_MATCH_THRESHOLD = 1.2
+
+# Use the approximate index built by build_database.py (False = exact matching)
+USE_ANN = False
+
+# Match on "sq8" or "pq" gallery codes written by quantize.py --save, re-ranked in full precision (None = float)
+QUANTIZED_GALLERY = None
+
+# Print a one-line per-stage timing summary every N seconds (0 = only at exit)
+METRICS_LOG_INTERVAL = 0
 
 # Load the known faces database
-df = pd.read_pickle(known_faces_path)
-known_embeddings = df["Embedding"].tolist()
-known_names = df["Name"].tolist()
-
-# Lecture slots (in 24-hour format)
-SLOT_1_START = time(8, 0)    # 8:00 AM
-SLOT_1_END = time(11, 0)     # 11:00 AM
-SLOT_1_LATE = time(8, 5)     # 8:05 AM
-SLOT_2_START = time(11, 30)  # 11:30 AM
-SLOT_2_END = time(14, 30)    # 2:30 PM
-SLOT_2_LATE = time(11, 35)   # 11:35 AM
-LATE_SOUND_CUTOFF = time(9, 30)  # 9:30 AM for sound alert
-
-# Track logs per slot per student (date -> name -> slot)
-logged_today = defaultdict(lambda: defaultdict(set))
+matcher = GalleryMatcher.load(known_faces_path, use_ann=USE_ANN, quantized=QUANTIZED_GALLERY)
+MATCH_THRESHOLD = matcher.threshold(DEFAULT_MATCH_THRESHOLD)
+print(f"Match threshold: {MATCH_THRESHOLD:.4f}")
+detector = DetectorCascade().detect if USE_CASCADE else None
+quality_gate = QualityGate() if USE_QUALITY_GATE else None
+# In tracking mode names are voted over each track's history
+if USE_TRACKING:
+    recognizer = FaceTracker(matcher, MATCH_THRESHOLD, detector=detector, quality=quality_gate)
+else:
+    recognizer = FrameRecognizer(matcher, MATCH_THRESHOLD, detector=detector, quality=quality_gate)
+embed = EmbeddingCache() if USE_EMBEDDING_CACHE else embed_faces
+
+# Per-stage latency histograms and exception counts
+metrics = MetricsRegistry()
+capture_stats = metrics.stage("capture")
+detect_stats = metrics.stage("detect")
+embed_stats = metrics.stage("embed")
+match_stats = metrics.stage("match")
+draw_stats = metrics.stage("draw")
+display_stats = metrics.stage("display")
+frame_stats = metrics.stage("frame")
+if METRICS_LOG_INTERVAL:
+    metrics.start_logging(METRICS_LOG_INTERVAL)
+
+# Attendance log (SQLite, shared with the dashboard)
+store = open_store(attendance_db, attendance_file)
 
 # Initialize webcam
 cap = cv2.VideoCapture(0)
@@ -36,80 +76,72 @@ if not cap.isOpened():
     print("Error: Could not open webcam.")
     exit()
 
-print("Starting webcam... Press 'q' to quit.")
+# Build and warm up the models before the first frame instead of on it
+ModelManager().load()
 
-def get_lecture_slot(current_time):
-    """Determine the current lecture slot based on time."""
-    current_t = current_time.time()
-    if SLOT_1_START <= current_t <= SLOT_1_END:
-        return "Slot 1 (8:00-11:00)"
-    elif SLOT_2_START <= current_t <= SLOT_2_END:
-        return "Slot 2 (11:30-14:30)"
-    return None
-
-def is_on_time(current_time, slot):
-    """Check if the student is on time for the slot."""
-    current_t = current_time.time()
-    if slot == "Slot 1 (8:00-11:00)":
-        return current_t <= SLOT_1_LATE
-    elif slot == "Slot 2 (11:30-14:30)":
-        return current_t <= SLOT_2_LATE
-    return False
+print("Starting webcam... Press 'q' to quit.")
 
 while True:
+    frame_start = time_module.perf_counter()
     ret, frame = cap.read()
     if not ret:
         print("Error: Could not read frame.")
+        capture_stats.record_error()
         break
+    capture_stats.record(time_module.perf_counter() - frame_start)
 
     try:
         # Resize frame for faster processing
         frame = cv2.resize(frame, (640, 480))
 
-        # Extract embedding and face coordinates using OpenCV detector
-        result = DeepFace.represent(frame, model_name="Facenet", enforce_detection=True, detector_backend="mtcnn")
-        embedding = result[0]["embedding"]
-        face_coords = result[0]["facial_area"]
-
-        # Compare with known embeddings
-        distances = [np.linalg.norm(embedding - known_emb) for known_emb in known_embeddings]
-        min_distance_idx = np.argmin(distances)
-        min_distance = distances[min_distance_idx]
-        threshold = 1.2  # Adjust if needed
-        name = known_names[min_distance_idx] if min_distance < threshold else "Unknown"
-
-        # Debug info
-        print(f"Closest match: {known_names[min_distance_idx]}, Distance: {min_distance:.2f}, Threshold: {threshold}")
-
-        # Draw bounding box and label
-        x, y, w, h = face_coords["x"], face_coords["y"], face_coords["w"], face_coords["h"]
-        color = (0, 255, 0) if name != "Unknown" else (0, 0, 255)
-        cv2.rectangle(frame, (x, y), (x + w, y + h), color, 2)
-        cv2.putText(frame, f"{name} ({min_distance:.2f})", (x, y - 10), 
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
-
-        # Log attendance (one per slot)
+        # Detect every face, embed them in one batch and match them together
+        stage_start = time_module.perf_counter()
+        state, crops = recognizer.prepare(frame)
+        detect_stats.record(time_module.perf_counter() - stage_start)
+        stage_start = time_module.perf_counter()
+        embeddings = embed(crops) if crops else None
+        if crops:
+            embed_stats.record(time_module.perf_counter() - stage_start)
+        stage_start = time_module.perf_counter()
+        faces = recognizer.finish(state, embeddings)
+        match_stats.record(time_module.perf_counter() - stage_start)
+        if not faces:
+            # An empty frame is normal, not a failure, so it is not counted as an error
+            cv2.putText(frame, "No face detected", (10, 60),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
+
         current_time = datetime.now()
-        current_date = current_time.strftime("%Y-%m-%d")
         slot = get_lecture_slot(current_time)
 
-        if name != "Unknown" and slot and slot not in logged_today[current_date][name]:
+        draw_time = 0.0
+        for face in faces:
+            name, distance = face["name"], face["distance"]
+
+            # Debug info
+            print(f"Match: {name}, Distance: {distance:.2f}, Threshold: {MATCH_THRESHOLD}")
+
+            # Draw bounding box and label
+            stage_start = time_module.perf_counter()
+            x, y, w, h = face["box"]
+            color = (0, 255, 0) if name != "Unknown" else (0, 0, 255)
+            cv2.rectangle(frame, (x, y), (x + w, y + h), color, 2)
+            cv2.putText(frame, f"{name} ({distance:.2f})", (x, y - 10), 
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
+            draw_time += time_module.perf_counter() - stage_start
+
+            # Log attendance (one per slot; the store dedups across restarts and processes)
             status = "On Time" if is_on_time(current_time, slot) else "Late"
-            with open(attendance_file, "a", newline="") as f:
-                writer = csv.writer(f)
-                if os.path.getsize(attendance_file) == 0:
-                    writer.writerow(["Name", "Timestamp", "Status", "Lecture Slot"])
-                writer.writerow([name, current_time.strftime("%Y-%m-%d %H:%M:%S"), status, slot])
-            print(f"Attendance logged for {name}: {status} - {slot}")
-            logged_today[current_date][name].add(slot)
-
-            # Sound alert for latecomers after 9:30 AM in Slot 1
-            if slot == "Slot 1 (8:00-11:00)" and status == "Late" and current_time.time() >= LATE_SOUND_CUTOFF:
-                # Double beep: softer tone (500 Hz), 200 ms each, with a 100 ms pause
-                winsound.Beep(500, 200)
-                time_module.sleep(0.1)  # Pause between beeps
-                winsound.Beep(500, 200)
-                print("Latecomer alert sounded!")
+            if name != "Unknown" and slot and store.mark_once(name, current_time, status, slot):
+                print(f"Attendance logged for {name}: {status} - {slot}")
+
+                # Sound alert for latecomers after 9:30 AM in Slot 1
+                if is_late_alert(current_time, slot, status):
+                    # Double beep: softer tone (500 Hz), 200 ms each, with a 100 ms pause
+                    winsound.Beep(500, 200)
+                    time_module.sleep(0.1)  # Pause between beeps
+                    winsound.Beep(500, 200)
+                    print("Latecomer alert sounded!")
+        draw_stats.record(draw_time)
 
         # Display current slot
         slot_display = slot if slot else "Outside lecture hours"
@@ -118,15 +150,25 @@ while True:
 
     except Exception as e:
         print(f"Detection failed: {str(e)}")
-        cv2.putText(frame, "No face detected", (10, 30), 
+        frame_stats.record_error(e)
+        cv2.putText(frame, "Detection failed", (10, 30), 
                     cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
 
+    stage_start = time_module.perf_counter()
     cv2.imshow("Attendance System", frame)
-    if cv2.waitKey(1) & 0xFF == ord("q"):
+    key = cv2.waitKey(1) & 0xFF
+    display_stats.record(time_module.perf_counter() - stage_start)
+    frame_stats.record(time_module.perf_counter() - frame_start)
+    if key == ord("q"):
         break
 
 cap.release()
 cv2.destroyAllWindows()
+print(f"\nStage timings: {metrics.summary()}")
+if quality_gate is not None:
+    print(f"Quality gate: {quality_gate.snapshot()}")
+if USE_EMBEDDING_CACHE:
+    print(f"Embedding cache: {embed.snapshot()}")
 print("\nAttendance Summary:")
-with open(attendance_file, "r") as f:
-    print(f.read())
\ No newline at end of file
+for row in store.day():
+    print(f"{row['name']},{row['timestamp']},{row['status']},{row['slot']}")
\ No newline at end of file
@@ -0,0 +1,135 @@
+import argparse
+import csv
+import io
+import sys
+
+from attendance_store import CSV_HEADER, AttendanceStore
+
+PARQUET_FIELDS = ("name", "timestamp", "status", "slot")
+
+
+def csv_chunks(store, batch_size=1000, **filters):
+    """Yield the log as CSV text, one batch of rows per chunk."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    count = 0
+    for row in store.iter_rows(batch_size, **filters):
+        writer.writerow([row["name"], row["timestamp"], row["status"] or "", row["slot"] or ""])
+        count += 1
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+class _ChunkSink:
+    """Write-only file object that hands written bytes back to a generator."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def parquet_chunks(store, batch_size=10000, **filters):
+    """Yield the log as a Parquet file, one row group per batch.
+
+    Needs pyarrow (pip install pyarrow); raises ImportError without it.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(field, pa.string()) for field in PARQUET_FIELDS])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    batch = []
+
+    def flush():
+        columns = {field: [row[field] for row in batch] for field in PARQUET_FIELDS}
+        writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+        batch.clear()
+
+    for row in store.iter_rows(batch_size, **filters):
+        batch.append(row)
+        if len(batch) == batch_size:
+            flush()
+            yield sink.drain()
+    if batch:
+        flush()
+    writer.close()
+    yield sink.drain()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Attendance reports and exports from the attendance store.")
+    parser.add_argument("--db", default="../attendance.db")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    students = commands.add_parser("students", help="Attendance rate, lateness and streaks per student and slot")
+    students.add_argument("--slot")
+    students.add_argument("--name")
+
+    days = commands.add_parser("days", help="Attendance and lateness per day and slot")
+    days.add_argument("--start", help="First day, YYYY-MM-DD")
+    days.add_argument("--end", help="Last day, YYYY-MM-DD")
+
+    export = commands.add_parser("export", help="Stream the attendance log to CSV or Parquet")
+    export.add_argument("--format", default="csv", choices=["csv", "parquet"])
+    export.add_argument("--start", help="First day, YYYY-MM-DD")
+    export.add_argument("--end", help="Last day, YYYY-MM-DD")
+    export.add_argument("--name", nargs="+", dest="names", metavar="NAME")
+    export.add_argument("--output", help="Default: stdout (CSV only)")
+    args = parser.parse_args()
+
+    store = AttendanceStore(args.db)
+    if args.command == "students":
+        print(f"{'Name':<25} {'Slot':<22} {'Rate':>6} {'Late':>6} {'Avg min':>8} {'Streak':>7} {'Best':>5}")
+        for row in store.student_stats(args.slot, args.name):
+            print(f"{row['name']:<25} {row['slot']:<22} {row['rate']:>6.0%} {row['late_rate']:>6.0%} "
+                  f"{row['avg_minutes_late']:>8.1f} {row['current_streak']:>7} {row['best_streak']:>5}")
+    elif args.command == "days":
+        print(f"{'Day':<12} {'Slot':<22} {'Present':>8} {'Late':>6} {'Alerts':>7}")
+        for row in store.day_stats(args.start, args.end):
+            print(f"{row['day']:<12} {row['slot']:<22} {row['present']:>8} {row['late']:>6} {row['alerts']:>7}")
+    else:
+        filters = {"start": args.start, "end": args.end, "names": args.names}
+        if args.format == "parquet":
+            if not args.output:
+                parser.error("--output is required for Parquet")
+            with open(args.output, "wb") as f:
+                for chunk in parquet_chunks(store, **filters):
+                    f.write(chunk)
+        elif args.output:
+            with open(args.output, "w", newline="", encoding="utf-8") as f:
+                for chunk in csv_chunks(store, **filters):
+                    f.write(chunk)
+        else:
+            for chunk in csv_chunks(store, **filters):
+                sys.stdout.write(chunk)
+        if args.output:
+            print(f"🎉 Exported to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+from datetime import time
+
+# Lecture slots (in 24-hour format)
+SLOT_1 = "Slot 1 (8:00-11:00)"
+SLOT_2 = "Slot 2 (11:30-14:30)"
+SLOT_1_START = time(8, 0)    # 8:00 AM
+SLOT_1_END = time(11, 0)     # 11:00 AM
+SLOT_1_LATE = time(8, 5)     # 8:05 AM
+SLOT_2_START = time(11, 30)  # 11:30 AM
+SLOT_2_END = time(14, 30)    # 2:30 PM
+SLOT_2_LATE = time(11, 35)   # 11:35 AM
+LATE_SOUND_CUTOFF = time(9, 30)  # 9:30 AM for sound alert
+
+# (slot, late after "HH:MM", latecomer alert after "HH:MM" or None) for the attendance store's reports
+SLOT_RULES = [
+    (SLOT_1, SLOT_1_LATE.strftime("%H:%M"), LATE_SOUND_CUTOFF.strftime("%H:%M")),
+    (SLOT_2, SLOT_2_LATE.strftime("%H:%M"), None),
+]
+
+
+def get_lecture_slot(current_time):
+    """Determine the lecture slot of a datetime, or None outside lecture hours."""
+    current_t = current_time.time()
+    if SLOT_1_START <= current_t <= SLOT_1_END:
+        return SLOT_1
+    elif SLOT_2_START <= current_t <= SLOT_2_END:
+        return SLOT_2
+    return None
+
+
+def is_on_time(current_time, slot):
+    """Check if the student is on time for the slot."""
+    current_t = current_time.time()
+    if slot == SLOT_1:
+        return current_t <= SLOT_1_LATE
+    elif slot == SLOT_2:
+        return current_t <= SLOT_2_LATE
+    return False
+
+
+def is_late_alert(current_time, slot, status):
+    """Late marks in Slot 1 after LATE_SOUND_CUTOFF trigger the latecomer alert."""
+    return slot == SLOT_1 and status == "Late" and current_time.time() >= LATE_SOUND_CUTOFF
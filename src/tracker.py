@@ -0,0 +1,242 @@
+import itertools
+from collections import Counter, deque
+
+import cv2
+import numpy as np
+
+from recognition import DETECTOR_BACKEND, detect_faces, embed_faces
+
+
+def iou(a, b):
+    """Intersection-over-union of two (x, y, w, h) boxes."""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+
+def _clip_box(box, shape):
+    x, y, w, h = (int(v) for v in box)
+    x, y = max(0, x), max(0, y)
+    w, h = min(w, shape[1] - x), min(h, shape[0] - y)
+    return x, y, w, h
+
+
+class Track:
+    """One face followed across frames, with a voting history of identities."""
+
+    def __init__(self, track_id, box, history, min_votes=1):
+        self.id = track_id
+        self.box = box
+        self.template = None
+        self.votes = deque(maxlen=history)
+        self.min_votes = min_votes
+        # Consecutive detection passes that did not find this face, and whether this frame did
+        self.misses = 0
+        self.seen = True
+        self.last_embedded = None
+        # Best crop seen since the last embedding, when a quality gate is used
+        self.best_face = None
+        self.best_score = -1.0
+
+    def offer(self, face, score):
+        """Keep face if it is the best crop since the last embedding."""
+        if score > self.best_score:
+            self.best_face, self.best_score = face, score
+
+    def vote(self, name, distance):
+        self.votes.append((name, distance))
+
+    @property
+    def identity(self):
+        """Majority name over the history; ties go to the lower mean distance.
+
+        The name stays "Unknown" until it has at least min_votes votes, so
+        one lucky embedding of a new track does not mark attendance.
+        """
+        if not self.votes:
+            return "Unknown", float("inf")
+        counts = Counter(name for name, _ in self.votes)
+        mean_dist = {name: np.mean([d for n, d in self.votes if n == name]) for name in counts}
+        name = max(counts, key=lambda n: (counts[n], -mean_dist[n]))
+        if counts[name] < self.min_votes:
+            return "Unknown", float(mean_dist[name])
+        return name, float(mean_dist[name])
+
+
+class FaceTracker:
+    """Detect-once, track-in-between recognition.
+
+    Full detection runs every detect_every frames or as soon as a track is
+    lost; in between, faces are followed with template matching. A track is
+    only re-embedded when its last embedding is older than reembed_after
+    frames, and its name is voted over the last `history` embeddings; it is
+    reported as "Unknown" until the winning name has min_votes of them.
+    A track the detector or template match misses keeps its votes and is
+    only dropped after max_misses detection passes in a row without it, so
+    a blink or a turned head does not restart the vote.
+
+    With a quality gate, crops that fail it are never embedded; a stale
+    track is embedded with its best passing crop since its last embedding,
+    and waits (keeping its votes) until it has one.
+    """
+
+    def __init__(self, matcher, threshold, detect_every=10, reembed_after=15, history=15, min_votes=2,
+                 max_misses=3, min_score=0.5, detector_backend=DETECTOR_BACKEND, detector=None, quality=None):
+        self.matcher = matcher
+        self.threshold = threshold
+        self.detect_every = detect_every
+        self.reembed_after = reembed_after
+        self.history = history
+        self.min_votes = min_votes
+        self.max_misses = max_misses
+        self.min_score = min_score
+        self.detector_backend = detector_backend
+        self.detector = detector
+        self.quality = quality
+        self.tracks = []
+        self.frame_index = 0
+        self._lost = False
+        self._ids = itertools.count(1)
+        self.stats = {"frames": 0, "detections": 0, "embeddings": 0, "low_quality": 0}
+
+    def update(self, frame):
+        """Process one BGR frame and return the tracked faces."""
+        pending, faces = self.prepare(frame)
+        return self.finish(pending, embed_faces(faces) if faces else None)
+
+    def prepare(self, frame):
+        """Move/detect tracks for frame; returns (state, faces that need embedding).
+
+        Pass the embeddings of those faces to finish(); the split lets a
+        shared worker batch the embedding step across cameras.
+        """
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        self.stats["frames"] += 1
+
+        if self._lost or not self.tracks or self.frame_index % self.detect_every == 0:
+            pending = self._detect(frame)
+        else:
+            pending = self._follow(frame, gray)
+
+        for track in self.tracks:
+            if track.seen:
+                track.template = self._crop(gray, track.box)
+        return pending, [face for _, face in pending]
+
+    def finish(self, pending, embeddings):
+        """Vote the embedded faces into their tracks and return the tracked faces."""
+        self._vote(pending, embeddings)
+        self.frame_index += 1
+
+        results = []
+        for track in self.tracks:
+            if not track.seen:
+                continue
+            name, distance = track.identity
+            results.append({"box": track.box, "name": name, "distance": distance, "track_id": track.id})
+        return results
+
+    def _crop(self, img, box):
+        x, y, w, h = box
+        return img[y:y + h, x:x + w]
+
+    def _detect(self, frame):
+        """Run the detector and associate its faces with existing tracks by IoU."""
+        self.stats["detections"] += 1
+        self._lost = False
+        faces = self.detector(frame) if self.detector else detect_faces(frame, self.detector_backend)
+        boxes = [_clip_box((f["facial_area"]["x"], f["facial_area"]["y"],
+                            f["facial_area"]["w"], f["facial_area"]["h"]), frame.shape) for f in faces]
+
+        pairs = sorted(((iou(t.box, b), ti, bi) for ti, t in enumerate(self.tracks) for bi, b in enumerate(boxes)),
+                       reverse=True)
+        matched_tracks, matched_boxes, kept = set(), set(), []
+        pending = []
+        for overlap, ti, bi in pairs:
+            if overlap < 0.3 or ti in matched_tracks or bi in matched_boxes:
+                continue
+            matched_tracks.add(ti)
+            matched_boxes.add(bi)
+            track = self.tracks[ti]
+            track.box = boxes[bi]
+            track.misses, track.seen = 0, True
+            kept.append(track)
+            self._consider(track, faces[bi], pending)
+
+        for bi, box in enumerate(boxes):
+            if bi not in matched_boxes and box[2] > 0 and box[3] > 0:
+                track = Track(next(self._ids), box, self.history, self.min_votes)
+                kept.append(track)
+                self._consider(track, faces[bi], pending, new=True)
+
+        for ti, track in enumerate(self.tracks):
+            if ti not in matched_tracks:
+                track.misses += 1
+                track.seen = False
+                if track.misses < self.max_misses:
+                    kept.append(track)
+
+        self.tracks = kept
+        return pending
+
+    def _follow(self, frame, gray):
+        """Move every track to its best template match near the previous box.
+
+        A track that cannot be matched stays where it was, unseen, and the
+        next frame runs detection to find it again or count it as missed.
+        """
+        pending = []
+        for track in self.tracks:
+            x, y, w, h = track.box
+            pad = max(w, h) // 2
+            x0, y0 = max(0, x - pad), max(0, y - pad)
+            window = gray[y0:y + h + pad, x0:x + w + pad]
+            track.seen = False
+            if track.template is None or window.shape[0] < h or window.shape[1] < w or w == 0 or h == 0:
+                self._lost = True
+                continue
+            scores = cv2.matchTemplate(window, track.template, cv2.TM_CCOEFF_NORMED)
+            _, score, _, loc = cv2.minMaxLoc(scores)
+            if score < self.min_score:
+                self._lost = True
+                continue
+            track.box = (x0 + loc[0], y0 + loc[1], w, h)
+            track.seen = True
+            if self._is_stale(track) or self.quality is not None:
+                # No aligned crop between detections, so embed the tracked box directly
+                crop = self._crop(frame, track.box)[:, :, ::-1] / 255.0
+                area = {"x": track.box[0], "y": track.box[1], "w": w, "h": h}
+                self._consider(track, {"face": crop, "facial_area": area}, pending)
+        return pending
+
+    def _consider(self, track, face, pending, new=False):
+        """Queue track for embedding if it is stale, using its best crop under a quality gate."""
+        if self.quality is None:
+            if new or self._is_stale(track):
+                pending.append((track, face))
+            return
+        passed, score, _ = self.quality.check(face)
+        if passed:
+            track.offer(face, score)
+        else:
+            self.stats["low_quality"] += 1
+        if (new or self._is_stale(track)) and track.best_face is not None:
+            pending.append((track, track.best_face))
+
+    def _is_stale(self, track):
+        return track.last_embedded is None or self.frame_index - track.last_embedded >= self.reembed_after
+
+    def _vote(self, pending, embeddings):
+        """Add the matches of the stale tracks' embeddings to their votes."""
+        if not pending:
+            return
+        names, distances = self.matcher.identify(embeddings, self.threshold)
+        for (track, _), name, distance in zip(pending, names, distances):
+            track.vote(name, float(distance))
+            track.last_embedded = self.frame_index
+            track.best_face, track.best_score = None, -1.0
+        self.stats["embeddings"] += len(pending)
@@ -0,0 +1,49 @@
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from attendance_store import AttendanceStore  # noqa: E402
+from slots import SLOT_1  # noqa: E402
+
+
+def mark(store, name, day, time="08:00:00"):
+    status = "Late" if time > "08:05:00" else "On Time"
+    return store.mark_once(name, datetime.strptime(f"{day} {time}", "%Y-%m-%d %H:%M:%S"), status, SLOT_1)
+
+
+def stats(store, name):
+    return store.student_stats(slot=SLOT_1, name=name)[0]
+
+
+def test_out_of_order_marks_keep_streaks(tmp_path):
+    store = AttendanceStore(str(tmp_path / "attendance.db"))
+    for day in ("2026-10-18", "2026-10-17", "2026-10-19"):
+        mark(store, "Alice", day)
+    s = stats(store, "Alice")
+    assert (s["present"], s["current_streak"], s["best_streak"]) == (3, 3, 3)
+
+
+def test_backfilled_lecture_day_breaks_other_streaks(tmp_path):
+    store = AttendanceStore(str(tmp_path / "attendance.db"))
+    for day in ("2026-10-17", "2026-10-19"):
+        mark(store, "Alice", day)
+    assert stats(store, "Alice")["current_streak"] == 2
+    # Bob's mark makes the 18th a lecture day that Alice missed
+    mark(store, "Bob", "2026-10-18")
+    s = stats(store, "Alice")
+    assert (s["current_streak"], s["best_streak"], s["lecture_days"]) == (1, 1, 3)
+
+
+def test_rebuild_matches_trigger_and_keeps_log(tmp_path):
+    store = AttendanceStore(str(tmp_path / "attendance.db"))
+    for name, day, time in [("Alice", "2026-10-16", "08:10:00"), ("Bob", "2026-10-18", "08:00:00"),
+                            ("Alice", "2026-10-18", "09:45:00"), ("Alice", "2026-10-17", "08:01:00"),
+                            ("Bob", "2026-10-16", "08:00:00")]:
+        mark(store, name, day, time)
+    log = store.page(per_page=100)
+    before = store.student_stats(), store.day_stats()
+    store.rebuild_reports()
+    assert (store.student_stats(), store.day_stats()) == before
+    assert store.page(per_page=100) == log